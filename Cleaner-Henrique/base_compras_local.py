@@ -0,0 +1,277 @@
+"""
+Snapshot local (Parquet + manifesto) da base de compras do Firestore.
+
+O upload (`carregar_base_firebase`) grava o snapshot junto com a versão e a
+contagem publicadas no documento de metadados. Na conciliação:
+  - versão e contagem iguais: usa o snapshot (1 leitura no Firestore);
+  - mesma versão, contagem diferente (houve append): busca só os documentos
+    com `_atualizado_em` >= marca d'água do snapshot e junta ao snapshot;
+  - versão diferente (houve replace): baixa a coleção inteira de novo.
+
+Se a conciliação informar os fornecedores do XML, `obter_base_compras` pode
+em vez disso buscar só as linhas deles no servidor (ver MODO_BASE_PADRAO).
+"""
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+from firebase_utils import (
+    COLECAO_FIRESTORE, CAMPO_ATUALIZADO_EM, CAMPO_DOC_ID, CAMPOS_CONTROLE,
+    FORMATO_BLOCOS, ler_metadados_base, contar_documentos, colecao_ativa,
+    formato_base, documento_bloco_para_df, consulta_por_fornecedor_disponivel,
+    buscar_base_por_fornecedores
+)
+
+# --- Configurações ---
+CACHE_DIR = os.environ.get(
+    'CONCILIADOR_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'conciliador_cache')
+)
+ARQUIVO_SNAPSHOT = os.path.join(CACHE_DIR, f'{COLECAO_FIRESTORE}.parquet')
+ARQUIVO_MANIFESTO = os.path.join(CACHE_DIR, f'{COLECAO_FIRESTORE}.manifest.json')
+
+# Como a conciliação obtém a base quando sabe os fornecedores do XML:
+#   'completa'     - sempre o snapshot local (sincronizado);
+#   'fornecedores' - sempre só as linhas dos fornecedores do XML;
+#   'auto'         - snapshot se ele for da versão atual da base (fica em dia
+#                    com poucas leituras), senão só os fornecedores do XML.
+MODO_BASE_PADRAO = os.environ.get('CONCILIADOR_MODO_BASE', 'auto')
+
+
+def _normalizar_para_parquet(df):
+    """
+    Colunas com tipos misturados (ex.: '' em coluna numérica, herdado do
+    fillna('') do upload) viram texto, que é como o Parquet aceita gravá-las.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            tipos = df[col].dropna().map(type).unique()
+            if len(tipos) > 1:
+                df[col] = df[col].astype(str)
+    return df
+
+
+def _marca_dagua_para_texto(marca):
+    return marca.isoformat() if marca is not None else None
+
+
+def _marca_dagua_do_manifesto(manifesto):
+    texto = manifesto.get('marca_dagua')
+    return datetime.fromisoformat(texto) if texto else None
+
+
+def ler_manifesto():
+    try:
+        with open(ARQUIVO_MANIFESTO, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ler_snapshot():
+    """
+    Devolve o DataFrame do snapshot local, ou None se não houver.
+    """
+    if ler_manifesto() is None or not os.path.exists(ARQUIVO_SNAPSHOT):
+        return None
+    try:
+        return pd.read_parquet(ARQUIVO_SNAPSHOT)
+    except Exception as e:
+        print(f"Aviso: snapshot local ilegível, será descartado. Erro: {e}")
+        invalidar_snapshot()
+        return None
+
+
+def gravar_snapshot(df, versao, n_documentos, marca_dagua=None):
+    """
+    Grava o snapshot e o manifesto. O manifesto é escrito por último (e de
+    forma atômica), então um snapshot pela metade nunca é considerado válido.
+
+    `marca_dagua` é o maior `_atualizado_em` já incorporado ao snapshot; sem
+    ela, a próxima atualização precisa baixar a coleção inteira.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        invalidar_snapshot()
+        df = df.drop(columns=[CAMPO_ATUALIZADO_EM], errors='ignore')
+        _normalizar_para_parquet(df).to_parquet(ARQUIVO_SNAPSHOT, index=False)
+
+        manifesto = {
+            'colecao': COLECAO_FIRESTORE,
+            'versao': versao,
+            'n_documentos': int(n_documentos),
+            'marca_dagua': _marca_dagua_para_texto(marca_dagua),
+            'colunas': [str(c) for c in df.columns],
+        }
+        tmp = ARQUIVO_MANIFESTO + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False)
+        os.replace(tmp, ARQUIVO_MANIFESTO)
+        print(f"Snapshot local da base salvo ({len(df)} linhas, versão {versao}).")
+        return True
+    except Exception as e:
+        print(f"Aviso: não foi possível salvar o snapshot local. Erro: {e}")
+        invalidar_snapshot()
+        return False
+
+
+def anexar_ao_snapshot(df_novo, meta_anterior, meta_nova):
+    """
+    Após um upload em modo append: se o snapshot estava em dia com a base
+    anterior, acrescenta as linhas novas; senão, descarta o snapshot.
+    """
+    if meta_anterior is None or not snapshot_atual(meta_anterior):
+        invalidar_snapshot()
+        return False
+    df_atual = ler_snapshot()
+    if df_atual is None:
+        return False
+    df = pd.concat([df_atual, df_novo], ignore_index=True)
+    return gravar_snapshot(df, meta_nova['versao'], meta_nova['n_documentos'],
+                           meta_nova.get('atualizado_em'))
+
+
+def invalidar_snapshot():
+    for caminho in (ARQUIVO_MANIFESTO, ARQUIVO_SNAPSHOT):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def snapshot_atual(meta):
+    """
+    Diz se o snapshot local corresponde aos metadados publicados no Firestore.
+    """
+    manifesto = ler_manifesto()
+    if manifesto is None:
+        return False
+    return (manifesto.get('versao') == meta.get('versao')
+            and manifesto.get('n_documentos') == meta.get('n_documentos'))
+
+
+def _documentos_para_df(docs, formato):
+    """
+    Converte documentos do Firestore em DataFrame (com o id em `_doc_id`) e
+    devolve também o maior `_atualizado_em` encontrado. No formato 'blocos'
+    cada documento traz várias linhas.
+    """
+    dados = []
+    marca = None
+    for doc in docs:
+        registro = doc.to_dict()
+        carimbo = registro.get(CAMPO_ATUALIZADO_EM)
+        if isinstance(carimbo, datetime) and (marca is None or carimbo > marca):
+            marca = carimbo
+        if formato == FORMATO_BLOCOS:
+            dados.append(documento_bloco_para_df(doc))
+        else:
+            registro[CAMPO_DOC_ID] = doc.id
+            dados.append(registro)
+
+    if formato == FORMATO_BLOCOS:
+        return (pd.concat(dados, ignore_index=True) if dados else pd.DataFrame()), marca
+    return pd.DataFrame(dados), marca
+
+
+def baixar_colecao_completa(db, meta):
+    """
+    Baixa todos os documentos da base de compras (leitura completa).
+    Devolve (df, marca_dagua).
+    """
+    return _documentos_para_df(db.collection(colecao_ativa(meta)).stream(), formato_base(meta))
+
+
+def sincronizar_delta(db, meta, manifesto):
+    """
+    Atualiza o snapshot local buscando só os documentos gravados a partir da
+    marca d'água do manifesto. Devolve o DataFrame atualizado, ou None se o
+    delta não bastar (sem marca d'água, snapshot ilegível, ou a contagem não
+    fechar com a do Firestore, ex.: documentos apagados).
+    """
+    marca = _marca_dagua_do_manifesto(manifesto)
+    if marca is None:
+        return None
+    df_atual = ler_snapshot()
+    if df_atual is None or CAMPO_DOC_ID not in df_atual.columns:
+        return None
+
+    # '>=' (e não '>'): documentos do mesmo commit têm o mesmo carimbo; as
+    # repetições são descartadas pelo id logo abaixo
+    query = db.collection(colecao_ativa(meta)).where(CAMPO_ATUALIZADO_EM, '>=', marca)
+    df_delta, marca_delta = _documentos_para_df(query.stream(), formato_base(meta))
+    print(f"Delta da base de compras: {len(df_delta)} linha(s) desde {marca.isoformat()}.")
+
+    if not df_delta.empty:
+        df_atual = pd.concat([df_atual, df_delta], ignore_index=True)
+        df_atual = df_atual.drop_duplicates(subset=[CAMPO_DOC_ID], keep='last', ignore_index=True)
+    if len(df_atual) != meta.get('n_documentos'):
+        print(f"Aviso: snapshot + delta somam {len(df_atual)} linhas, o Firestore tem {meta.get('n_documentos')}.")
+        return None
+
+    gravar_snapshot(df_atual, meta['versao'], len(df_atual), max(marca, marca_delta or marca))
+    return df_atual
+
+
+def sincronizar_base_compras(db, meta=None):
+    """
+    Deixa o snapshot local em dia com o Firestore, lendo o mínimo possível
+    (ver docstring do módulo), e devolve a base de compras completa.
+
+    Sem documento de metadados (base carregada antes desta versão), a
+    contagem de documentos feita no servidor decide se o snapshot serve.
+    """
+    meta = meta or ler_metadados_base(db)
+    if meta is None:
+        meta = {'versao': None, 'n_documentos': contar_documentos(db)}
+
+    manifesto = ler_manifesto()
+    if manifesto is not None and manifesto.get('versao') == meta.get('versao'):
+        if manifesto.get('n_documentos') == meta.get('n_documentos'):
+            df = ler_snapshot()
+            if df is not None:
+                print(f"Base de compras lida do snapshot local ({len(df)} linhas, versão {meta['versao']}).")
+                return df
+        else:
+            df = sincronizar_delta(db, meta, manifesto)
+            if df is not None:
+                return df
+
+    colecao = colecao_ativa(meta)
+    print(f"Snapshot local ausente ou desatualizado. Baixando a coleção '{colecao}'...")
+    df, marca = baixar_colecao_completa(db, meta)
+    if not df.empty:
+        gravar_snapshot(df, meta['versao'], len(df), marca)
+    return df
+
+
+def _snapshot_da_versao(meta):
+    manifesto = ler_manifesto()
+    return manifesto is not None and manifesto.get('versao') == meta.get('versao')
+
+
+def obter_base_compras(db, fornecedores=None, modo=MODO_BASE_PADRAO):
+    """
+    Devolve a base de compras para a conciliação (sem os campos de controle).
+
+    Com `fornecedores` (códigos normalizados do XML), conforme o `modo`,
+    busca no servidor só as linhas desses fornecedores em vez da base toda.
+    """
+    meta = ler_metadados_base(db)
+    if fornecedores is not None and modo != 'completa':
+        if not consulta_por_fornecedor_disponivel(meta):
+            print("Aviso: a base atual não permite busca por fornecedor (carregada antes do "
+                  "campo '_forn_norm'); usando a base completa.")
+        elif modo == 'fornecedores' or not _snapshot_da_versao(meta):
+            fornecedores = sorted(set(fornecedores))
+            print(f"Buscando na base só os {len(fornecedores)} fornecedor(es) presentes no XML...")
+            df = buscar_base_por_fornecedores(db, meta, fornecedores)
+            print(f"{len(df)} linha(s) da base de compras recebidas.")
+            return df
+
+    df = sincronizar_base_compras(db, meta)
+    return df.drop(columns=CAMPOS_CONTROLE, errors='ignore')
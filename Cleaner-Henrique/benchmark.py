@@ -0,0 +1,739 @@
+"""
+Benchmarks do Conciliador.
+
+Usa um cliente Firestore falso em memória (FirestoreFalso), em que cada
+commit de lote "custa" uma latência fixa de rede, para medir o envio da
+base de compras sem depender do Firebase nem do emulador. Os demais casos
+comparam as implementações antigas (linha a linha) com as atuais.
+
+Uso:
+    python benchmark.py upload --linhas 10000 100000 500000
+    python benchmark.py upload --linhas 100000 --latencia-ms 80 --taxa-falhas 0.02
+    python benchmark.py brl --linhas 100000 1000000
+    python benchmark.py titulos --linhas 100000 500000
+    python benchmark.py rateio --linhas 500000 --linhas-base 1000000
+    python benchmark.py xml --linhas 20000 100000
+    python benchmark.py relatorio --linhas 50000 320000
+    python benchmark.py datas --linhas 100000 500000
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import re
+import sys
+import threading
+import tempfile
+import time
+import uuid
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from google.api_core.exceptions import Aborted
+
+# --- FIX: Adiciona o diretório do script ao path ---
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    SCRIPT_DIR = os.getcwd()
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+# --- FIM DO FIX ---
+
+import conversoes
+import escrita_em_lote
+import rodar_conciliacao
+from openpyxl import load_workbook
+
+COLUNAS_DATA = ['Data de Emissao', 'Data de Vencto', 'Vencto Real']
+FORMATOS_RELATORIO = {
+    'Valor Original': rodar_conciliacao.ACCOUNTING_FORMAT,
+    'Tit Vencidos Valor nominal': rodar_conciliacao.ACCOUNTING_FORMAT,
+    'Titulos a vencer Valor nominal': rodar_conciliacao.ACCOUNTING_FORMAT,
+    'Vlr Rateado': rodar_conciliacao.ACCOUNTING_FORMAT,
+}
+
+
+# --- FIRESTORE FALSO (EM MEMÓRIA) ---
+
+class _RefFalsa:
+    def __init__(self, colecao, doc_id):
+        self.colecao = colecao
+        self.id = doc_id
+
+
+class _ColecaoFalsa:
+    def __init__(self, db, nome):
+        self.db = db
+        self.nome = nome
+
+    def document(self, doc_id=None):
+        return _RefFalsa(self.nome, doc_id or uuid.uuid4().hex[:20])
+
+
+class _BatchFalso:
+    def __init__(self, db):
+        self.db = db
+        self.operacoes = []
+
+    def set(self, ref, dados):
+        self.operacoes.append((ref, dados))
+
+    def delete(self, ref):
+        self.operacoes.append((ref, None))
+
+    def commit(self):
+        if len(self.operacoes) > 500:
+            raise ValueError("Lote com mais de 500 operações.")
+        time.sleep(self.db.latencia_s)  # Ida e volta até o servidor
+        if self.db.taxa_falhas and random.random() < self.db.taxa_falhas:
+            raise Aborted("Contenção simulada.")
+        with self.db.trava:
+            for ref, dados in self.operacoes:
+                docs = self.db.dados.setdefault(ref.colecao, {})
+                if dados is None:
+                    docs.pop(ref.id, None)
+                else:
+                    docs[ref.id] = dados
+            self.db.commits += 1
+
+
+class FirestoreFalso:
+    """
+    Imita o suficiente de `firestore.Client` para escrita em lote:
+    collection().document(), batch(), set/delete e commit.
+    """
+    def __init__(self, latencia_ms=50, taxa_falhas=0.0):
+        self.latencia_s = latencia_ms / 1000
+        self.taxa_falhas = taxa_falhas
+        self.dados = {}
+        self.commits = 0
+        self.trava = threading.Lock()
+
+    def collection(self, nome):
+        return _ColecaoFalsa(self, nome)
+
+    def batch(self):
+        return _BatchFalso(self)
+
+
+# --- GERADOR DE DADOS SINTÉTICOS ---
+
+def gerar_registros(n_linhas, seed=42):
+    """
+    Registros no formato que `carregar_base_firebase` envia (após fillna('')).
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Filial': rng.choice(['0101', '0102', '0201'], n_linhas),
+        'Forn_Cliente': pd.Series(rng.integers(1, 5_000, n_linhas)).astype(str).str.zfill(6),
+        'Loja': '01',
+        'Documento': pd.Series(rng.integers(1, 999_999, n_linhas)).astype(str).str.zfill(9),
+        'Item Conta': rng.choice(['NEG01', 'NEG02', 'NEG03'], n_linhas),
+        'Centro Custo': rng.choice(['1001', '1002', '2001', '3001'], n_linhas),
+        'C Contabil': rng.choice(['41101001', '41101002', '21101001'], n_linhas),
+        'Vlr.Total': np.round(rng.uniform(1, 50_000, n_linhas), 2),
+        'Data Emissao': '2024-05-10',
+    })
+    return df.fillna('').to_dict('records')
+
+
+def gerar_valores_brl(n_linhas, seed=42):
+    """
+    Valores como vêm do Excel/XML lidos como texto: '1.234,56', '1234,56',
+    '1234.56', inteiros, vazios e alguns nulos (None e NaN).
+    """
+    rng = np.random.default_rng(seed)
+    valores = np.round(rng.uniform(0, 100_000, n_linhas), 2)
+    estilo = rng.integers(0, 5, n_linhas)
+    brl = pd.Series([f"{v:,.2f}" for v in valores]).str.translate(str.maketrans(',.', '.,'))
+    textos = np.select(
+        [estilo == 0, estilo == 1, estilo == 2, estilo == 3],
+        [brl, brl.str.replace('.', '', regex=False), pd.Series(valores).astype(str),
+         pd.Series(valores.astype(np.int64)).astype(str)],
+        default='',
+    ).astype(object)
+    textos[rng.random(n_linhas) < 0.01] = None
+    textos[rng.random(n_linhas) < 0.01] = np.nan
+    return pd.Series(textos)
+
+
+def gerar_datas_xml(n_linhas, seed=42):
+    """
+    Datas como vêm do XML ('2024-05-10T00:00:00.000'), espalhadas por
+    dois anos, com alguns vazios e nulos (None e NaN). Uma parte vem nas
+    variantes ISO de outros exportadores: sem milissegundos, com espaço no
+    lugar do 'T' e só a data.
+    """
+    rng = np.random.default_rng(seed)
+    datas = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 730, n_linhas), unit='D')
+    textos = pd.Series(datas.strftime('%Y-%m-%dT%H:%M:%S.000'), dtype=object)
+    for formato in ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']:
+        variante = rng.random(n_linhas) < 0.05
+        textos[variante] = datas[variante].strftime(formato)
+    textos[rng.random(n_linhas) < 0.02] = ''
+    textos[rng.random(n_linhas) < 0.01] = None
+    textos[rng.random(n_linhas) < 0.01] = np.nan
+    return textos
+
+
+def gerar_conciliacao(n_titulos, n_compras, seed=42):
+    """
+    df_xml e df_compras já preparados (chaves sem zeros à esquerda), como
+    chegam ao rateio. ~80% dos títulos acham o documento na base; ~20% dos
+    documentos da base têm várias linhas (rateio).
+    """
+    rng = np.random.default_rng(seed)
+    n_docs = max(n_compras * 2 // 3, 1)
+    doc_da_linha = np.sort(rng.integers(0, n_docs, n_compras))
+    forn_do_doc = rng.integers(1, 20_000, n_docs)
+    df_compras = pd.DataFrame({
+        'Filial': rng.choice(['0101', '0102', '0201'], n_compras),
+        'Forn_Cliente': pd.Series(forn_do_doc[doc_da_linha]).astype(str),
+        'Loja': '01',
+        'Documento': pd.Series(doc_da_linha + 1).astype(str),
+        'Item Conta': rng.choice(['NEG01', 'NEG02', 'NEG03'], n_compras),
+        'Centro Custo': rng.choice(['1001', '1002', '2001', '3001'], n_compras),
+        'C Contabil': rng.choice(['41101001', '41101002', '21101001'], n_compras),
+        'Vlr.Total': np.round(rng.uniform(1, 50_000, n_compras), 2),
+        'Data Emissao': '2024-05-10',
+        'Historico': 'COMPRA DE MERCADORIAS PARA REVENDA',
+    })
+
+    docs = rng.integers(0, n_docs, n_titulos)
+    sem_documento = rng.random(n_titulos) < 0.2
+    forn = forn_do_doc[docs].astype(str)
+    documento = (docs + 1).astype(str).astype(object)
+    documento[sem_documento] = (n_docs + 1 + np.arange(sem_documento.sum())).astype(str)
+    valores = np.round(rng.uniform(10, 90_000, n_titulos), 2)
+    brl = pd.Series([f"{v:,.2f}" for v in valores]).str.translate(str.maketrans(',.', '.,'))
+    df_xml = pd.DataFrame({
+        'Codigo-Nome do Fornecedor': [f"{f:0>6}-01-FORNECEDOR {f} LTDA" for f in forn],
+        'Prf-Numero Parcela': [f"1-{d:0>9}-NF" for d in documento],
+        'Data de Emissao': '2024-05-10T00:00:00.000',
+        'Data de Vencto': '2024-06-10T00:00:00.000',
+        'Vencto Real': '2024-06-12T00:00:00.000',
+        'Valor Original': brl,
+        'Tit Vencidos Valor nominal': '0,00',
+        'Titulos a vencer Valor nominal': brl,
+        'Centro Custo': '1001',
+        'Cta.Contabil': '41101001',
+        'Negocio?': 'NEG01',
+    })
+    df_xml['_xml_row_id'] = range(n_titulos)
+    df_xml['Código'] = forn
+    df_xml['Loja'] = '01'
+    df_xml['Nome do Fornecedor'] = [f"FORNECEDOR {f} LTDA" for f in forn]
+    df_xml['Parcela'] = '1'
+    df_xml['Documento'] = documento
+    return df_xml, df_compras
+
+
+def gerar_relatorio(n_titulos, seed=42):
+    """
+    Relatório final como chega à escrita do Excel: rateio de
+    `gerar_conciliacao` (base com o dobro de linhas), datas já em
+    datetime e colunas na ordem do relatório.
+    """
+    df_xml, df_compras = gerar_conciliacao(n_titulos, n_titulos * 2, seed)
+    df = rodar_conciliacao.calcular_rateio(df_xml, df_compras, 'Forn_Cliente', 'Documento')
+    for col in COLUNAS_DATA:
+        df[col] = conversoes.converter_datas(df[col], rodar_conciliacao.FORMATOS_DATA_XML[col])
+    colunas_novas = ['Código', 'Loja', 'Nome do Fornecedor', 'Documento', 'Parcela']
+    colunas_xml = [c for c in df_xml.columns if c not in colunas_novas + ['_xml_row_id']]
+    return df[colunas_novas + colunas_xml + ['Vlr Rateado', 'Filial']]
+
+
+def gerar_xml_titulos(n_linhas, seed=42):
+    """
+    XML SpreadsheetML como o exportado pelo Protheus: uma planilha de resumo,
+    '2-Titulos a pagar' (título na 1ª linha, cabeçalho na 2ª) e, depois
+    dela, outra planilha do mesmo tamanho (que o leitor novo nem percorre).
+    """
+    df_xml, _ = gerar_conciliacao(n_linhas, 1, seed=seed)
+    colunas = list(df_xml.columns[:11])
+    linhas = df_xml[colunas].to_numpy()
+
+    def planilha(nome):
+        partes = [f'<Worksheet ss:Name="{nome}"><Table>',
+                  '<Row><Cell><Data ss:Type="String">Relatorio de titulos</Data></Cell></Row>',
+                  '<Row>' + ''.join(f'<Cell><Data ss:Type="String">{escape(c)}</Data></Cell>' for c in colunas) + '</Row>']
+        for k, linha in enumerate(linhas):
+            celulas = [f'<Cell><Data ss:Type="String">{escape(v)}</Data></Cell>' for v in linha]
+            if k % 10 == 0:
+                # Célula vazia omitida, com ss:Index na seguinte
+                celulas[9] = '<Cell ss:Index="11"><Data ss:Type="String">NEG01</Data></Cell>'
+                celulas[8] = ''
+            partes.append('<Row>' + ''.join(celulas) + '</Row>')
+        partes.append('</Table></Worksheet>')
+        return '\n'.join(partes)
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+            'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n'
+            '<Worksheet ss:Name="1-Resumo"><Table><Row><Cell><Data ss:Type="String">x</Data></Cell></Row></Table></Worksheet>\n'
+            + planilha('2-Titulos a pagar') + planilha('3-Titulos pagos') + '</Workbook>').encode('utf-8')
+
+
+def gerar_titulos(n_linhas, seed=42):
+    """
+    Colunas-chave da planilha '2-Titulos a pagar', como texto:
+    'Codigo-Nome do Fornecedor' ('000123-01-NOME') e 'Prf-Numero Parcela'
+    ('NF -123456-001'), com alguns valores fora do padrão e nulos.
+    """
+    rng = np.random.default_rng(seed)
+    codigos = rng.integers(1, 5_000, n_linhas)
+    documentos = rng.integers(1, 999_999, n_linhas)
+    fornecedor = pd.Series([f"{c:06d}-{c % 3 + 1:02d}-FORNECEDOR {c} LTDA - ME" for c in codigos], dtype=object)
+    prf = pd.Series([f"NF -{d:09d}-{d % 12 + 1:03d}" for d in documentos], dtype=object)
+    fora_do_padrao = rng.random(n_linhas) < 0.02
+    fornecedor[fora_do_padrao] = 'TOTAL FORNECEDOR'
+    prf[fora_do_padrao] = ' '
+    nulos = rng.random(n_linhas) < 0.01
+    fornecedor[nulos] = None
+    prf[nulos] = None
+    return pd.DataFrame({'Codigo-Nome do Fornecedor': fornecedor, 'Prf-Numero Parcela': prf})
+
+
+# --- IMPLEMENTAÇÃO ANTIGA (referência) ---
+
+def _legado_upload(db, registros, colecao='base_compras'):
+    """
+    Laço antigo de `carregar_base_firebase`: um lote de 499 por vez.
+    """
+    batch = db.batch()
+    for i, record in enumerate(registros):
+        doc_ref = db.collection(colecao).document()
+        batch.set(doc_ref, record)
+        if (i + 1) % 499 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def _legado_to_number_brl(x):
+    """
+    `to_number_brl` antigo, aplicado linha a linha com .apply.
+    """
+    try:
+        if pd.isna(x): return 0.0
+        s = str(x).strip().replace(' ', '')
+        if s == "": return 0.0
+        if s.count(',') == 1 and s.count('.') > 0:
+            s = s.replace('.', '').replace(',', '.')
+        elif s.count(',') == 1:
+            s = s.replace(',', '.')
+        elif s.count('.') == 1 and s.count(',') == 0:
+            pass
+        elif s.count('.') > 0 and s.count(',') == 0:
+            s = s.replace('.', '')
+        return float(s)
+    except Exception:
+        return 0.0
+
+
+def _legado_formatar_data_br(data_str):
+    """
+    `formatar_data_br` antigo, aplicado linha a linha com .apply.
+    """
+    if pd.isna(data_str) or data_str == '': return None
+    try:
+        dt = pd.to_datetime(data_str)
+        return dt.strftime('%d/%m/%Y')
+    except Exception:
+        return data_str
+
+
+def _legado_tratar_fornecedor(valor_coluna):
+    """
+    `tratar_fornecedor` antigo, aplicado linha a linha com .apply.
+    """
+    try:
+        partes = str(valor_coluna).split('-', 2)
+        if len(partes) == 3:
+            codigo = partes[0].strip()
+            loja = partes[1].strip()
+            nome = partes[2].strip()
+            if codigo == "": return pd.Series([None, loja, nome])
+            return pd.Series([codigo, loja, nome])
+        else:
+            return pd.Series([None, None, str(valor_coluna).strip()])
+    except Exception:
+        return pd.Series([None, None, str(valor_coluna).strip()])
+
+
+def _legado_tratar_prf_parcela(valor_coluna):
+    """
+    `tratar_prf_parcela` antigo, aplicado linha a linha com .apply.
+    """
+    try:
+        s = str(valor_coluna).strip()
+        match = re.search(r'([\w\d]+)\s*-\s*([\d]+)\s*-', s)
+        if match:
+            return pd.Series([match.group(1).strip(), match.group(2).strip()])
+        else:
+            return pd.Series([None, None])
+    except Exception:
+        return pd.Series([None, None])
+
+
+def _legado_rateio(df_xml, df_compras, col_forn_db='Forn_Cliente', col_doc_db='Documento'):
+    """
+    Conciliação antiga: contagem e soma em dois groupby + dois merges, merge
+    largo com o XML, groupby.agg com 'first' em todas as colunas e concat.
+    """
+    colunas_finais_xml = list(df_xml.columns) + ['Vlr Rateado', 'Filial']
+    xml_keys = ['Código', 'Documento']
+    db_counts = df_compras.groupby([col_forn_db, col_doc_db]).size().to_frame('db_match_count')
+    db_soma_doc = df_compras.groupby([col_forn_db, col_doc_db])['Vlr.Total'].sum().to_frame('Soma_Doc')
+    df_compras = df_compras.merge(db_counts, left_on=[col_forn_db, col_doc_db], right_index=True, how='left')
+    df_compras = df_compras.merge(db_soma_doc, left_on=[col_forn_db, col_doc_db], right_index=True, how='left')
+    df_merged = pd.merge(df_xml, df_compras, left_on=xml_keys, right_on=[col_forn_db, col_doc_db],
+                         how='left', indicator=True, suffixes=('_xml', '_db'))
+    df_merged['db_match_count'] = df_merged['db_match_count'].fillna(0)
+    df_merged['Soma_Doc'] = df_merged['Soma_Doc'].fillna(0)
+
+    def renomear_colunas(df):
+        cols_para_renomear = {col: col.replace('_xml', '') for col in df.columns if col.endswith('_xml')}
+        df.rename(columns=cols_para_renomear, inplace=True)
+        return df
+
+    df_final_sem_rateio = df_merged[df_merged['db_match_count'] <= 1].copy()
+    df_final_sem_rateio.drop_duplicates(subset=['_xml_row_id'], keep='first', inplace=True)
+    df_final_sem_rateio = renomear_colunas(df_final_sem_rateio)
+    df_final_sem_rateio['Vlr Rateado'] = conversoes.converter_valores_brl(df_final_sem_rateio['Titulos a vencer Valor nominal'])
+    df_final_sem_rateio = df_final_sem_rateio[colunas_finais_xml]
+
+    df_final_com_rateio = df_merged[df_merged['db_match_count'] > 1].copy()
+    if not df_final_com_rateio.empty:
+        df_final_com_rateio['Valor_Pago_Num'] = conversoes.converter_valores_brl(df_final_com_rateio['Titulos a vencer Valor nominal'])
+        grouping_keys = ['_xml_row_id', 'Item Conta', 'Centro Custo_db', 'C Contabil', 'Loja_db', 'Filial']
+        agg_funcs = {'Vlr.Total': 'sum', 'Soma_Doc': 'first', 'Valor_Pago_Num': 'first', 'Código': 'first',
+                     'Documento': 'first', 'Parcela': 'first', 'Filial': 'first'}
+        xml_cols_to_keep = [col for col in colunas_finais_xml
+                            if col not in ['Código', 'Documento', 'Parcela', 'Vlr Rateado', '_xml_row_id', 'Filial']]
+        for col in df_final_com_rateio.columns:
+            if col.endswith('_xml') and col not in agg_funcs: agg_funcs[col] = 'first'
+            elif col in xml_cols_to_keep and col not in agg_funcs: agg_funcs[col] = 'first'
+        df_agrupado = df_final_com_rateio.groupby(grouping_keys, as_index=False).agg(agg_funcs)
+        df_agrupado['Proporcao'] = 0.0
+        mask_soma_valida = df_agrupado['Soma_Doc'] != 0
+        df_agrupado.loc[mask_soma_valida, 'Proporcao'] = df_agrupado['Vlr.Total'] / df_agrupado['Soma_Doc']
+        df_agrupado['Vlr Rateado'] = df_agrupado['Proporcao'] * df_agrupado['Valor_Pago_Num']
+        df_agrupado['Valor Original'] = df_agrupado['Vlr.Total']
+        df_agrupado['Centro Custo_xml'] = df_agrupado['Centro Custo_db']
+        df_agrupado['Cta.Contabil'] = df_agrupado['C Contabil']
+        df_agrupado['Negocio?'] = df_agrupado['Item Conta']
+        df_agrupado['Loja_xml'] = df_agrupado['Loja_db']
+        df_final_com_rateio = renomear_colunas(df_agrupado)[colunas_finais_xml]
+    return pd.concat([df_final_sem_rateio, df_final_com_rateio], ignore_index=True)
+
+
+def _legado_read_spreadsheetml(path, sheet_name, header_row=1):
+    """
+    `read_spreadsheetml` antigo: árvore inteira em memória (lxml), todas as
+    linhas em listas e depois igualadas em `norm_rows`.
+    """
+    from lxml import etree
+    parser = etree.XMLParser(recover=True, encoding='utf-8')
+    root = etree.parse(path, parser=parser).getroot()
+    ns_uri = root.tag.split('}')[0].strip('{') if root.tag.startswith('{') else None
+
+    def qname(tag):
+        return f"{{{ns_uri}}}{tag}" if ns_uri else tag
+
+    target_ws = None
+    for ws in root.findall(".//" + qname("Worksheet")):
+        if ws.attrib.get(f'{{{ns_uri}}}Name') == sheet_name or ws.attrib.get('Name') == sheet_name:
+            target_ws = ws; break
+    table = target_ws.find(qname("Table"))
+    rows = []
+    for row in table.findall(qname("Row")):
+        cells = []; col_index = 0
+        for c in row.findall(qname("Cell")):
+            idx_attr = c.attrib.get(f"{{{ns_uri}}}Index") or c.attrib.get("Index")
+            if idx_attr:
+                try:
+                    idx = int(idx_attr) - 1
+                    while col_index < idx: cells.append(""); col_index += 1
+                except Exception: pass
+            data = c.find(qname("Data")); val = ""
+            if data is not None and data.text is not None: val = data.text
+            cells.append(val); col_index += 1
+        rows.append(cells)
+    maxcols = max(len(r) for r in rows)
+    norm_rows = [r + [""] * (maxcols - len(r)) for r in rows]
+    cols = [str(h).replace('\n', ' ').strip() if h is not None else "" for h in norm_rows[header_row]]
+    return pd.DataFrame(norm_rows[header_row + 1:], columns=cols)
+
+
+def _legado_relatorio_excel(df, colunas_formato):
+    """to_excel (OpenPyXL) + load_workbook + formatação célula a célula + save."""
+    output = io.BytesIO()
+    df.to_excel(output, index=False, engine='openpyxl')
+    output.seek(0)
+    ws_book = load_workbook(output)
+    ws = ws_book.active
+    col_indices = {}
+    for c_idx, cell in enumerate(ws[1], 1):
+        if cell.value in colunas_formato:
+            col_indices[cell.value] = c_idx
+    for row in ws.iter_rows(min_row=2):
+        for col_name, col_idx in col_indices.items():
+            cell = row[col_idx - 1]
+            if cell.value is not None:
+                try:
+                    cell.value = float(cell.value)
+                    cell.number_format = colunas_formato[col_name]
+                except (ValueError, TypeError):
+                    pass
+    output_formatado = io.BytesIO()
+    ws_book.save(output_formatado)
+    output_formatado.seek(0)
+    return output_formatado
+
+
+def _novo_upload(db, registros, max_simultaneos, colecao='base_compras'):
+    refs = db.collection(colecao)
+    operacoes = ((refs.document(), record) for record in registros)
+    return escrita_em_lote.executar_em_lotes(
+        db, operacoes, total=len(registros), max_simultaneos=max_simultaneos
+    )
+
+
+# --- BENCHMARKS ---
+
+def _rss_atual():
+    """
+    Memória residente do processo, em bytes (Linux: /proc/self/statm).
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _medir(func, *args):
+    """
+    Executa func(*args) num processo filho (fork, que já herda os dados) e
+    devolve (segundos, pico de memória acima do que o filho já tinha, em
+    bytes). Cada medição começa com a memória "limpa", sem reaproveitar o
+    que uma execução anterior deixou alocado. O pico é amostrado por uma
+    thread a cada 5 ms, o que também pega os buffers do Arrow e do numpy.
+    """
+    contexto = multiprocessing.get_context('fork')
+    leitura, escrita = contexto.Pipe(duplex=False)
+
+    def executar():
+        base = pico = _rss_atual()
+        parar = threading.Event()
+
+        def amostrar():
+            nonlocal pico
+            while not parar.wait(0.005):
+                pico = max(pico, _rss_atual())
+
+        amostrador = threading.Thread(target=amostrar, daemon=True)
+        amostrador.start()
+        inicio = time.perf_counter()
+        func(*args)
+        segundos = time.perf_counter() - inicio
+        parar.set()
+        amostrador.join()
+        escrita.send((segundos, max(pico, _rss_atual()) - base))
+
+    processo = contexto.Process(target=executar)
+    processo.start()
+    segundos, pico = leitura.recv()
+    processo.join()
+    return segundos, pico
+
+
+def bench_upload(args):
+    print(f"Upload da base de compras (latência simulada de {args.latencia_ms} ms por commit, "
+          f"{args.taxa_falhas:.0%} de commits com Aborted)")
+    print(f"{'linhas':>10} | {'modo':>14} | {'tempo':>9} | {'linhas/s':>10} | {'repetidos':>9} | {'ganho':>7}")
+    for n_linhas in args.linhas:
+        registros = gerar_registros(n_linhas)
+
+        t_antigo = None
+        if n_linhas <= args.max_linhas_antigo and not args.taxa_falhas:
+            db = FirestoreFalso(args.latencia_ms)
+            inicio = time.perf_counter()
+            _legado_upload(db, registros)
+            t_antigo = time.perf_counter() - inicio
+            assert len(db.dados['base_compras']) == n_linhas
+            print(f"{n_linhas:>10,} | {'antigo':>14} | {t_antigo:8.2f}s | {n_linhas / t_antigo:10,.0f} | "
+                  f"{'-':>9} | {'-':>7}")
+
+        for max_simultaneos in args.simultaneos:
+            db = FirestoreFalso(args.latencia_ms, args.taxa_falhas)
+            estatisticas = _novo_upload(db, registros, max_simultaneos)
+            assert len(db.dados['base_compras']) == n_linhas
+            t = estatisticas['segundos']
+            ganho = f"{t_antigo / t:6.1f}x" if t_antigo is not None else f"{'-':>7}"
+            print(f"{n_linhas:>10,} | {f'paralelo x{max_simultaneos}':>14} | {t:8.2f}s | "
+                  f"{n_linhas / t:10,.0f} | {estatisticas['tentativas_repetidas']:>9} | {ganho}")
+
+
+def bench_brl(args):
+    print("Conversão de valores BRL (texto -> float)")
+    print(f"{'valores':>10} | {'antigo':>9} | {'novo':>9} | {'ganho':>7}")
+    for n_linhas in args.linhas:
+        valores = gerar_valores_brl(n_linhas)
+
+        inicio = time.perf_counter()
+        antigo = valores.apply(_legado_to_number_brl)
+        t_antigo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        novo = conversoes.converter_valores_brl(valores)
+        t_novo = time.perf_counter() - inicio
+
+        assert np.array_equal(antigo.to_numpy(dtype=np.float64), novo.to_numpy())
+        print(f"{n_linhas:>10,} | {t_antigo:8.2f}s | {t_novo:8.2f}s | {t_antigo / t_novo:6.1f}x")
+
+
+def _mesmos_textos(antigo, novo):
+    """
+    Compara células de texto tratando None e NaN como iguais.
+    """
+    a = antigo.astype(object).where(antigo.notna(), None).to_numpy()
+    b = novo.astype(object).where(novo.notna(), None).to_numpy()
+    return a.shape == b.shape and (a == b).all()
+
+
+def bench_titulos(args):
+    print("Separação de fornecedor e parcela da planilha de títulos")
+    print(f"{'linhas':>10} | {'coluna':>12} | {'antigo':>9} | {'novo':>9} | {'ganho':>7}")
+    casos = [
+        ('fornecedor', 'Codigo-Nome do Fornecedor', _legado_tratar_fornecedor, rodar_conciliacao.tratar_fornecedor),
+        ('parcela', 'Prf-Numero Parcela', _legado_tratar_prf_parcela, rodar_conciliacao.tratar_prf_parcela),
+    ]
+    for n_linhas in args.linhas:
+        df = gerar_titulos(n_linhas)
+        for nome, coluna, func_antiga, func_nova in casos:
+            inicio = time.perf_counter()
+            antigo = df[coluna].apply(func_antiga)
+            t_antigo = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            novo = func_nova(df[coluna])
+            t_novo = time.perf_counter() - inicio
+
+            assert _mesmos_textos(antigo, novo)
+            print(f"{n_linhas:>10,} | {nome:>12} | {t_antigo:8.2f}s | {t_novo:8.2f}s | {t_antigo / t_novo:6.1f}x")
+
+
+def bench_rateio(args):
+    print(f"Conciliação e rateio (base de compras com {args.linhas_base:,} linhas)")
+    print(f"{'títulos':>10} | {'antigo':>9} | {'pico antigo':>11} | {'novo':>9} | {'pico novo':>11} | {'ganho':>7}")
+    for n_titulos in args.linhas:
+        df_xml, df_compras = gerar_conciliacao(n_titulos, args.linhas_base)
+
+        t_antigo, pico_antigo = _medir(_legado_rateio, df_xml, df_compras)
+        t_novo, pico_novo = _medir(rodar_conciliacao.calcular_rateio, df_xml, df_compras,
+                                   'Forn_Cliente', 'Documento')
+
+        # Mesmo relatório (recalculados fora da medição)
+        pd.testing.assert_frame_equal(_legado_rateio(df_xml, df_compras),
+                                      rodar_conciliacao.calcular_rateio(df_xml, df_compras, 'Forn_Cliente', 'Documento'))
+        print(f"{n_titulos:>10,} | {t_antigo:8.2f}s | {pico_antigo / 2**20:8.0f} MB | "
+              f"{t_novo:8.2f}s | {pico_novo / 2**20:8.0f} MB | {t_antigo / t_novo:6.1f}x")
+
+
+def bench_xml(args):
+    print("Leitura da planilha '2-Titulos a pagar' (XML SpreadsheetML)")
+    print(f"{'linhas':>10} | {'arquivo':>9} | {'antigo':>9} | {'pico antigo':>11} | {'novo':>9} | {'pico novo':>11} | {'ganho':>7}")
+    for n_linhas in args.linhas:
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'titulos.xml')
+            with open(caminho, 'wb') as f:
+                f.write(gerar_xml_titulos(n_linhas))
+            tamanho = os.path.getsize(caminho)
+
+            t_antigo, pico_antigo = _medir(_legado_read_spreadsheetml, caminho, '2-Titulos a pagar')
+            t_novo, pico_novo = _medir(rodar_conciliacao.read_spreadsheetml, caminho, '2-Titulos a pagar')
+
+            pd.testing.assert_frame_equal(_legado_read_spreadsheetml(caminho, '2-Titulos a pagar'),
+                                          rodar_conciliacao.read_spreadsheetml(caminho, '2-Titulos a pagar'))
+        print(f"{n_linhas:>10,} | {tamanho / 2**20:6.0f} MB | {t_antigo:8.2f}s | {pico_antigo / 2**20:8.0f} MB | "
+              f"{t_novo:8.2f}s | {pico_novo / 2**20:8.0f} MB | {t_antigo / t_novo:6.1f}x")
+
+
+def bench_relatorio(args):
+    print("Escrita do relatório final em Excel (formatos contábeis)")
+    print(f"{'linhas':>10} | {'antigo':>9} | {'pico antigo':>11} | {'novo':>9} | {'pico novo':>11} | {'ganho':>7}")
+    for n_titulos in args.linhas:
+        df = gerar_relatorio(n_titulos)
+
+        t_novo, pico_novo = _medir(rodar_conciliacao.gerar_relatorio_excel, df, FORMATOS_RELATORIO, COLUNAS_DATA)
+        # Mesmo conteúdo nas primeiras linhas (recalculado fora da medição)
+        amostra = df.head(2_000)
+        pd.testing.assert_frame_equal(
+            pd.read_excel(_legado_relatorio_excel(amostra, FORMATOS_RELATORIO)),
+            pd.read_excel(rodar_conciliacao.gerar_relatorio_excel(amostra, FORMATOS_RELATORIO, COLUNAS_DATA)))
+
+        if len(df) > args.max_linhas_antigo:
+            print(f"{len(df):>10,} | {'-':>9} | {'-':>11} | {t_novo:8.2f}s | {pico_novo / 2**20:8.0f} MB | {'-':>7}")
+            continue
+        t_antigo, pico_antigo = _medir(_legado_relatorio_excel, df, FORMATOS_RELATORIO)
+        print(f"{len(df):>10,} | {t_antigo:8.2f}s | {pico_antigo / 2**20:8.0f} MB | "
+              f"{t_novo:8.2f}s | {pico_novo / 2**20:8.0f} MB | {t_antigo / t_novo:6.1f}x")
+
+
+def bench_datas(args):
+    print("Conversão de uma coluna de datas do XML")
+    print(f"{'datas':>10} | {'antigo':>9} | {'novo':>9} | {'ganho':>7}")
+    for n_linhas in args.linhas:
+        textos = gerar_datas_xml(n_linhas)
+
+        inicio = time.perf_counter()
+        antigo = textos.apply(_legado_formatar_data_br)
+        t_antigo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        novo = conversoes.converter_datas(textos, rodar_conciliacao.FORMATOS_DATA_XML['Data de Emissao'])
+        t_novo = time.perf_counter() - inicio
+
+        # Mesmas datas: o antigo devolvia o texto DD/MM/YYYY
+        assert _mesmos_textos(antigo, novo.dt.strftime('%d/%m/%Y'))
+        print(f"{n_linhas:>10,} | {t_antigo:8.2f}s | {t_novo:8.2f}s | {t_antigo / t_novo:6.1f}x")
+
+
+CASOS = {
+    'upload': (bench_upload, [10_000, 100_000, 500_000]),
+    'brl': (bench_brl, [100_000, 1_000_000]),
+    'titulos': (bench_titulos, [100_000, 500_000]),
+    'rateio': (bench_rateio, [100_000, 500_000]),
+    'xml': (bench_xml, [20_000, 100_000]),
+    'relatorio': (bench_relatorio, [50_000, 320_000]),
+    'datas': (bench_datas, [100_000, 500_000]),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Conciliador.")
+    parser.add_argument('caso', choices=list(CASOS))
+    parser.add_argument('--linhas', type=int, nargs='+',
+                        help="Tamanhos a testar (padrão depende do caso).")
+    parser.add_argument('--linhas-base', type=int, default=1_000_000,
+                        help="Linhas da base de compras no caso 'rateio'.")
+    parser.add_argument('--max-linhas-antigo', type=int, default=500_000,
+                        help="Acima deste tamanho a implementação antiga não é executada.")
+    parser.add_argument('--latencia-ms', type=float, default=50,
+                        help="Latência simulada de cada commit no Firestore falso.")
+    parser.add_argument('--taxa-falhas', type=float, default=0.0,
+                        help="Fração dos commits que falham com Aborted (testa as novas tentativas).")
+    parser.add_argument('--simultaneos', type=int, nargs='+',
+                        default=[escrita_em_lote.MAX_COMMITS_SIMULTANEOS],
+                        help="Commits simultâneos a testar no modo paralelo.")
+    args = parser.parse_args()
+
+    func, tamanhos_padrao = CASOS[args.caso]
+    args.linhas = args.linhas or tamanhos_padrao
+    func(args)
+
+
+if __name__ == '__main__':
+    main()
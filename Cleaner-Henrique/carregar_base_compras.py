@@ -1,7 +1,8 @@
 import pandas as pd
 import sys
-import re
 import os
+import threading
+import uuid
 
 # --- FIX: Adiciona o diretório do script ao path ---
 try:
@@ -12,32 +13,38 @@ if SCRIPT_DIR not in sys.path:
     sys.path.append(SCRIPT_DIR)
 # --- FIM DO FIX ---
 
-from firebase_utils import get_db
+from firebase_utils import (
+    get_db, ler_metadados_base, contar_documentos, colecao_ativa, colecao_da_versao, formato_base,
+    dividir_em_blocos, normalizar_fornecedor, COLECAO_METADADOS, CAMPO_LOTE_UPLOAD,
+    CAMPO_ATUALIZADO_EM, CAMPO_DOC_ID, CAMPO_FORNECEDOR_NORM, COLUNA_PARTICAO,
+    FORMATO_DOCUMENTOS, FORMATO_BLOCOS, DOCS_POR_COMMIT_BLOCOS
+)
+from firebase_admin import firestore
+from base_compras_local import gravar_snapshot, anexar_ao_snapshot
+from escrita_em_lote import executar_em_lotes, apagar_colecao, TAMANHO_LOTE
+from conversoes import converter_valores_brl
 
 # --- Configurações ---
 NOME_DA_PLANILHA_EXCEL = 'Dados' 
 COLUNA_DE_VALOR = 'Vlr.Total'
 COLECAO_FIRESTORE = 'base_compras' # Nome da nossa coleção no Firebase
+# Formato usado num replace: 'documentos' (1 por linha) ou 'blocos' (compacto)
+FORMATO_BASE_PADRAO = os.environ.get('CONCILIADOR_FORMATO_BASE', FORMATO_DOCUMENTOS)
 
-# --- Função de Limpeza de Moeda BRL (Sem alterações) ---
-def to_number_brl(x):
-    try:
-        if pd.isna(x): return 0.0
-        s = str(x).strip().replace(' ', '') 
-        if s == "": return 0.0
-        
-        if s.count(',') == 1 and s.count('.') > 0:
-            s = s.replace('.', '').replace(',', '.')
-        elif s.count(',') == 1:
-            s = s.replace(',', '.')
-        elif s.count('.') == 1 and s.count(',') == 0:
-            pass 
-        elif s.count('.') > 0 and s.count(',') == 0:
-            s = s.replace('.', '')
-        
-        return float(s)
-    except Exception:
-        return 0.0
+# Coleções sendo apagadas em segundo plano por este processo
+_exclusoes_em_andamento = set()
+_trava_exclusoes = threading.Lock()
+
+def converter_coluna_data(serie):
+    """
+    Converte textos de data do Excel ('2024-05-10 00:00:00' ou '10/05/2024')
+    para datetime; o que não for data vira NaT.
+    """
+    datas = pd.to_datetime(serie, format='ISO8601', errors='coerce')
+    faltando = datas.isna() & serie.notna()
+    if faltando.any():
+        datas[faltando] = pd.to_datetime(serie[faltando], format='%d/%m/%Y', errors='coerce')
+    return datas
 
 # --- FUNÇÃO 1: Ler o Excel para um DataFrame (Lógica antiga) ---
 def ler_excel_para_df(arquivo_excel_bytesio):
@@ -64,84 +71,262 @@ def ler_excel_para_df(arquivo_excel_bytesio):
     
     if col_vlr_limpo in df_compras.columns:
         print(f"Convertendo a coluna de valor BRL '{col_vlr_limpo}' para numérico...")
-        df_compras[col_vlr_limpo] = df_compras[col_vlr_limpo].apply(to_number_brl)
+        df_compras[col_vlr_limpo] = converter_valores_brl(df_compras[col_vlr_limpo])
     else:
         print(f"Aviso: A coluna de valor '{col_vlr_limpo}' não foi encontrada.")
 
-    # Importante: Converte colunas que podem ser interpretadas como data para str
-    # para evitar que o Firebase as salve no formato errado
+    # Colunas de data viram datetime (gravadas como timestamp no Firestore),
+    # para a Auditoria poder filtrar por intervalo de datas no servidor
     for col in df_compras.columns:
         if 'data' in col.lower():
-            df_compras[col] = df_compras[col].astype(str)
+            df_compras[col] = converter_coluna_data(df_compras[col])
 
     print(f"Leitura concluída. {len(df_compras)} linhas encontradas.")
     return df_compras
 
 # --- FUNÇÃO 2: Fazer o Upload do DataFrame para o Firebase ---
-def carregar_base_firebase(df, modo_execucao='replace'):
+def carregar_base_firebase(df, modo_execucao='replace', progresso=None, formato=None):
     """
     Carrega o DataFrame para a coleção 'base_compras' no Firestore.
+    `progresso(n_enviados, total)`, se informado, é chamado a cada lote
+    commitado (conta documentos: linhas, ou blocos no formato 'blocos').
+    `formato` só vale no replace; um append segue o formato da base atual.
     """
     db = get_db()
     if db is None:
         raise Exception("Não foi possível conectar ao Firestore.")
+
+    meta_anterior = ler_metadados_base(db)
     
     # --- Lógica de "Replace" ---
+    # A base nova é gravada numa coleção nova e só passa a valer quando o
+    # ponteiro 'colecao_ativa' dos metadados é trocado (uma escrita, atômica).
+    # A coleção antiga é apagada depois, em segundo plano.
     if modo_execucao == 'replace':
         print("--- MODO REPLACE ---")
-        print(f"Apagando todos os documentos da coleção '{COLECAO_FIRESTORE}'...")
-        
-        # Deletar em lotes (obrigatório pelo Firestore)
-        docs = db.collection(COLECAO_FIRESTORE).limit(500).stream()
-        deleted = 0
-        
-        while True:
-            batch = db.batch()
-            doc_count = 0
-            for doc in docs:
-                batch.delete(doc.reference)
-                doc_count += 1
-                deleted += 1
-            
-            if doc_count == 0:
-                break # Sai do loop se não houver mais docs
-            
-            batch.commit()
-            print(f"Lote de {doc_count} documentos apagado...")
-            # Pega o próximo lote
-            docs = db.collection(COLECAO_FIRESTORE).limit(500).stream()
-
-        print(f"Total de {deleted} documentos antigos apagados.")
+        versao = uuid.uuid4().hex
+        colecao_destino = colecao_da_versao(versao)
+        formato = formato or FORMATO_BASE_PADRAO
+        print(f"A nova base será gravada na coleção '{colecao_destino}' (formato '{formato}').")
+    else:
+        versao = None
+        colecao_destino = colecao_ativa(meta_anterior)
+        formato = formato_base(meta_anterior)
     
     print(f"Iniciando upload de {len(df)} novos registros para o Firebase...")
     
-    # Converte o DF para uma lista de dicionários
-    # fillna('') para evitar problemas com valores NaN, que o Firestore não aceita
-    registros = df.fillna('').to_dict('records')
+    df_base = _preparar_para_firestore(df)
+
+    # Cada documento leva o id deste upload e o horário do commit (servidor),
+    # usados pela sincronização incremental (ver base_compras_local.py)
+    lote_upload = uuid.uuid4().hex
+    campos_controle = {
+        CAMPO_LOTE_UPLOAD: lote_upload,
+        CAMPO_ATUALIZADO_EM: firestore.SERVER_TIMESTAMP
+    }
     
     # --- Lógica de Upload em Lote (Batch) ---
-    # O Firestore tem um limite de 500 operações por lote
-    batch = db.batch()
-    total_carregado = 0
-    
-    for i, record in enumerate(registros):
-        # Cria uma nova referência de documento (com ID automático)
-        doc_ref = db.collection(COLECAO_FIRESTORE).document()
-        batch.set(doc_ref, record)
-        
-        total_carregado += 1
-        
-        # Faz o commit do lote a cada 499 registros (para segurança)
-        if (i + 1) % 499 == 0:
-            print(f"Commitando lote... {total_carregado} / {len(registros)} registros carregados.")
-            batch.commit()
-            # Inicia um novo lote
-            batch = db.batch()
-
-    # Commit do lote final (o que sobrou)
-    batch.commit()
-    print(f"Upload concluído! Total de {total_carregado} registros salvos no Firebase.")
+    # Lotes commitados em paralelo: até 500 operações (limite do Firestore),
+    # ou poucos blocos por commit (limite de 10 MiB por commit)
+    colecao = db.collection(colecao_destino)
+    if formato == FORMATO_BLOCOS:
+        operacoes, df_registros, total_operacoes = _operacoes_blocos(colecao, df_base, campos_controle)
+        tamanho_lote, unidade = DOCS_POR_COMMIT_BLOCOS, 'blocos'
+    else:
+        operacoes, df_registros, total_operacoes = _operacoes_documentos(colecao, df_base, campos_controle)
+        tamanho_lote, unidade = TAMANHO_LOTE, 'registros'
+
+    proximo_aviso = 0
+    def _progresso(n_enviados, total):
+        nonlocal proximo_aviso
+        if n_enviados >= proximo_aviso or n_enviados == total:
+            print(f"{n_enviados} / {total} {unidade} carregados.")
+            proximo_aviso = n_enviados + max(total // 10, 1)
+        if progresso is not None:
+            progresso(n_enviados, total)
+
+    try:
+        estatisticas = executar_em_lotes(db, operacoes, total=total_operacoes,
+                                         progresso=_progresso, tamanho_lote=tamanho_lote)
+    except Exception:
+        if modo_execucao == 'replace':
+            # A base antiga continua ativa; a coleção nova, incompleta, é descartada
+            agendar_exclusao(db, colecao_destino)
+            apagar_colecoes_pendentes(db)
+        raise
+    total_carregado = len(df_registros)
+    print(f"Upload concluído! Total de {total_carregado} registros salvos no Firebase "
+          f"em {estatisticas['segundos']:.1f}s ({estatisticas['operacoes']} documentos, "
+          f"{estatisticas['lotes']} lotes, {estatisticas['tentativas_repetidas']} tentativa(s) repetida(s)).")
+
+    # --- Publica a nova versão da base e atualiza o snapshot local ---
+    meta_nova = publicar_metadados_base(db, modo_execucao, total_carregado, meta_anterior,
+                                        versao=versao, colecao=colecao_destino, formato=formato,
+                                        colunas=list(df_base.columns))
+    df_registros[CAMPO_LOTE_UPLOAD] = lote_upload
+    if modo_execucao == 'replace':
+        gravar_snapshot(df_registros, meta_nova['versao'], meta_nova['n_documentos'],
+                        meta_nova.get('atualizado_em'))
+    else:
+        anexar_ao_snapshot(df_registros, meta_anterior, meta_nova)
+
+    # A base nova já está em uso; a antiga é apagada sem travar o usuário
+    apagar_colecoes_pendentes(db)
     return True
 
 
+def _preparar_para_firestore(df):
+    """
+    fillna('') para evitar problemas com valores NaN, que o Firestore não
+    aceita. Datas ficam como datetime (timestamp no Firestore), com None
+    no lugar de NaT.
+    """
+    df_base = df.reset_index(drop=True)
+    colunas_data = [c for c in df_base.columns if pd.api.types.is_datetime64_any_dtype(df_base[c])]
+    outras = [c for c in df_base.columns if c not in colunas_data]
+    df_base[outras] = df_base[outras].fillna('')
+    for col in colunas_data:
+        df_base[col] = df_base[col].astype(object).where(df_base[col].notna(), None)
+    return df_base
+
+
+def _operacoes_documentos(colecao, df_base, campos_controle):
+    """
+    Formato 'documentos': uma escrita por linha, com ID automático e o
+    fornecedor normalizado em `_forn_norm` (para a busca por fornecedor).
+    Devolve (operacoes, df_registros com `_doc_id`, nº de operações).
+    """
+    registros = df_base.to_dict('records')
+    refs = [colecao.document() for _ in registros]  # IDs automáticos (gerados localmente)
+    if COLUNA_PARTICAO in df_base.columns:
+        fornecedores = normalizar_fornecedor(df_base[COLUNA_PARTICAO]).tolist()
+    else:
+        fornecedores = [''] * len(registros)
+    operacoes = (
+        (ref, {**record, CAMPO_FORNECEDOR_NORM: fornecedor, **campos_controle})
+        for ref, record, fornecedor in zip(refs, registros, fornecedores)
+    )
+    df_registros = df_base.copy()
+    df_registros[CAMPO_DOC_ID] = [ref.id for ref in refs]
+    return operacoes, df_registros, len(refs)
+
+
+def _operacoes_blocos(colecao, df_base, campos_controle):
+    """
+    Formato 'blocos': um documento por bloco de linhas (Parquet zstd).
+    Devolve (operacoes, df_registros com `_doc_id` '<bloco>:<linha>', nº de operações).
+    """
+    blocos = list(dividir_em_blocos(df_base))
+    refs = [colecao.document() for _ in blocos]
+    operacoes = (
+        (ref, {'particao': particao, 'n_linhas': len(df_bloco), 'dados': dados, **campos_controle})
+        for ref, (particao, df_bloco, dados) in zip(refs, blocos)
+    )
+    partes = []
+    for ref, (_, df_bloco, _) in zip(refs, blocos):
+        partes.append(df_bloco.assign(**{CAMPO_DOC_ID: [f"{ref.id}:{i}" for i in range(len(df_bloco))]}))
+    df_registros = pd.concat(partes, ignore_index=True) if partes else df_base.assign(**{CAMPO_DOC_ID: ''})
+    print(f"{len(df_base)} linhas agrupadas em {len(blocos)} blocos "
+          f"({sum(len(dados) for _, _, dados in blocos) / 1024 / 1024:.1f} MB).")
+    return operacoes, df_registros, len(blocos)
+
+
+def publicar_metadados_base(db, modo_execucao, n_carregados, meta_anterior, versao=None, colecao=None,
+                            formato=FORMATO_DOCUMENTOS, colunas=None):
+    """
+    Atualiza o documento de metadados da base (versão, nº de documentos,
+    coleção ativa, formato e colunas), que a conciliação usa para saber se o
+    snapshot local está em dia e se pode buscar só alguns fornecedores.
+    Um replace aponta para a coleção nova e marca a anterior para exclusão;
+    um append mantém a versão e soma a contagem. Devolve os metadados como
+    ficaram no servidor (com o `atualizado_em` já resolvido, que serve de
+    marca d'água do snapshot).
+    """
+    doc_meta = db.collection(COLECAO_METADADOS).document(COLECAO_FIRESTORE)
+    if modo_execucao == 'append' and meta_anterior is not None:
+        # Increment evita perder contagem se dois uploads terminarem juntos
+        doc_meta.set({
+            'n_documentos': firestore.Increment(n_carregados),
+            'atualizado_em': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+    elif modo_execucao == 'replace':
+        doc_meta.set({
+            'versao': versao,
+            'n_documentos': n_carregados,
+            'colecao_ativa': colecao,
+            'formato': formato,
+            'colunas': colunas or [],
+            # Todos os documentos desta versão têm `_forn_norm`
+            'fornecedor_normalizado': COLUNA_PARTICAO in (colunas or []),
+            'colecoes_a_apagar': firestore.ArrayUnion([colecao_ativa(meta_anterior)]),
+            'atualizado_em': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+    else:
+        # Base antiga, sem metadados: a contagem vem do servidor
+        doc_meta.set({
+            'versao': uuid.uuid4().hex,
+            'n_documentos': contar_documentos(db, colecao),
+            'colecao_ativa': colecao,
+            'formato': formato,
+            'colunas': colunas or [],
+            'fornecedor_normalizado': False,  # Documentos antigos não têm `_forn_norm`
+            'atualizado_em': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+    meta_nova = ler_metadados_base(db)
+
+    print(f"Metadados da base publicados (versão {meta_nova['versao']}, {meta_nova['n_documentos']} documentos).")
+    return meta_nova
+
+
+# --- Exclusão das coleções de bases substituídas ---
+def agendar_exclusao(db, nome_colecao):
+    """
+    Registra a coleção nos metadados como pendente de exclusão (assim a
+    exclusão é retomada no próximo upload se o processo cair no meio).
+    """
+    db.collection(COLECAO_METADADOS).document(COLECAO_FIRESTORE).set({
+        'colecoes_a_apagar': firestore.ArrayUnion([nome_colecao])
+    }, merge=True)
+
+
+def _apagar_colecao_pendente(db, nome_colecao):
+    try:
+        estatisticas = apagar_colecao(db, nome_colecao)
+        db.collection(COLECAO_METADADOS).document(COLECAO_FIRESTORE).set({
+            'colecoes_a_apagar': firestore.ArrayRemove([nome_colecao])
+        }, merge=True)
+        print(f"Coleção antiga '{nome_colecao}' apagada ({estatisticas['operacoes']} documentos "
+              f"em {estatisticas['segundos']:.1f}s).")
+    except Exception as e:
+        print(f"Aviso: exclusão da coleção '{nome_colecao}' interrompida; será retomada no próximo upload. Erro: {e}")
+    finally:
+        with _trava_exclusoes:
+            _exclusoes_em_andamento.discard(nome_colecao)
+
+
+def apagar_colecoes_pendentes(db, em_segundo_plano=True):
+    """
+    Apaga as coleções marcadas em 'colecoes_a_apagar' (nunca a ativa), cada
+    uma numa thread. Com `em_segundo_plano=False`, espera todas terminarem.
+    Devolve as threads iniciadas.
+    """
+    snap = db.collection(COLECAO_METADADOS).document(COLECAO_FIRESTORE).get()
+    meta = (snap.to_dict() if snap.exists else None) or {}
+    ativa = colecao_ativa(meta)
+
+    threads = []
+    for nome_colecao in meta.get('colecoes_a_apagar', []):
+        with _trava_exclusoes:
+            if nome_colecao == ativa or nome_colecao in _exclusoes_em_andamento:
+                continue
+            _exclusoes_em_andamento.add(nome_colecao)
+        print(f"Apagando a coleção antiga '{nome_colecao}' em segundo plano...")
+        thread = threading.Thread(target=_apagar_colecao_pendente, args=(db, nome_colecao),
+                                  name=f"apagar-{nome_colecao}", daemon=True)
+        thread.start()
+        threads.append(thread)
 
+    if not em_segundo_plano:
+        for thread in threads:
+            thread.join()
+    return threads
@@ -0,0 +1,87 @@
+"""
+Conversões de valores usadas pela carga da base de compras e pela
+conciliação.
+"""
+import pandas as pd
+
+
+def _float_ou_zero(texto):
+    try:
+        return float(texto)
+    except Exception:
+        return 0.0
+
+
+def converter_valores_brl(valores):
+    """
+    Converte uma coluna de valores em formato brasileiro ('1.234,56') para
+    float, de forma vetorizada. Mesmas regras do antigo `to_number_brl`
+    (aplicado linha a linha):
+
+    - vazio, NaN ou None -> 0.0;
+    - uma vírgula e algum ponto ('1.234,56') -> pontos são milhar;
+    - uma vírgula e nenhum ponto ('1234,56') -> vírgula é decimal;
+    - um ponto e nenhuma vírgula ('1234.56') -> ponto é decimal;
+    - vários pontos e nenhuma vírgula ('1.234.567') -> pontos são milhar;
+    - qualquer outra coisa que não vire número -> 0.0.
+
+    Devolve uma Series float64 com o mesmo índice.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        # Já numérica: str() -> float() devolveria o mesmo número
+        return serie.astype('float64').fillna(0.0)
+
+    # Nulos viram '' antes do astype: no pandas 2 o NaN viraria o texto 'nan'
+    textos = serie.where(serie.notna(), '').astype(str).str.strip().str.replace(' ', '', regex=False)
+
+    # Uma vírgula -> decimal; pontos -> milhar. Remover os pontos e trocar a
+    # vírgula por ponto cobre todos os casos, menos o de um único ponto sem
+    # vírgula ('1234.56'), que fica como está. Com duas ou mais vírgulas o
+    # texto continua inválido (vira 0.0) de qualquer jeito.
+    sem_pontos = textos.str.replace('.', '', regex=False)
+    n_pontos = textos.str.len() - sem_pontos.str.len()
+    tem_virgula = sem_pontos.str.contains(',', regex=False)
+    normalizados = sem_pontos.str.replace(',', '.', regex=False).where(tem_virgula | (n_pontos != 1), textos)
+    normalizados = normalizados.mask(normalizados == '', '0')
+
+    try:
+        return normalizados.astype('float64')
+    except (ValueError, TypeError):
+        pass
+
+    # Há textos que não são número: esses viram 0.0, como no antigo except.
+    # Todos passam pelo mesmo float() do antigo, uma vez por texto distinto.
+    convertidos = {t: _float_ou_zero(t) for t in pd.unique(normalizados)}
+    return normalizados.map(convertidos).astype('float64')
+
+
+def converter_datas(valores, formato):
+    """
+    Converte uma coluna de datas em texto para datetime64 de uma vez, com o
+    formato `formato` (ex.: 'ISO8601', que cobre o DateTime do SpreadsheetML
+    com ou sem milissegundos, ou um formato strftime). Substitui o antigo `formatar_data_br`, que chamava
+    `pd.to_datetime` em cada célula e devolvia texto 'DD/MM/YYYY'.
+
+    - vazio, NaN ou None -> NaT;
+    - fora do formato, mas em 'DD/MM/YYYY' (data digitada como texto) -> data;
+    - qualquer outra coisa fica como o texto original, como no antigo
+      except; nesse caso a coluna volta como object (datas + textos).
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    textos = serie.where(serie.notna(), '').astype(str).str.strip()
+    datas = pd.to_datetime(textos, format=formato, errors='coerce')
+
+    falhas = datas.isna() & (textos != '')
+    if falhas.any():
+        datas[falhas] = pd.to_datetime(textos[falhas], format='%d/%m/%Y', errors='coerce')
+        falhas = datas.isna() & (textos != '')
+    if not falhas.any():
+        return datas
+
+    mistos = datas.astype(object)
+    mistos[falhas] = serie[falhas]
+    return mistos
@@ -0,0 +1,146 @@
+"""
+Escrita em lote no Firestore com commits em paralelo.
+
+As operações são agrupadas em lotes de até TAMANHO_LOTE (limite do
+Firestore: 500 escritas por commit) e vários lotes são commitados ao mesmo
+tempo num pool de threads. No máximo `max_simultaneos` commits ficam em
+andamento, e os lotes seguintes só são montados quando um deles termina
+(pipeline: a lista de operações pode ser um gerador).
+
+Erros transitórios (contenção, cota, timeout, indisponibilidade) são
+repetidos com backoff exponencial; qualquer outro erro interrompe a escrita.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+from google.api_core.exceptions import (
+    Aborted, DeadlineExceeded, ResourceExhausted, ServiceUnavailable
+)
+
+# --- Configurações ---
+TAMANHO_LOTE = 500
+TAMANHO_PAGINA_EXCLUSAO = 2_000
+MAX_COMMITS_SIMULTANEOS = 8
+MAX_TENTATIVAS = 6
+ESPERA_INICIAL_S = 0.5
+ESPERA_MAXIMA_S = 30.0
+
+ERROS_TRANSITORIOS = (Aborted, DeadlineExceeded, ResourceExhausted, ServiceUnavailable)
+
+
+def _espera_backoff(tentativa):
+    """
+    Backoff exponencial com jitter ("full jitter"), para que lotes que
+    falharam juntos não tentem de novo todos ao mesmo tempo.
+    """
+    return random.uniform(0, min(ESPERA_MAXIMA_S, ESPERA_INICIAL_S * (2 ** tentativa)))
+
+
+def _commitar_lote(db, lote, estatisticas, trava):
+    """
+    Monta e commita um lote de operações (ref, dados); `dados` None apaga o
+    documento. Cada tentativa usa um batch novo: set/delete são idempotentes,
+    então repetir um lote inteiro é seguro.
+    """
+    for tentativa in range(MAX_TENTATIVAS):
+        batch = db.batch()
+        for ref, dados in lote:
+            if dados is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, dados)
+        try:
+            batch.commit()
+            return len(lote)
+        except ERROS_TRANSITORIOS as e:
+            if tentativa == MAX_TENTATIVAS - 1:
+                raise
+            espera = _espera_backoff(tentativa)
+            with trava:
+                estatisticas['tentativas_repetidas'] += 1
+            print(f"Aviso: commit de lote falhou ({type(e).__name__}), nova tentativa em {espera:.1f}s...")
+            time.sleep(espera)
+
+
+def executar_em_lotes(db, operacoes, total=None, progresso=None,
+                      max_simultaneos=MAX_COMMITS_SIMULTANEOS, tamanho_lote=TAMANHO_LOTE):
+    """
+    Executa as `operacoes` (iterável de (doc_ref, dados); dados None = apagar)
+    em lotes commitados em paralelo.
+
+    `progresso(n_feitas, total)` é chamado (na thread de quem chamou esta
+    função, então pode atualizar a interface) a cada lote concluído.
+    Devolve um dict com 'operacoes', 'lotes', 'tentativas_repetidas' e
+    'segundos'.
+    """
+    if not 1 <= tamanho_lote <= TAMANHO_LOTE:
+        raise ValueError(f"tamanho_lote deve estar entre 1 e {TAMANHO_LOTE}.")
+
+    inicio = time.perf_counter()
+    estatisticas = {'operacoes': 0, 'lotes': 0, 'tentativas_repetidas': 0}
+    trava = threading.Lock()
+    iterador = iter(operacoes)
+
+    with ThreadPoolExecutor(max_workers=max_simultaneos) as executor:
+        pendentes = set()
+        try:
+            while True:
+                # Completa a janela de commits em andamento
+                while len(pendentes) < max_simultaneos:
+                    lote = list(islice(iterador, tamanho_lote))
+                    if not lote:
+                        break
+                    pendentes.add(executor.submit(_commitar_lote, db, lote, estatisticas, trava))
+                if not pendentes:
+                    break
+
+                concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    estatisticas['operacoes'] += futuro.result()
+                    estatisticas['lotes'] += 1
+                if progresso is not None:
+                    progresso(estatisticas['operacoes'], total)
+        except BaseException:
+            # Não começa lotes novos; os que já estão em andamento terminam
+            for futuro in pendentes:
+                futuro.cancel()
+            raise
+
+    estatisticas['segundos'] = time.perf_counter() - inicio
+    return estatisticas
+
+
+def _refs_da_colecao(db, nome_colecao, tamanho_pagina):
+    """
+    Percorre as referências da coleção página a página, com cursor
+    (start_after) e projeção vazia (select([])): o servidor devolve só os
+    nomes dos documentos, sem os campos.
+    """
+    query = db.collection(nome_colecao).select([]).limit(tamanho_pagina)
+    ultimo = None
+    while True:
+        pagina = query.start_after(ultimo) if ultimo is not None else query
+        n_docs = 0
+        for doc in pagina.stream():
+            n_docs += 1
+            ultimo = doc
+            yield doc.reference, None
+        if n_docs < tamanho_pagina:
+            return
+
+
+def apagar_colecao(db, nome_colecao, progresso=None,
+                   max_simultaneos=MAX_COMMITS_SIMULTANEOS, tamanho_pagina=TAMANHO_PAGINA_EXCLUSAO):
+    """
+    Apaga todos os documentos de uma coleção com lotes de exclusão em
+    paralelo. A próxima página de referências é buscada enquanto os lotes da
+    anterior ainda estão sendo commitados. Devolve as estatísticas de
+    `executar_em_lotes`.
+    """
+    return executar_em_lotes(
+        db, _refs_da_colecao(db, nome_colecao, tamanho_pagina),
+        progresso=progresso, max_simultaneos=max_simultaneos
+    )
@@ -47,40 +47,412 @@ def init_firebase_app():
         st.error(f"Erro inesperado ao inicializar o Firebase: {e}")
         return None
 # (No final de firebase_utils.py)
+import io
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+
+import numpy as np
 import pandas as pd
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud.firestore_v1.field_path import FieldPath
 
 COLECAO_FIRESTORE = 'base_compras'
+COLECAO_METADADOS = 'metadados'  # Um documento por coleção, com versão e contagem
+# Cada replace grava em '<COLECAO_VERSOES>/<versão>/<SUBCOLECAO_LINHAS>'. O id
+# da coleção é sempre o mesmo, então os índices compostos valem para todas
+# as versões (ver firestore.indexes.json).
+COLECAO_VERSOES = 'base_compras_versoes'
+SUBCOLECAO_LINHAS = 'linhas'
+COLUNA_VALOR = 'Vlr.Total'
+
+# Campos de controle gravados em cada documento da base pelo upload
+CAMPO_LOTE_UPLOAD = '_lote_upload'        # id do upload que criou o documento
+CAMPO_ATUALIZADO_EM = '_atualizado_em'    # SERVER_TIMESTAMP do commit
+CAMPO_DOC_ID = '_doc_id'                  # id do documento (só no snapshot local)
+CAMPO_FORNECEDOR_NORM = '_forn_norm'      # Forn_Cliente sem zeros à esquerda (filtro 'in')
+CAMPOS_CONTROLE = [CAMPO_LOTE_UPLOAD, CAMPO_ATUALIZADO_EM, CAMPO_DOC_ID, CAMPO_FORNECEDOR_NORM]
+
+# --- Consultas 'in' ---
+MAX_VALORES_IN = 30            # Limite do Firestore por filtro 'in'
+MAX_CONSULTAS_SIMULTANEAS = 8
+
+# --- Auditoria ---
+# firestore.indexes.json cobre igualdade (fornecedor/documento/filial) +
+# intervalo de valor. Igualdade + intervalo de data (ou valor + data) pede um
+# índice com a coluna de data; o erro do Firestore traz o link para criá-lo.
+LIMITE_PAGINA_AUDITORIA = 500
+# Formato 'blocos': o resultado filtrado fica em cache por conjunto de
+# filtros (e versão da base), para as páginas seguintes não baixarem de novo
+TTL_CACHE_AUDITORIA_S = 600
+MAX_FILTROS_EM_CACHE = 4
+
+# --- Formatos de armazenamento da base ---
+# 'documentos': um documento por linha do Excel (formato original).
+# 'blocos': ~LINHAS_POR_BLOCO linhas por documento, em Parquet (zstd) no
+#           campo 'dados', particionadas pelo fornecedor normalizado.
+# Nos dois formatos, 'n_documentos' dos metadados é o nº de LINHAS da base.
+FORMATO_DOCUMENTOS = 'documentos'
+FORMATO_BLOCOS = 'blocos'
+COLUNA_PARTICAO = 'Forn_Cliente'
+N_PARTICOES_BLOCOS = 32
+LINHAS_POR_BLOCO = 5_000
+LIMITE_BYTES_BLOCO = 900_000   # Documento do Firestore: máx. 1 MiB
+DOCS_POR_COMMIT_BLOCOS = 8     # Commit do Firestore: máx. 10 MiB
+
+
+def ler_metadados_base(db, colecao=COLECAO_FIRESTORE):
+    """
+    Lê o documento de metadados da base (versão, número de documentos e
+    coleção ativa), gravado a cada upload. Devolve None se nenhuma base
+    tiver sido publicada ainda.
+    """
+    snap = db.collection(COLECAO_METADADOS).document(colecao).get()
+    meta = snap.to_dict() if snap.exists else None
+    return meta if meta and meta.get('versao') else None
+
+
+def colecao_ativa(meta):
+    """
+    Caminho da coleção que guarda a base em uso. Cada replace grava numa
+    coleção nova ('base_compras_versoes/<versão>/linhas'); bases antigas
+    ficam em 'base_compras'.
+    """
+    return (meta or {}).get('colecao_ativa') or COLECAO_FIRESTORE
+
+
+def colecao_da_versao(versao):
+    return f"{COLECAO_VERSOES}/{versao[:12]}/{SUBCOLECAO_LINHAS}"
+
+
+def campo(nome_coluna):
+    """
+    Caminho de campo para consultas. Colunas com ponto ('Vlr.Total') são
+    nomes literais no documento e precisam ir entre crases, senão o
+    Firestore as lê como campo aninhado.
+    """
+    return FieldPath(nome_coluna).to_api_repr()
+
+
+def contar_documentos(db, colecao=COLECAO_FIRESTORE):
+    """
+    Conta os documentos da coleção com uma agregação no servidor
+    (não baixa os documentos).
+    """
+    resultado = db.collection(colecao).count().get()
+    return int(resultado[0][0].value)
+
+
+def formato_base(meta):
+    """
+    Formato de armazenamento da base publicada (bases antigas: 'documentos').
+    """
+    return (meta or {}).get('formato') or FORMATO_DOCUMENTOS
+
+
+# --- Formato 'blocos': escrita e leitura ---
+def normalizar_fornecedor(serie):
+    """
+    Mesma normalização de fornecedor usada na conciliação (sem zeros à esquerda).
+    """
+    return serie.astype(str).str.lstrip('0').str.strip()
+
+
+def particoes_dos_fornecedores(serie):
+    """
+    Partição (0..N_PARTICOES_BLOCOS-1) de cada fornecedor: CRC32 do código
+    normalizado. Calculada uma vez por fornecedor distinto.
+    """
+    codigos, distintos = pd.factorize(normalizar_fornecedor(serie))
+    particoes = np.array([zlib.crc32(f.encode('utf-8')) % N_PARTICOES_BLOCOS for f in distintos],
+                         dtype=np.int64)
+    return particoes[codigos] if len(codigos) else np.array([], dtype=np.int64)
+
+
+def codificar_bloco(df):
+    """
+    Serializa um pedaço da base em Parquet comprimido com zstd.
+    """
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, compression='zstd')
+    return buffer.getvalue()
+
+
+def decodificar_bloco(dados):
+    return pd.read_parquet(io.BytesIO(dados))
+
+
+def _blocos_que_cabem(df):
+    """
+    Divide `df` ao meio até cada parte caber em LIMITE_BYTES_BLOCO.
+    """
+    dados = codificar_bloco(df)
+    if len(dados) <= LIMITE_BYTES_BLOCO or len(df) == 1:
+        yield df, dados
+        return
+    meio = len(df) // 2
+    yield from _blocos_que_cabem(df.iloc[:meio])
+    yield from _blocos_que_cabem(df.iloc[meio:])
+
+
+def dividir_em_blocos(df):
+    """
+    Gera (particao, df_bloco, bytes_parquet) para gravar a base no formato
+    'blocos': as linhas são agrupadas por partição do fornecedor e cortadas
+    em blocos de até LINHAS_POR_BLOCO linhas (menos, se passar do limite de
+    tamanho do documento).
+    """
+    particoes = particoes_dos_fornecedores(df[COLUNA_PARTICAO])
+    for particao in np.unique(particoes):
+        df_particao = df[particoes == particao]
+        for inicio in range(0, len(df_particao), LINHAS_POR_BLOCO):
+            pedaco = df_particao.iloc[inicio:inicio + LINHAS_POR_BLOCO].reset_index(drop=True)
+            for df_bloco, dados in _blocos_que_cabem(pedaco):
+                yield int(particao), df_bloco.reset_index(drop=True), dados
+
 
-def query_base_compras(fornecedor=None, documento=None, filial=None):
+def documento_bloco_para_df(doc):
     """
-    Busca a base de compras no Firestore, aplicando filtros de IGUALDADE.
+    Linhas de um documento do formato 'blocos', com os campos de controle
+    (`_doc_id` = '<id do documento>:<linha>').
+    """
+    registro = doc.to_dict()
+    df = decodificar_bloco(registro['dados'])
+    df[CAMPO_LOTE_UPLOAD] = registro.get(CAMPO_LOTE_UPLOAD, '')
+    df[CAMPO_DOC_ID] = [f"{doc.id}:{i}" for i in range(len(df))]
+    return df
+
+
+def _consultar_em_paralelo(db, colecao, campo, valores, converter):
+    """
+    Executa `where(campo, 'in', grupo)` para cada grupo de até MAX_VALORES_IN
+    valores, com até MAX_CONSULTAS_SIMULTANEAS consultas ao mesmo tempo.
+    `converter(docs)` transforma o resultado de cada consulta; devolve a
+    lista dos resultados convertidos.
+    """
+    valores = sorted(set(valores))
+    grupos = [valores[i:i + MAX_VALORES_IN] for i in range(0, len(valores), MAX_VALORES_IN)]
+
+    def _consultar(grupo):
+        return converter(db.collection(colecao).where(campo, 'in', grupo).stream())
+
+    with ThreadPoolExecutor(max_workers=MAX_CONSULTAS_SIMULTANEAS) as executor:
+        return list(executor.map(_consultar, grupos))
+
+
+def _blocos_para_df(docs):
+    partes = [decodificar_bloco(doc.to_dict()['dados']) for doc in docs]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def ler_base_em_blocos(db, colecao, particoes=None):
+    """
+    Lê a base no formato 'blocos' (só as `particoes` indicadas, se houver).
+    Devolve o DataFrame sem os campos de controle.
+    """
+    if particoes is None:
+        return _blocos_para_df(db.collection(colecao).stream())
+    partes = _consultar_em_paralelo(db, colecao, 'particao', (int(p) for p in particoes), _blocos_para_df)
+    partes = [df for df in partes if not df.empty]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def consulta_por_fornecedor_disponivel(meta):
+    """
+    Diz se a base publicada aceita busca por fornecedor no servidor: o
+    formato 'blocos' sempre (pela partição); o formato 'documentos' só se
+    todos os documentos tiverem o campo `_forn_norm`.
+    """
+    if meta is None:
+        return False
+    return formato_base(meta) == FORMATO_BLOCOS or bool(meta.get('fornecedor_normalizado'))
+
+
+def buscar_base_por_fornecedores(db, meta, fornecedores):
+    """
+    Baixa só as linhas da base dos `fornecedores` informados (códigos já
+    normalizados, como na conciliação), com consultas 'in' de até 30
+    valores executadas em paralelo. Devolve o DataFrame sem os campos de
+    controle.
+    """
+    fornecedores = sorted(set(str(f) for f in fornecedores))
+    colecao = colecao_ativa(meta)
+    if not fornecedores:
+        return pd.DataFrame(columns=meta.get('colunas') or [])
+
+    if formato_base(meta) == FORMATO_BLOCOS:
+        particoes = particoes_dos_fornecedores(pd.Series(fornecedores))
+        df = ler_base_em_blocos(db, colecao, particoes)
+        if not df.empty:
+            # Os blocos trazem a partição inteira; fica só quem foi pedido
+            df = df[normalizar_fornecedor(df[COLUNA_PARTICAO]).isin(fornecedores)].reset_index(drop=True)
+    else:
+        partes = _consultar_em_paralelo(
+            db, colecao, CAMPO_FORNECEDOR_NORM, fornecedores,
+            lambda docs: [doc.to_dict() for doc in docs]
+        )
+        df = pd.DataFrame([registro for parte in partes for registro in parte])
+
+    if df.empty:
+        return pd.DataFrame(columns=meta.get('colunas') or [])
+    return df.drop(columns=CAMPOS_CONTROLE, errors='ignore')
+
+def _limites_de_data(data_inicio, data_fim):
+    """
+    Converte o intervalo de datas (inclusivo, em dias) para [início, fim).
+    """
+    inicio = datetime.combine(data_inicio, time.min) if data_inicio else None
+    fim = datetime.combine(data_fim, time.min) + timedelta(days=1) if data_fim else None
+    return inicio, fim
+
+
+def query_base_compras(fornecedor=None, documento=None, filial=None,
+                       valor_min=None, valor_max=None,
+                       coluna_data=None, data_inicio=None, data_fim=None,
+                       campos=None, limite=LIMITE_PAGINA_AUDITORIA, cursor=None):
+    """
+    Busca uma página da base de compras no Firestore.
+
+    Filtros de igualdade (fornecedor, documento, filial) e de intervalo
+    (valor em 'Vlr.Total'; datas em `coluna_data`, de `data_inicio` a
+    `data_fim`, inclusive) são aplicados no servidor. `campos` limita as
+    colunas baixadas. Devolve (df, cursor_seguinte): passe o cursor na
+    próxima chamada para a página seguinte; None quando não há mais.
+
+    Combinações de filtros precisam dos índices de firestore.indexes.json;
+    se faltar algum, o erro traz o link para criá-lo no console.
     """
     db = get_db()
     if db is None:
         raise Exception("Não foi possível conectar ao Firestore.")
     
-    query = db.collection(COLECAO_FIRESTORE)
+    meta = ler_metadados_base(db)
+    if formato_base(meta) == FORMATO_BLOCOS:
+        return _query_base_em_blocos(db, meta, fornecedor, documento, filial, valor_min, valor_max,
+                                     coluna_data, data_inicio, data_fim, campos, limite, cursor)
+
+    query = db.collection(colecao_ativa(meta))
     
     # IMPORTANTE: Estes nomes de colunas ('Forn_Cliente', 'Documento', 'Filial')
     # devem ser os nomes exatos das chaves no seu Firestore (ou seja, os nomes
     # das colunas limpas do seu Excel). Ajuste se necessário.
     
     if fornecedor:
-        # Assumindo que o nome da coluna no Firestore é 'Forn_Cliente'
-        query = query.where('Forn_Cliente', '==', fornecedor)
+        if meta and meta.get('fornecedor_normalizado'):
+            # Busca pelo código sem zeros à esquerda ('123' acha '000123')
+            query = query.where(CAMPO_FORNECEDOR_NORM, '==', normalizar_fornecedor(pd.Series([fornecedor]))[0])
+        else:
+            query = query.where('Forn_Cliente', '==', fornecedor)
     if documento:
         # Assumindo que o nome da coluna no Firestore é 'Documento'
         query = query.where('Documento', '==', documento)
     if filial:
         # Assumindo que o nome da coluna no Firestore é 'Filial'
         query = query.where('Filial', '==', filial)
+
+    # Intervalos: valores e datas são gravados como número e timestamp
+    campos_intervalo = []
+    if valor_min is not None:
+        query = query.where(campo(COLUNA_VALOR), '>=', float(valor_min))
+    if valor_max is not None:
+        query = query.where(campo(COLUNA_VALOR), '<=', float(valor_max))
+    if valor_min is not None or valor_max is not None:
+        campos_intervalo.append(COLUNA_VALOR)
+    inicio, fim = _limites_de_data(data_inicio, data_fim)
+    if coluna_data and (inicio or fim):
+        if inicio:
+            query = query.where(campo(coluna_data), '>=', inicio)
+        if fim:
+            query = query.where(campo(coluna_data), '<', fim)
+        campos_intervalo.append(coluna_data)
+
+    if campos:
+        # Os campos de intervalo entram na projeção: o cursor da página
+        # seguinte é montado a partir deles
+        projecao = list(dict.fromkeys(list(campos) + campos_intervalo))
+        query = query.select([campo(c) for c in projecao])
+
+    query = query.limit(limite)
+    if cursor is not None:
+        query = query.start_after(cursor)
     
-    print(f"Executando query no Firestore (Fornecedor={fornecedor}, Documento={documento}, Filial={filial})...")
-    docs = query.stream()
-    dados = [doc.to_dict() for doc in docs]
-    print(f"Query retornou {len(dados)} documentos.")
-    
-    if not dados:
-        return pd.DataFrame()
+    print(f"Executando query no Firestore (Fornecedor={fornecedor}, Documento={documento}, Filial={filial}, "
+          f"Valor={valor_min}..{valor_max}, {coluna_data}={data_inicio}..{data_fim}, limite={limite})...")
+    try:
+        docs = list(query.stream())
+    except FailedPrecondition as e:
+        # Índice composto ausente: a mensagem do Firestore traz o link de criação
+        raise ValueError(f"Esta combinação de filtros precisa de um índice no Firestore. {e.message}") from e
+    print(f"Query retornou {len(docs)} documentos.")
+
+    cursor_seguinte = docs[-1] if len(docs) == limite else None
+    if not docs:
+        return pd.DataFrame(), None
         
-    return pd.DataFrame(dados)
+    df = pd.DataFrame([doc.to_dict() for doc in docs]).drop(columns=CAMPOS_CONTROLE, errors='ignore')
+    return df, cursor_seguinte
+
+
+def _query_base_em_blocos(db, meta, fornecedor, documento, filial, valor_min, valor_max,
+                          coluna_data, data_inicio, data_fim, campos, limite, cursor):
+    """
+    Versão de `query_base_compras` para o formato 'blocos': baixa só a
+    partição do fornecedor (ou a base toda) e filtra em pandas. O cursor é
+    a posição da próxima linha; as páginas saem do resultado filtrado em
+    cache (`_base_em_blocos_filtrada`), sem baixar os blocos outra vez.
+    """
+    df = _base_em_blocos_filtrada(db, meta.get('versao'), colecao_ativa(meta),
+                                  fornecedor, documento, filial, valor_min, valor_max,
+                                  coluna_data, data_inicio, data_fim,
+                                  tuple(campos) if campos else None)
+    if df.empty:
+        return df, None
+
+    posicao = cursor or 0
+    pagina = df.iloc[posicao:posicao + limite].reset_index(drop=True)
+    cursor_seguinte = posicao + limite if posicao + limite < len(df) else None
+    print(f"Query retornou {len(pagina)} linhas (de {len(df)}).")
+    return pagina, cursor_seguinte
+
+
+@st.cache_data(ttl=TTL_CACHE_AUDITORIA_S, max_entries=MAX_FILTROS_EM_CACHE, show_spinner=False)
+def _base_em_blocos_filtrada(_db, versao, colecao, fornecedor, documento, filial, valor_min, valor_max,
+                             coluna_data, data_inicio, data_fim, campos):
+    """
+    Lê os blocos e aplica os filtros de `_query_base_em_blocos`. Fica em
+    cache por versão da base + filtros (`_db` não entra na chave): sem
+    fornecedor, a base inteira é baixada uma vez por busca, não a cada página.
+    """
+    particoes = None
+    if fornecedor:
+        particoes = particoes_dos_fornecedores(pd.Series([fornecedor]))
+    print(f"Lendo blocos da base (Fornecedor={fornecedor}, Documento={documento}, Filial={filial})...")
+    df = ler_base_em_blocos(_db, colecao, particoes)
+    if df.empty:
+        return df
+
+    filtro = pd.Series(True, index=df.index)
+    if fornecedor and COLUNA_PARTICAO in df.columns:
+        filtro &= normalizar_fornecedor(df[COLUNA_PARTICAO]) == normalizar_fornecedor(pd.Series([fornecedor]))[0]
+    for coluna, valor in (('Documento', documento), ('Filial', filial)):
+        if valor and coluna in df.columns:
+            filtro &= df[coluna] == valor
+    if COLUNA_VALOR in df.columns:
+        if valor_min is not None:
+            filtro &= df[COLUNA_VALOR] >= float(valor_min)
+        if valor_max is not None:
+            filtro &= df[COLUNA_VALOR] <= float(valor_max)
+    inicio, fim = _limites_de_data(data_inicio, data_fim)
+    if coluna_data in df.columns and (inicio or fim):
+        datas = pd.to_datetime(df[coluna_data], errors='coerce')
+        if getattr(datas.dt, 'tz', None) is not None:
+            datas = datas.dt.tz_localize(None)
+        if inicio:
+            filtro &= datas >= inicio
+        if fim:
+            filtro &= datas < fim
+
+    df = df[filtro]
+    if campos:
+        df = df[[c for c in campos if c in df.columns]]
+    return df.reset_index(drop=True)
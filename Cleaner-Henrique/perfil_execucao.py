@@ -0,0 +1,218 @@
+"""
+Perfil de execução da conciliação: tempo, CPU, memória e linhas por etapa.
+
+Cada etapa da conciliação roda dentro de `perfil.etapa(nome)`, que mede:
+  - tempo de relógio (perf_counter) e tempo de CPU do processo (process_time);
+  - pico de memória residente (RSS) durante a etapa, amostrado por uma
+    thread a cada INTERVALO_AMOSTRA_RSS segundos (psutil, se instalado,
+    senão /proc/self/statm);
+  - linhas de entrada e de saída, informadas pela própria etapa.
+
+O relatório da execução sai como dicionário (`relatorio`), como tabela
+para o Streamlit (`tabela`) e, se CONCILIADOR_LOG_PERFIL apontar para um
+arquivo, é acrescentado a ele como uma linha JSON ao fim da execução.
+
+Obs.: o tempo de CPU é do processo inteiro; no Streamlit ele inclui o que
+outras sessões fizeram em paralelo.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import psutil
+    PSUTIL_DISPONIVEL = True
+except ImportError:
+    PSUTIL_DISPONIVEL = False
+
+# --- Configurações ---
+# Arquivo JSONL onde cada execução é registrada (vazio = não registra)
+CAMINHO_LOG_PERFIL = os.environ.get('CONCILIADOR_LOG_PERFIL', '')
+INTERVALO_AMOSTRA_RSS = 0.01  # Segundos entre leituras de memória durante uma etapa
+
+
+def rss_atual():
+    """
+    Memória residente do processo, em bytes, ou None se não der para medir.
+    """
+    if PSUTIL_DISPONIVEL:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _mb(n_bytes):
+    return None if n_bytes is None else round(n_bytes / 2**20, 1)
+
+
+class _AmostradorRSS:
+    """Thread que guarda o maior RSS visto entre `iniciar` e `parar`."""
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRA_RSS):
+        self.intervalo = intervalo
+        self.pico = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            rss = rss_atual()
+            if rss is not None and rss > self.pico:
+                self.pico = rss
+
+    def iniciar(self):
+        self.pico = rss_atual()
+        if self.pico is not None:
+            self._thread = threading.Thread(target=self._amostrar, daemon=True)
+            self._thread.start()
+        return self.pico
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        rss = rss_atual()
+        if rss is not None and self.pico is not None:
+            self.pico = max(self.pico, rss)
+        return rss
+
+
+class Etapa:
+    """Medições de uma etapa. A etapa preenche `linhas_entrada`/`linhas_saida`."""
+
+    def __init__(self, nome, linhas_entrada=None):
+        self.nome = nome
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+        self.tempo_s = None
+        self.cpu_s = None
+        self.rss_inicio = None
+        self.rss_fim = None
+        self.pico_rss = None
+        self.erro = None
+
+    def como_dict(self):
+        return {
+            'etapa': self.nome,
+            'tempo_s': None if self.tempo_s is None else round(self.tempo_s, 4),
+            'cpu_s': None if self.cpu_s is None else round(self.cpu_s, 4),
+            'rss_inicio_mb': _mb(self.rss_inicio),
+            'pico_rss_mb': _mb(self.pico_rss),
+            'rss_fim_mb': _mb(self.rss_fim),
+            'linhas_entrada': self.linhas_entrada,
+            'linhas_saida': self.linhas_saida,
+            'erro': self.erro,
+        }
+
+
+class PerfilExecucao:
+    """
+    Coleta as etapas de uma execução, na ordem em que rodam.
+
+        perfil = PerfilExecucao('conciliacao')
+        with perfil.etapa('Leitura do XML') as etapa:
+            df = ler(...)
+            etapa.linhas_saida = len(df)
+        perfil.finalizar()
+    """
+
+    def __init__(self, nome='conciliacao', caminho_log=None):
+        self.nome = nome
+        self.id = uuid.uuid4().hex
+        self.inicio = datetime.now()
+        self.caminho_log = CAMINHO_LOG_PERFIL if caminho_log is None else caminho_log
+        self.etapas = []
+        self.status = 'em andamento'
+        self.tempo_total_s = None
+        self._inicio_relogio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nome, linhas_entrada=None):
+        etapa = Etapa(nome, linhas_entrada)
+        self.etapas.append(etapa)
+        amostrador = _AmostradorRSS()
+        etapa.rss_inicio = amostrador.iniciar()
+        inicio_cpu = time.process_time()
+        inicio = time.perf_counter()
+        try:
+            yield etapa
+        except BaseException as e:
+            etapa.erro = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            etapa.tempo_s = time.perf_counter() - inicio
+            etapa.cpu_s = time.process_time() - inicio_cpu
+            etapa.rss_fim = amostrador.parar()
+            etapa.pico_rss = amostrador.pico
+
+    def finalizar(self, status=None):
+        """
+        Fecha a execução ('ok', ou 'erro' se alguma etapa falhou) e, se
+        houver `caminho_log`, acrescenta o relatório ao JSONL.
+        """
+        self.tempo_total_s = time.perf_counter() - self._inicio_relogio
+        if status is None:
+            status = 'erro' if any(e.erro for e in self.etapas) else 'ok'
+        self.status = status
+        if self.caminho_log:
+            try:
+                self.registrar_jsonl(self.caminho_log)
+            except OSError as e:
+                print(f"Aviso: não foi possível gravar o perfil em '{self.caminho_log}': {e}")
+        return self.relatorio()
+
+    def relatorio(self):
+        """Relatório da execução como dicionário (serializável em JSON)."""
+        picos = [e.pico_rss for e in self.etapas if e.pico_rss is not None]
+        return {
+            'execucao': self.nome,
+            'id': self.id,
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'status': self.status,
+            'tempo_total_s': None if self.tempo_total_s is None else round(self.tempo_total_s, 4),
+            'pico_rss_mb': _mb(max(picos)) if picos else None,
+            'etapas': [e.como_dict() for e in self.etapas],
+        }
+
+    def tabela(self):
+        """Etapas em um DataFrame, para exibir no Streamlit."""
+        colunas = {
+            'etapa': 'Etapa',
+            'tempo_s': 'Tempo (s)',
+            'cpu_s': 'CPU (s)',
+            'pico_rss_mb': 'Pico RSS (MB)',
+            'linhas_entrada': 'Linhas entrada',
+            'linhas_saida': 'Linhas saída',
+        }
+        df = pd.DataFrame([e.como_dict() for e in self.etapas], columns=list(colunas) + ['erro'])
+        df[['linhas_entrada', 'linhas_saida']] = df[['linhas_entrada', 'linhas_saida']].astype('Int64')
+        if not df['erro'].notna().any():
+            df = df.drop(columns='erro')
+        return df.rename(columns=dict(colunas, erro='Erro'))
+
+    def registrar_jsonl(self, caminho):
+        """Acrescenta o relatório como uma linha em `caminho` (JSONL)."""
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with open(caminho, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.relatorio(), ensure_ascii=False) + '\n')
+
+
+class PerfilNulo:
+    """
+    Mesma interface de `PerfilExecucao.etapa`, sem medir nada (nem iniciar
+    a thread de memória). Usado quando ninguém vai ler o perfil.
+    """
+
+    def etapa(self, nome, linhas_entrada=None):
+        return nullcontext(Etapa(nome, linhas_entrada))
@@ -1,5 +1,5 @@
+import numpy as np
 import pandas as pd
-import re 
 import os
 import sys
 import io 
@@ -14,6 +14,9 @@ if SCRIPT_DIR not in sys.path:
 # --- FIM DO FIX ---
 
 from firebase_utils import get_db # <-- REMOVA O PONTO
+from base_compras_local import obter_base_compras
+from conversoes import converter_valores_brl, converter_datas
+from perfil_execucao import PerfilExecucao, PerfilNulo
 
 # --- Imports da função robusta (XML) ---
 import xml.etree.ElementTree as ET
@@ -26,11 +29,16 @@ except ImportError:
 # --- Imports para Formatação Excel ---
 try:
     from openpyxl import load_workbook
-    from openpyxl.styles import NumberFormat
     OPENPYXL_DISPONIVEL = True
 except ImportError:
     OPENPYXL_DISPONIVEL = False
 
+try:
+    import xlsxwriter
+    XLSXWRITER_DISPONIVEL = True
+except ImportError:
+    XLSXWRITER_DISPONIVEL = False
+
 # --- Configurações (NÃO MUDA) ---
 COLECAO_FIRESTORE = 'base_compras' # Nome da coleção no Firebase
 COLUNAS_CHAVE_EXCEL = {
@@ -39,128 +47,244 @@ COLUNAS_CHAVE_EXCEL = {
     'coluna_rateio': 'Rateio'
 }
 HEADER_ROW_INDEX = 1 
+NS_SPREADSHEET = 'urn:schemas-microsoft-com:office:spreadsheet'
+# Caracteres de controle inválidos em XML 1.0 (tab, \n e \r são permitidos)
+BYTES_DE_CONTROLE = bytes(range(0x00, 0x09)) + b'\x0b\x0c' + bytes(range(0x0e, 0x20))
+# Colunas da base usadas no rateio, na ordem do agrupamento, e a coluna do
+# relatório que cada uma preenche nos títulos rateados
+COLUNAS_RATEIO_DB = {
+    'Item Conta': 'Negocio?',
+    'Centro Custo': 'Centro Custo',
+    'C Contabil': 'Cta.Contabil',
+    'Loja': 'Loja',
+    'Filial': 'Filial',
+}
 ACCOUNTING_FORMAT = '_-* #,##0.00_-;-* #,##0.00_-;_-* "-"??_-;_-@_-'
+DATE_FORMAT = 'dd/mm/yyyy'
+# Colunas de data do relatório e o formato em que chegam do XML. O DateTime do
+# SpreadsheetML vem como '2024-05-10T00:00:00.000', mas nem todo exportador
+# manda os milissegundos (ou a hora): 'ISO8601' aceita todas as variantes
+FORMATOS_DATA_XML = {
+    'Data de Emissao': 'ISO8601',
+    'Data de Vencto': 'ISO8601',
+    'Vencto Real': 'ISO8601',
+}
+TAMANHO_BLOCO_EXCEL = 20_000  # Linhas convertidas por vez na escrita do relatório
 
-# --- Funções de Limpeza e Tratamento (SEM MUDANÇAS) ---
-def to_number_brl(x):
-    try:
-        if pd.isna(x): return 0.0
-        s = str(x).strip().replace(' ', '')
-        if s == "": return 0.0
-        if s.count(',') == 1 and s.count('.') > 0:
-            s = s.replace('.', '').replace(',', '.')
-        elif s.count(',') == 1:
-            s = s.replace(',', '.')
-        elif s.count('.') == 1 and s.count(',') == 0:
-            pass 
-        elif s.count('.') > 0 and s.count(',') == 0:
-            s = s.replace('.', '')
-        return float(s)
-    except Exception:
-        return 0.0
+# --- Funções de Leitura, Limpeza e Tratamento ---
+# (read_spreadsheetml lê o XML em fluxo; tratar_fornecedor e tratar_prf_parcela
+# tratam a coluna inteira de uma vez; aplicar_formatacao_excel só é usada
+# quando o XlsxWriter não está instalado.)
 
-# (Funções read_spreadsheetml, tratar_fornecedor, tratar_prf_parcela, formatar_data_br
-# e aplicar_formatacao_excel permanecem IDÊNTICAS às da sua última versão.
-# Apenas copie e cole elas aqui para economizar espaço.)
+class _SemCaracteresDeControle:
+    """
+    Envolve um arquivo binário e remove, bloco a bloco, os caracteres de
+    controle que o XML não aceita (o Protheus às vezes os grava no texto).
+    Em UTF-8, latin-1 e cp1252 esses bytes nunca fazem parte de outro
+    caractere, então dá para removê-los sem decodificar.
+    """
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
 
-def read_spreadsheetml(path, sheet_name, header_row=HEADER_ROW_INDEX):
-    # ... (cole sua função robusta aqui) ...
-    is_lxml = False
+    def read(self, n=-1):
+        return self.arquivo.read(n).translate(None, BYTES_DE_CONTROLE)
+
+class _LeitorDeMemoria:
+    """
+    Leitura em blocos de um buffer já em memória (bytes, bytearray,
+    memoryview): cada read() copia só o bloco pedido, nunca o XML inteiro.
+    """
+    def __init__(self, dados):
+        self.dados = memoryview(dados).cast('B')
+        self.posicao = 0
+
+    def read(self, n=-1):
+        fim = len(self.dados) if n is None or n < 0 else min(self.posicao + n, len(self.dados))
+        bloco = self.dados[self.posicao:fim].tobytes()
+        self.posicao = fim
+        return bloco
+
+def _abrir_xml(origem):
+    """
+    Devolve (arquivo binário para leitura, se deve ser fechado no fim).
+    Aceita caminho, bytes/bytearray/memoryview ou objeto com read() (como o
+    arquivo do st.file_uploader), sem gravar em disco nem copiar o conteúdo.
+    """
+    if isinstance(origem, (str, os.PathLike)):
+        return open(origem, 'rb'), True
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        return _LeitorDeMemoria(origem), False
+    if hasattr(origem, 'seek'):
+        origem.seek(0)
+    return origem, False
+
+def _descrever_origem_xml(origem):
+    """
+    Texto curto para os logs: o caminho, o nome do arquivo enviado ou o
+    tamanho do buffer.
+    """
+    if isinstance(origem, (str, os.PathLike)):
+        return os.fspath(origem)
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        return f"XML em memória ({memoryview(origem).nbytes:,} bytes)"
+    return getattr(origem, 'name', None) or "XML em memória"
+
+def _nomes(ns):
+    """
+    Tags do SpreadsheetML com o namespace do arquivo ('' se ele não usar
+    namespace) e atributos com o prefixo ss: (sem ele, o leitor tenta o
+    nome puro).
+    """
+    prefixo = f'{{{ns}}}' if ns else ''
+    nomes = {nome: prefixo + nome for nome in ('Worksheet', 'Table', 'Row', 'Cell', 'Data')}
+    nomes.update({nome: f'{{{NS_SPREADSHEET}}}{nome}' for nome in ('Name', 'Index')})
+    return nomes
+
+def _iterparse_filtrado(arquivo):
+    """
+    Eventos de início/fim do XML (sem os caracteres de controle), com o lxml
+    em modo recover quando disponível. No lxml só são gerados eventos das
+    tags usadas pelo leitor; as células são lidas a partir de cada linha.
+    """
+    filtrado = _SemCaracteresDeControle(arquivo)
     if LXML_DISPONIVEL:
-        try:
-            parser = etree.XMLParser(recover=True, encoding='utf-8')
-            tree = etree.parse(path, parser=parser)
-            root = tree.getroot()
-            is_lxml = True
-        except Exception:
-            is_lxml = False 
-    if not is_lxml:
-        try:
-            with open(path, 'rb') as f: raw = f.read()
-        except Exception:
-            path.seek(0); raw = path.read()
-        text = None
-        for enc in ('utf-8', 'utf-8-sig', 'latin-1', 'cp1252'):
-            try: text = raw.decode(enc); break
-            except Exception: continue
-        if text is None: text = raw.decode('latin-1', errors='replace')
-        text_clean = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F]', '', text)
-        root = ET.fromstring(text_clean)
-    ns_uri = None
-    if root.tag.startswith('{'): ns_uri = root.tag.split('}')[0].strip('{')
-    def qname(tag):
-        if is_lxml and ns_uri is None and tag in ['Workbook', 'Worksheet', 'Table', 'Row', 'Cell', 'Data']: return tag
-        return f"{{{ns_uri}}}{tag}" if ns_uri else tag
-    worksheets = root.findall(".//" + qname("Worksheet"))
-    target_ws = None
-    for ws in worksheets:
-        if ws.attrib.get(f'{{{ns_uri}}}Name') == sheet_name or ws.attrib.get('Name') == sheet_name:
-            target_ws = ws; break
-    if target_ws is None: raise RuntimeError(f"Planilha '{sheet_name}' não encontrada.")
-    table = target_ws.find(qname("Table"))
-    if table is None: raise RuntimeError("Tag <Table> não encontrada.")
-    rows = []
-    for row in table.findall(qname("Row")):
-        cells = []; col_index = 0
-        for c in row.findall(qname("Cell")):
-            idx_attr = c.attrib.get(f"{{{ns_uri}}}Index") or c.attrib.get("Index")
-            if idx_attr:
-                try:
-                    idx = int(idx_attr) - 1
-                    while col_index < idx: cells.append(""); col_index += 1
-                except Exception: pass
-            data = c.find(qname("Data")); val = ""
-            if data is not None and data.text is not None: val = data.text
-            cells.append(val); col_index += 1
-        rows.append(cells)
-    if len(rows) <= header_row: return pd.DataFrame() 
-    maxcols = max(len(r) for r in rows)
-    norm_rows = [r + [""] * (maxcols - len(r)) for r in rows]
-    header = norm_rows[header_row]
-    cols = [str(h).replace('\n', ' ').strip() if h is not None else "" for h in header]
-    data_rows = norm_rows[header_row + 1:]
-    return pd.DataFrame(data_rows, columns=cols)
-
-def tratar_fornecedor(valor_coluna):
-    # ... (cole sua função aqui) ...
-    try:
-        partes = str(valor_coluna).split('-', 2)
-        if len(partes) == 3:
-            codigo = partes[0].strip()
-            loja = partes[1].strip()
-            nome = partes[2].strip()
-            if codigo == "": return pd.Series([None, loja, nome])
-            return pd.Series([codigo, loja, nome])
-        else:
-            return pd.Series([None, None, str(valor_coluna).strip()])
-    except Exception as e:
-        return pd.Series([None, None, str(valor_coluna).strip()])
+        tags = [nome for ns in (NS_SPREADSHEET, '') for chave, nome in _nomes(ns).items()
+                if chave in ('Worksheet', 'Table', 'Row')]
+        return etree.iterparse(filtrado, events=('start', 'end'), tag=tags, recover=True, huge_tree=True)
+    return ET.iterparse(filtrado, events=('start', 'end'))
 
-def tratar_prf_parcela(valor_coluna):
-    # ... (cole sua função aqui) ...
-    try:
-        s = str(valor_coluna).strip()
-        match = re.search(r'([\w\d]+)\s*-\s*([\d]+)\s*-', s)
-        if match:
-            parcela = match.group(1).strip()
-            documento = match.group(2).strip()
-            return pd.Series([parcela, documento])
-        else:
-            return pd.Series([None, None])
-    except:
-        return pd.Series([None, None])
+def _liberar(elem):
+    """
+    Esvazia um elemento já lido e solta os irmãos anteriores, para a árvore
+    montada pelo iterparse não crescer com o arquivo.
+    """
+    elem.clear()
+    if LXML_DISPONIVEL:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+def read_spreadsheetml(path, sheet_name, header_row=HEADER_ROW_INDEX):
+    """
+    Lê a planilha `sheet_name` de um XML SpreadsheetML (Excel 2003) para um
+    DataFrame de textos, com a linha `header_row` como cabeçalho. `path`
+    pode ser um caminho, bytes/memoryview ou um arquivo aberto.
 
-def formatar_data_br(data_str):
-    # ... (cole sua função aqui) ...
-    if pd.isna(data_str) or data_str == '': return None 
+    O arquivo é lido em fluxo (iterparse): as células vão direto para uma
+    lista por coluna, as linhas já lidas são descartadas e a leitura para
+    assim que a planilha termina. Células puladas com ss:Index e linhas mais
+    curtas ficam com "".
+    """
+    arquivo, fechar = _abrir_xml(path)
+
+    nomes = _nomes(NS_SPREADSHEET)
+    achou_planilha = achou_tabela = dentro_da_planilha = False
+    n_linhas = 0            # Linhas da tabela (cabeçalho e anteriores incluídos)
+    max_colunas = 0
+    cabecalho = []
+    colunas = []            # Uma lista de textos por coluna, só linhas de dados
     try:
-        dt = pd.to_datetime(data_str)
-        return dt.strftime('%d/%m/%Y')
-    except Exception:
-        return data_str
+        for evento, elem in _iterparse_filtrado(arquivo):
+            tag = elem.tag
+            if evento == 'start':
+                if tag.endswith('Worksheet') and not achou_planilha:
+                    # O namespace do arquivo vale para as tags e os atributos ss:
+                    nomes = _nomes(tag[1:tag.index('}')] if tag.startswith('{') else '')
+                    nome_planilha = elem.get(nomes['Name']) or elem.get('Name')
+                    dentro_da_planilha = achou_planilha = nome_planilha == sheet_name
+                elif dentro_da_planilha and tag == nomes['Table']:
+                    achou_tabela = True
+                continue
+
+            if tag == nomes['Row']:
+                if dentro_da_planilha:
+                    celulas = []
+                    for celula in elem.iterfind(nomes['Cell']):
+                        indice = celula.get(nomes['Index']) or celula.get('Index')
+                        if indice:
+                            try:
+                                celulas.extend([""] * (int(indice) - 1 - len(celulas)))
+                            except ValueError:
+                                pass
+                        celulas.append(celula.findtext(nomes['Data']) or "")
+
+                    max_colunas = max(max_colunas, len(celulas))
+                    if n_linhas == header_row:
+                        cabecalho = celulas
+                    elif n_linhas > header_row:
+                        n_dados = n_linhas - header_row - 1
+                        for i, valor in enumerate(celulas):
+                            if i == len(colunas):
+                                colunas.append([""] * n_dados)
+                            colunas[i].append(valor)
+                        for coluna in colunas[len(celulas):]:
+                            coluna.append("")
+                    n_linhas += 1
+                _liberar(elem)
+            elif tag == nomes['Worksheet']:
+                if dentro_da_planilha:
+                    break  # Planilha lida: o resto do arquivo nem é processado
+                _liberar(elem)
+    finally:
+        if fechar:
+            arquivo.close()
+
+    if not achou_planilha: raise RuntimeError(f"Planilha '{sheet_name}' não encontrada.")
+    if not achou_tabela: raise RuntimeError("Tag <Table> não encontrada.")
+    if n_linhas <= header_row: return pd.DataFrame()
+
+    n_dados = n_linhas - header_row - 1
+    colunas += [[""] * n_dados for _ in range(max_colunas - len(colunas))]
+    cabecalho = cabecalho + [""] * (max_colunas - len(cabecalho))
+    cols = [str(h).replace('\n', ' ').strip() for h in cabecalho]
+    if n_dados == 0:
+        return pd.DataFrame([], columns=cols)
+    df = pd.DataFrame({i: coluna for i, coluna in enumerate(colunas)}, index=pd.RangeIndex(n_dados))
+    df.columns = cols
+    return df
+
+def _como_texto(serie):
+    """
+    str() de cada valor, como nas antigas versões linha a linha: nulos viram
+    'None'/'nan', e não ficam vazios.
+    """
+    textos = serie.astype('str')
+    nulos = textos.isna()
+    if nulos.any():
+        textos[nulos] = serie[nulos].map(str)
+    return textos
+
+def tratar_fornecedor(serie):
+    """
+    Separa 'Código - Loja - Nome' (coluna 'Codigo-Nome do Fornecedor') em
+    três colunas, para a coluna inteira de uma vez. Sem os três pedaços,
+    o texto todo vai para o nome; código vazio vira None.
+    """
+    textos = _como_texto(serie)
+    partes = textos.str.split('-', n=2, expand=True)
+    if partes.shape[1] < 3:
+        # Nenhuma linha tem os três pedaços
+        nenhum = pd.Series([None] * len(serie), index=serie.index, dtype=object)
+        return pd.DataFrame({0: nenhum, 1: nenhum, 2: textos.str.strip().astype(object)})
+    tem_tres = partes[2].notna()
+
+    codigo = partes[0].str.strip()
+    codigo = codigo.astype(object).where(tem_tres & (codigo != ''), None)
+    loja = partes[1].str.strip().astype(object).where(tem_tres, None)
+    nome = partes[2].where(tem_tres, textos).str.strip().astype(object)
+    return pd.DataFrame({0: codigo, 1: loja, 2: nome}, index=serie.index)
+
+def tratar_prf_parcela(serie):
+    """
+    Extrai Parcela e Documento de 'Prf-Numero Parcela' ('A01-123456-...'),
+    para a coluna inteira de uma vez. Sem o padrão, as duas ficam None.
+    """
+    textos = _como_texto(serie).str.strip().astype(object)
+    # Em object o regex é o `re` do Python (\w e \d com Unicode, como antes)
+    partes = textos.str.extract(r'([\w\d]+)\s*-\s*([\d]+)\s*-', expand=True)
+    partes.columns = [0, 1]
+    return partes.astype(object).where(partes.notna(), None)
 
 def aplicar_formatacao_excel(workbook, colunas_formato):
-    # ... (cole sua função aqui) ...
     print(f"Aplicando formatação final (Contábil e Data) no Workbook...")
     if not OPENPYXL_DISPONIVEL:
         print("Aviso: OpenPyXL não disponível. Pulando formatação.")
@@ -178,6 +302,9 @@ def aplicar_formatacao_excel(workbook, colunas_formato):
             for col_name, col_idx in col_indices.items():
                 cell = row[col_idx - 1] 
                 if cell.value is not None:
+                    if cell.is_date:
+                        cell.number_format = colunas_formato[col_name]
+                        continue
                     try:
                         cell.value = float(cell.value)
                         cell.number_format = colunas_formato[col_name]
@@ -190,61 +317,311 @@ def aplicar_formatacao_excel(workbook, colunas_formato):
         return workbook
 
 
+# --- ESCRITA DO RELATÓRIO (XlsxWriter) ---
+
+def _numero_ou_valor(valor):
+    try:
+        return float(valor)
+    except (ValueError, TypeError):
+        return valor
+
+def _valores_contabeis(serie):
+    """
+    Valores de uma coluna contábil prontos para o Excel: o que `float()`
+    aceita vira número (como fazia `aplicar_formatacao_excel`), o resto
+    continua como texto. Vazios viram None.
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        valores = serie.to_numpy(dtype='float64', na_value=np.nan).astype(object)
+    else:
+        try:
+            # Caminho rápido: a coluna inteira é numérica
+            valores = serie.astype('float64').to_numpy().astype(object)
+        except (ValueError, TypeError):
+            valores = serie.to_numpy(dtype=object, copy=True)
+            vazios = pd.isna(valores)
+            valores[~vazios] = [_numero_ou_valor(v) for v in valores[~vazios]]
+    valores[pd.isna(valores)] = None
+    return valores.tolist()
+
+def _valores_excel(serie):
+    valores = serie.to_numpy(dtype=object, copy=True)
+    valores[pd.isna(valores)] = None
+    return valores.tolist()
+
+def gerar_relatorio_excel(df, colunas_formato, colunas_data=()):
+    """
+    Grava o relatório final em uma única passada, com o `constant_memory`
+    do XlsxWriter: as linhas vão para a planilha em ordem, em blocos de
+    TAMANHO_BLOCO_EXCEL, direto das colunas do DataFrame.
+
+    As colunas de `colunas_formato` recebem o formato numérico indicado
+    (valores que não viram número ficam como texto); as de `colunas_data`
+    que forem datetime saem como data do Excel em DATE_FORMAT. O cabeçalho
+    tem o mesmo estilo do `to_excel` do pandas.
+
+    Devolve um BytesIO posicionado no início.
+    """
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': DATE_FORMAT,
+        # Textos do relatório são gravados como texto, sem virar fórmula/link
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'nan_inf_to_errors': True,
+    })
+    worksheet = workbook.add_worksheet('Sheet1')
+
+    colunas = list(df.columns)
+    header_format = workbook.add_format({
+        'bold': True, 'border': 1, 'align': 'center', 'valign': 'top',
+    })
+    formatos = {}
+    for col, num_format in colunas_formato.items():
+        if col in colunas:
+            formatos[col] = workbook.add_format({'num_format': num_format})
+    formato_data = workbook.add_format({'num_format': DATE_FORMAT})
+    for col in colunas_data:
+        if col in colunas and pd.api.types.is_datetime64_any_dtype(df[col]):
+            formatos[col] = formato_data
+
+    # Formato por coluna: as células gravadas sem formato herdam o da coluna
+    for i, col in enumerate(colunas):
+        worksheet.set_column(i, i, len(str(col)) + 2, formatos.get(col))
+
+    worksheet.write_row(0, 0, colunas, header_format)
+
+    for inicio in range(0, len(df), TAMANHO_BLOCO_EXCEL):
+        bloco = df.iloc[inicio:inicio + TAMANHO_BLOCO_EXCEL]
+        valores_colunas = []
+        for col in colunas:
+            if col in colunas_formato:
+                valores_colunas.append(_valores_contabeis(bloco[col]))
+            else:
+                valores_colunas.append(_valores_excel(bloco[col]))
+
+        for j, linha in enumerate(zip(*valores_colunas), start=inicio + 1):
+            worksheet.write_row(j, 0, linha)
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+# --- MOTOR DE RATEIO ---
+
+def _chaves_inteiras(forn_xml, doc_xml, forn_db, doc_db):
+    """
+    Fatoriza (fornecedor, documento) num único int64, para o join ser feito
+    com uma coluna inteira em vez de duas de texto. Os códigos vêm só dos
+    valores do XML: linha da base com fornecedor ou documento que não está
+    no XML recebe -1.
+    """
+    codigos_forn, unicos_forn = pd.factorize(forn_xml)
+    codigos_doc, unicos_doc = pd.factorize(doc_xml)
+    n_docs = max(len(unicos_doc), 1)
+    chave_xml = codigos_forn.astype(np.int64) * n_docs + codigos_doc
+
+    forn_na_base = pd.Index(unicos_forn).get_indexer(forn_db)
+    doc_na_base = pd.Index(unicos_doc).get_indexer(doc_db)
+    chave_db = np.where((forn_na_base >= 0) & (doc_na_base >= 0),
+                        forn_na_base.astype(np.int64) * n_docs + doc_na_base, -1)
+    return chave_xml, chave_db
+
+def _juntar_partes(sem_rateio, com_rateio):
+    """
+    Empilha os valores de uma coluna para os títulos sem rateio e as linhas
+    de rateio, na ordem do relatório.
+    """
+    return pd.concat([pd.Series(sem_rateio), pd.Series(com_rateio)], ignore_index=True)
+
+def calcular_rateio(df_xml, df_compras, col_forn_db, col_doc_db, perfil=None):
+    """
+    Cruza os títulos do XML com a base de compras por (Código, Documento).
+
+    Título com até uma linha na base: sai como está, com 'Vlr Rateado' =
+    'Titulos a vencer Valor nominal' e a 'Filial' da linha encontrada.
+    Título com várias linhas (rateio): uma linha por (Item Conta, Centro
+    Custo, C Contabil, Loja, Filial), com o valor pago proporcional ao
+    'Vlr.Total' da combinação sobre o total do documento.
+
+    Só as colunas da base usadas no rateio entram no join, e as colunas do
+    XML são recolocadas no fim pelo `_xml_row_id`, numa única cópia. Devolve
+    o relatório com as colunas de df_xml + 'Vlr Rateado' e 'Filial'.
+
+    Com `perfil` (PerfilExecucao), cada etapa (pré-cálculo, merge,
+    agrupamento, consolidação) é medida separadamente.
+    """
+    perfil = perfil if perfil is not None else PerfilNulo()
+    colunas_finais_xml = list(df_xml.columns) + ['Vlr Rateado', 'Filial']
+
+    with perfil.etapa('Pré-cálculo do rateio', linhas_entrada=len(df_compras)) as etapa:
+        valor_pago = converter_valores_brl(df_xml['Titulos a vencer Valor nominal']).to_numpy()
+        chave_xml, chave_db = _chaves_inteiras(df_xml['Código'], df_xml['Documento'],
+                                               df_compras[col_forn_db], df_compras[col_doc_db])
+
+        # Só as linhas da base com documentos deste XML, e só as colunas do rateio
+        colunas_db = [col for col in COLUNAS_RATEIO_DB if col in df_compras.columns]
+        no_xml = np.isin(chave_db, chave_xml)
+        compras = df_compras.loc[no_xml, ['Vlr.Total'] + colunas_db].reset_index(drop=True)
+        compras['_chave'] = chave_db[no_xml]
+
+        print("Pré-calculando contagem e soma (custo) de cada documento...")
+        grupos = compras.groupby('_chave', sort=False)['Vlr.Total']
+        compras['db_match_count'] = grupos.transform('size')
+        compras['Soma_Doc'] = grupos.transform('sum')
+        por_documento = compras.drop_duplicates('_chave').set_index('_chave')
+        n_linhas_db = por_documento['db_match_count'].reindex(chave_xml).fillna(0).to_numpy()
+
+        # --- Sem rateio (nenhuma ou uma linha na base) ---
+        print("Separando linhas com e sem rateio...")
+        sem_rateio = n_linhas_db <= 1
+        posicoes_sem = np.flatnonzero(sem_rateio)
+        if 'Filial' in por_documento.columns:
+            filial_sem = por_documento['Filial'].reindex(chave_xml[sem_rateio]).reset_index(drop=True)
+        else:
+            filial_sem = pd.Series(np.nan, index=range(len(posicoes_sem)))
+        etapa.linhas_saida = len(compras)
+
+    # --- Com rateio: agrupa só as colunas da base ---
+    com_rateio = ~sem_rateio
+    if not com_rateio.any():
+        print("Nenhum título com rateio (múltiplas linhas) foi encontrado na base.")
+        with perfil.etapa('Consolidação', linhas_entrada=len(df_xml)) as etapa:
+            df_final = df_xml.take(posicoes_sem).reset_index(drop=True)
+            df_final['Vlr Rateado'] = valor_pago[posicoes_sem]
+            df_final['Filial'] = filial_sem
+            etapa.linhas_saida = len(df_final)
+        return df_final[colunas_finais_xml]
+
+    print("Agrupando e somando títulos rateados...")
+    titulos = pd.DataFrame({
+        '_xml_row_id': df_xml['_xml_row_id'].to_numpy()[com_rateio],
+        '_chave': chave_xml[com_rateio],
+        'Valor_Pago_Num': valor_pago[com_rateio],
+    })
+    with perfil.etapa('Merge', linhas_entrada=len(titulos)) as etapa:
+        pares = titulos.merge(compras.drop(columns='db_match_count'), on='_chave', how='inner')
+        etapa.linhas_saida = len(pares)
+
+    grouping_keys = ['_xml_row_id'] + colunas_db
+    print(f"Agrupando rateios por {grouping_keys}...")
+    with perfil.etapa('Agrupamento', linhas_entrada=len(pares)) as etapa:
+        df_agrupado = pares.groupby(grouping_keys, as_index=False).agg(
+            **{'Valor Original': ('Vlr.Total', 'sum'),
+               'Soma_Doc': ('Soma_Doc', 'first'),
+               'Valor_Pago_Num': ('Valor_Pago_Num', 'first')}
+        )
+        del titulos, pares, compras, grupos  # Libera os intermediários antes de montar o relatório
+        soma_doc = df_agrupado['Soma_Doc'].to_numpy()
+        proporcao = np.divide(df_agrupado['Valor Original'].to_numpy(), soma_doc,
+                              out=np.zeros(len(df_agrupado)), where=soma_doc != 0)
+        etapa.linhas_saida = len(df_agrupado)
+
+    # --- Relatório: sem rateio na ordem do XML, depois os rateios ---
+    print("Consolidando relatório final...")
+    with perfil.etapa('Consolidação', linhas_entrada=len(posicoes_sem) + len(df_agrupado)) as etapa:
+        posicoes_com = pd.Index(df_xml['_xml_row_id']).get_indexer(df_agrupado['_xml_row_id'])
+        df_final = df_xml.take(np.concatenate([posicoes_sem, posicoes_com])).reset_index(drop=True)
+        df_final['Vlr Rateado'] = np.concatenate([valor_pago[posicoes_sem],
+                                                  proporcao * df_agrupado['Valor_Pago_Num'].to_numpy()])
+        if 'Valor Original' in df_final.columns:
+            df_final['Valor Original'] = _juntar_partes(df_xml['Valor Original'].to_numpy()[posicoes_sem],
+                                                        df_agrupado['Valor Original'])
+        for col_db, col_relatorio in COLUNAS_RATEIO_DB.items():
+            if col_db not in df_agrupado.columns:
+                continue
+            if col_relatorio == 'Filial':
+                df_final['Filial'] = _juntar_partes(filial_sem, df_agrupado['Filial'])
+            elif col_relatorio in df_final.columns:
+                df_final[col_relatorio] = _juntar_partes(df_xml[col_relatorio].iloc[posicoes_sem], df_agrupado[col_db])
+        if 'Filial' not in df_final.columns:
+            df_final['Filial'] = np.nan
+        etapa.linhas_saida = len(df_final)
+    return df_final[colunas_finais_xml]
+
+
 # --- FUNÇÃO PRINCIPAL (MODIFICADA PARA LER DO FIREBASE) ---
 
-def rodar_conciliacao_streamlit(caminho_arquivo_xml):
+def rodar_conciliacao_streamlit(caminho_arquivo_xml, perfil=None):
     """
     Executa a lógica de conciliação.
     AGORA LÊ a base de compras do FIREBASE.
+    O XML pode vir como caminho, bytes/memoryview ou o próprio arquivo do
+    upload (lido direto da memória, sem arquivo temporário).
+
+    Cada etapa é medida (tempo, CPU, pico de memória, linhas) em `perfil`
+    (PerfilExecucao; um novo é criado se não for informado). Ao fim, com
+    sucesso ou erro, o perfil é finalizado e, se CONCILIADOR_LOG_PERFIL
+    estiver definido, registrado no JSONL.
     """
+    perfil = perfil if perfil is not None else PerfilExecucao('conciliacao')
+    try:
+        resultado = _executar_conciliacao(caminho_arquivo_xml, perfil)
+    except Exception:
+        perfil.finalizar('erro')
+        raise
+    perfil.finalizar()
+    print("\nTempo por etapa:")
+    print(perfil.tabela().to_string(index=False))
+    return resultado
+
+def _executar_conciliacao(caminho_arquivo_xml, perfil):
 
-    # --- NOVO: Download do Arquivo B (do Firebase) ---
     print("Iniciando a conciliação...")
-    print(f"Conectando ao Firebase para baixar a '{COLECAO_FIRESTORE}'...")
-    db = get_db()
-    if db is None:
-        raise Exception("Não foi possível conectar ao Firestore.")
-    
-    docs_stream = db.collection(COLECAO_FIRESTORE).stream()
-    dados_compras = [doc.to_dict() for doc in docs_stream]
-    
-    if not dados_compras:
-        raise Exception(f"Nenhum dado encontrado em '{COLECAO_FIRESTORE}'. Você já carregou a Base de Compras (Passo 1)?")
-    
-    df_compras = pd.DataFrame(dados_compras)
-    print(f"{len(df_compras)} registros da Base de Compras baixados do Firebase.")
 
     # --- 1. Leitura e Limpeza do Arquivo A (XML) ---
-    # (Esta parte é idêntica à sua lógica anterior)
-    print(f"Lendo '{caminho_arquivo_xml}'...")
-    try:
-        df_xml = read_spreadsheetml(caminho_arquivo_xml, 
-                                  sheet_name="2-Titulos a pagar", 
-                                  header_row=1)
-        if df_xml.empty:
-            raise Exception("O parser 'read_spreadsheetml' retornou um DataFrame vazio.")
-        df_xml.columns = [str(c).replace('\n', ' ').strip() for c in df_xml.columns]
-        df_xml['_xml_row_id'] = range(len(df_xml))
-    except Exception as e:
-        print(f"Erro ao ler o XML com 'read_spreadsheetml': {e}")
-        raise e
+    # (O XML é lido antes da base: os fornecedores dele limitam o que é baixado)
+    print(f"Lendo '{_descrever_origem_xml(caminho_arquivo_xml)}'...")
+    with perfil.etapa('Leitura do XML') as etapa:
+        try:
+            df_xml = read_spreadsheetml(caminho_arquivo_xml, 
+                                      sheet_name="2-Titulos a pagar", 
+                                      header_row=1)
+            if df_xml.empty:
+                raise Exception("O parser 'read_spreadsheetml' retornou um DataFrame vazio.")
+            df_xml.columns = [str(c).replace('\n', ' ').strip() for c in df_xml.columns]
+            df_xml['_xml_row_id'] = range(len(df_xml))
+        except Exception as e:
+            print(f"Erro ao ler o XML com 'read_spreadsheetml': {e}")
+            raise e
+        etapa.linhas_saida = len(df_xml)
 
     print("Arquivo XML lido. Tratando colunas-chave...")
-    df_xml[['Código', 'Loja', 'Nome do Fornecedor']] = \
-        df_xml['Codigo-Nome do Fornecedor'].apply(tratar_fornecedor)
-    df_xml[['Parcela', 'Documento']] = \
-        df_xml['Prf-Numero Parcela'].apply(tratar_prf_parcela)
-    df_xml.dropna(subset=['Documento', 'Parcela'], inplace=True)
-    colunas_texto_xml = ['Código', 'Documento', 'Parcela', 'Loja', 'Centro Custo', 'Cta.Contabil', 'Negocio?']
-    for col in colunas_texto_xml:
-        if col in df_xml.columns:
-            df_xml[col] = df_xml[col].astype(str).str.strip().fillna('')
+    with perfil.etapa('Normalização de chaves (XML)', linhas_entrada=len(df_xml)) as etapa:
+        df_xml[['Código', 'Loja', 'Nome do Fornecedor']] = \
+            tratar_fornecedor(df_xml['Codigo-Nome do Fornecedor'])
+        df_xml[['Parcela', 'Documento']] = \
+            tratar_prf_parcela(df_xml['Prf-Numero Parcela'])
+        df_xml.dropna(subset=['Documento', 'Parcela'], inplace=True)
+        colunas_texto_xml = ['Código', 'Documento', 'Parcela', 'Loja', 'Centro Custo', 'Cta.Contabil', 'Negocio?']
+        for col in colunas_texto_xml:
+            if col in df_xml.columns:
+                df_xml[col] = df_xml[col].astype(str).str.strip().fillna('')
+        df_xml['Código'] = df_xml['Código'].astype(str).str.lstrip('0').str.strip().fillna('')
+        df_xml['Documento'] = df_xml['Documento'].astype(str).str.lstrip('0').str.strip().fillna('')
+        etapa.linhas_saida = len(df_xml)
     
-    colunas_finais_xml = list(df_xml.columns) + ['Vlr Rateado', 'Filial']
-    xml_keys = ['Código', 'Documento'] 
+
+    # --- NOVO: Download do Arquivo B (do Firebase) ---
+    print(f"Conectando ao Firebase para buscar a '{COLECAO_FIRESTORE}'...")
+    with perfil.etapa('Download da base (Firestore)') as etapa:
+        db = get_db()
+        if db is None:
+            raise Exception("Não foi possível conectar ao Firestore.")
+        
+        # Snapshot local da base, ou só as linhas dos fornecedores deste XML
+        fornecedores_xml = df_xml['Código'].unique()
+        df_compras = obter_base_compras(db, fornecedores=fornecedores_xml)
+        
+        if df_compras.empty and len(df_compras.columns) == 0:
+            raise Exception(f"Nenhum dado encontrado em '{COLECAO_FIRESTORE}'. Você já carregou a Base de Compras (Passo 1)?")
+        etapa.linhas_saida = len(df_compras)
+    
+    print(f"{len(df_compras)} registros da Base de Compras carregados.")
 
     # --- 2. Preparação do Arquivo B (DataFrame do Firebase) ---
-    # (Esta parte é idêntica à sua lógica anterior)
     
     col_forn_db = COLUNAS_CHAVE_EXCEL['codigo_fornecedor']
     col_doc_db = COLUNAS_CHAVE_EXCEL['numero_documento']
@@ -252,142 +629,48 @@ def rodar_conciliacao_streamlit(caminho_arquivo_xml):
     if col_forn_db not in df_compras.columns or col_doc_db not in df_compras.columns:
         raise ValueError(f"DataFrame 'df_compras' do Firebase não contém colunas-chave: {col_forn_db}, {col_doc_db}")
 
-    df_compras[col_forn_db] = df_compras[col_forn_db].astype(str).str.lstrip('0').str.strip().fillna('')
-    df_compras[col_doc_db] = df_compras[col_doc_db].astype(str).str.lstrip('0').str.strip().fillna('')
-    df_xml['Código'] = df_xml['Código'].astype(str).str.lstrip('0').str.strip().fillna('')
-    df_xml['Documento'] = df_xml['Documento'].astype(str).str.lstrip('0').str.strip().fillna('')
-    
-    colunas_texto_db = ['Centro Custo', 'C Contabil', 'Item Conta', 'Loja', 'Filial']
-    for col in colunas_texto_db:
-        if col in df_compras.columns:
-            df_compras[col] = df_compras[col].astype(str).str.strip().fillna('')
-    
-    # Garante que Vlr.Total é numérico (o Firebase deve ter mantido, mas por via das dúvidas)
-    if 'Vlr.Total' in df_compras.columns:
-        df_compras['Vlr.Total'] = pd.to_numeric(df_compras['Vlr.Total'], errors='coerce').fillna(0.0)
-    else:
-        print("Aviso: Coluna 'Vlr.Total' não encontrada no df_compras do Firebase.")
-        df_compras['Vlr.Total'] = 0.0
-    
-    print("Pré-calculando contagem de rateios...")
-    db_counts = df_compras.groupby([col_forn_db, col_doc_db]).size().to_frame('db_match_count')
-    print("Pré-calculando soma total (custo) do rateio...")
-    db_soma_doc = df_compras.groupby([col_forn_db, col_doc_db])['Vlr.Total'].sum().to_frame('Soma_Doc')
-    df_compras = df_compras.merge(db_counts, left_on=[col_forn_db, col_doc_db], right_index=True, how='left')
-    df_compras = df_compras.merge(db_soma_doc, left_on=[col_forn_db, col_doc_db], right_index=True, how='left')
+    with perfil.etapa('Normalização de chaves (base)', linhas_entrada=len(df_compras)) as etapa:
+        df_compras[col_forn_db] = df_compras[col_forn_db].astype(str).str.lstrip('0').str.strip().fillna('')
+        df_compras[col_doc_db] = df_compras[col_doc_db].astype(str).str.lstrip('0').str.strip().fillna('')
+        
+        colunas_texto_db = ['Centro Custo', 'C Contabil', 'Item Conta', 'Loja', 'Filial']
+        for col in colunas_texto_db:
+            if col in df_compras.columns:
+                df_compras[col] = df_compras[col].astype(str).str.strip().fillna('')
         
+        # Garante que Vlr.Total é numérico (o Firebase deve ter mantido, mas por via das dúvidas)
+        if 'Vlr.Total' in df_compras.columns:
+            df_compras['Vlr.Total'] = pd.to_numeric(df_compras['Vlr.Total'], errors='coerce').fillna(0.0)
+        else:
+            print("Aviso: Coluna 'Vlr.Total' não encontrada no df_compras do Firebase.")
+            df_compras['Vlr.Total'] = 0.0
+        etapa.linhas_saida = len(df_compras)
+    
     print(f"{len(df_compras)} registros da base de compras prontos.")
 
-    # --- 3. A Lógica Central (Merge) ---
-    # (Esta parte é idêntica à sua lógica anterior)
-    print("Iniciando a conciliação (merge)...")
-    df_merged = pd.merge(
-        df_xml,
-        df_compras,
-        left_on=xml_keys,
-        right_on=[col_forn_db, col_doc_db],
-        how='left', 
-        indicator=True,
-        suffixes=('_xml', '_db') 
-    )
-    df_merged['db_match_count'] = df_merged['db_match_count'].fillna(0)
-    df_merged['Soma_Doc'] = df_merged['Soma_Doc'].fillna(0)
-
-    # --- 4. Separação (Lógica idêntica) ---
-    print("Separando linhas com e sem rateio...")
-    def renomear_colunas(df):
-        cols_para_renomear = {col: col.replace('_xml', '') for col in df.columns if col.endswith('_xml')}
-        df.rename(columns=cols_para_renomear, inplace=True)
-        return df
-
-    condicao_sem_rateio = (df_merged['db_match_count'] <= 1)
-    df_final_sem_rateio = df_merged[condicao_sem_rateio].copy()
-    df_final_sem_rateio.drop_duplicates(subset=['_xml_row_id'], keep='first', inplace=True)
-    df_final_sem_rateio = renomear_colunas(df_final_sem_rateio)
-    df_final_sem_rateio['Vlr Rateado'] = df_final_sem_rateio['Titulos a vencer Valor nominal'].apply(to_number_brl)
-    df_final_sem_rateio = df_final_sem_rateio[colunas_finais_xml]
-
-    condicao_com_rateio = (df_merged['db_match_count'] > 1)
-    df_final_com_rateio = df_merged[condicao_com_rateio].copy()
-
-    # --- 5. Mapeamento e AGRUPAMENTO (Lógica idêntica, incluindo "Filial") ---
-    if not df_final_com_rateio.empty:
-        print("Agrupando e somando títulos rateados...")
-        col_titulos_vencer_xml = 'Titulos a vencer Valor nominal_xml' if 'Titulos a vencer Valor nominal_xml' in df_final_com_rateio.columns else 'Titulos a vencer Valor nominal'
-        df_final_com_rateio['Valor_Pago_Num'] = df_final_com_rateio[col_titulos_vencer_xml].apply(to_number_brl)
-        
-        col_cc_db = 'Centro Custo_db' if 'Centro Custo_db' in df_final_com_rateio.columns else 'Centro Custo'
-        col_cta_db = 'C Contabil' 
-        col_item_db = 'Item Conta' 
-        col_loja_db = 'Loja_db' if 'Loja_db' in df_final_com_rateio.columns else 'Loja'
-        col_vlr_db = 'Vlr.Total' 
-        col_filial_db = 'Filial' 
-        grouping_keys = ['_xml_row_id', col_item_db, col_cc_db, col_cta_db, col_loja_db, col_filial_db]
-        
-        agg_funcs = { 
-            col_vlr_db: 'sum', 
-            'Soma_Doc': 'first', 
-            'Valor_Pago_Num': 'first',
-            'Código': 'first', 
-            'Documento': 'first',
-            'Parcela': 'first',
-            'Filial': 'first'
-        }
-        
-        xml_cols_to_keep = [col for col in colunas_finais_xml if col not in ['Código', 'Documento', 'Parcela', 'Vlr Rateado', '_xml_row_id', 'Filial']]
-        for col in df_final_com_rateio.columns:
-            if col.endswith('_xml') and col not in agg_funcs: agg_funcs[col] = 'first'
-            elif col in xml_cols_to_keep and col not in agg_funcs: agg_funcs[col] = 'first'
+    # --- 3. Conciliação e rateio ---
+    print("Iniciando a conciliação...")
+    df_final = calcular_rateio(df_xml, df_compras, col_forn_db, col_doc_db, perfil)
 
-        grouping_keys_existentes = [key for key in grouping_keys if key in df_final_com_rateio.columns]
+    # --- 4. Finalização ---
+    print("Convertendo colunas de data (gravadas como DD/MM/YYYY no Excel)...")
+    with perfil.etapa('Datas e ordem das colunas', linhas_entrada=len(df_final)) as etapa:
+        colunas_data = list(FORMATOS_DATA_XML)
+        for col, formato in FORMATOS_DATA_XML.items():
+            if col in df_final.columns:
+                df_final[col] = converter_datas(df_final[col], formato)
         
-        print(f"Agrupando rateios por {grouping_keys_existentes}...")
-        df_agrupado = df_final_com_rateio.groupby(grouping_keys_existentes, as_index=False).agg(agg_funcs)
-
-        df_agrupado['Proporcao'] = 0.0
-        mask_soma_valida = df_agrupado['Soma_Doc'] != 0
-        df_agrupado.loc[mask_soma_valida, 'Proporcao'] = df_agrupado[col_vlr_db] / df_agrupado['Soma_Doc']
-        df_agrupado['Vlr Rateado'] = df_agrupado['Proporcao'] * df_agrupado['Valor_Pago_Num']
-        df_agrupado['Valor Original'] = df_agrupado[col_vlr_db]
+        colunas_novas = ['Código', 'Loja', 'Nome do Fornecedor', 'Documento', 'Parcela']
+        colunas_originais_xml = list(df_xml.drop(columns=colunas_novas + ['_xml_row_id'], errors='ignore').columns)
         
-        if col_cc_db in df_agrupado.columns: df_agrupado['Centro Custo_xml'] = df_agrupado[col_cc_db]
-        if col_cta_db in df_agrupado.columns:
-            col_cta_xml = 'Cta.Contabil_xml' if 'Cta.Contabil_xml' in df_agrupado.columns else 'Cta.Contabil'
-            df_agrupado[col_cta_xml] = df_agrupado[col_cta_db]
-        if col_item_db in df_agrupado.columns:
-            col_negocio_xml = 'Negocio?_xml' if 'Negocio?_xml' in df_agrupado.columns else 'Negocio?'
-            df_agrupado[col_negocio_xml] = df_agrupado[col_item_db]
-        if col_loja_db in df_agrupado.columns: df_agrupado['Loja_xml'] = df_agrupado[col_loja_db]
+        ordem_final = colunas_novas + colunas_originais_xml + ['Vlr Rateado', 'Filial']
+        colunas_existentes_na_ordem = [col for col in ordem_final if col in df_final.columns]
         
-        df_final_com_rateio = renomear_colunas(df_agrupado)
-        df_final_com_rateio = df_final_com_rateio[colunas_finais_xml]
-    else:
-        print("Nenhum título com rateio (múltiplas linhas) foi encontrado na base.")
-
-    # --- 6. Junção e Finalização (Lógica idêntica) ---
-    print("Consolidando relatório final...")
-    df_final = pd.concat([df_final_sem_rateio, df_final_com_rateio], ignore_index=True)
-    
-    print("Formatando colunas de data para DD/MM/YYYY...")
-    colunas_data = ['Data de Emissao', 'Data de Vencto', 'Vencto Real']
-    for col in colunas_data:
-        if col in df_final.columns:
-            df_final[col] = df_final[col].apply(formatar_data_br)
-    
-    colunas_novas = ['Código', 'Loja', 'Nome do Fornecedor', 'Documento', 'Parcela']
-    colunas_originais_xml = list(df_xml.drop(columns=colunas_novas + ['_xml_row_id'], errors='ignore').columns)
-    
-    ordem_final = colunas_novas + colunas_originais_xml + ['Vlr Rateado', 'Filial']
-    colunas_existentes_na_ordem = [col for col in ordem_final if col in df_final.columns]
-    
-    df_final = df_final[colunas_existentes_na_ordem]
+        df_final = df_final[colunas_existentes_na_ordem]
+        etapa.linhas_saida = len(df_final)
     
     print(f"Salvando relatório em memória (BytesIO)...")
     
-    output_stream = io.BytesIO()
-    df_final.to_excel(output_stream, index=False, engine='openpyxl')
-    output_stream.seek(0) 
-    
     colunas_para_formatar = {
         'Valor Original': ACCOUNTING_FORMAT,
         'Tit Vencidos Valor nominal': ACCOUNTING_FORMAT,
@@ -395,10 +678,27 @@ def rodar_conciliacao_streamlit(caminho_arquivo_xml):
         'Vlr Rateado': ACCOUNTING_FORMAT 
     }
     
+    with perfil.etapa('Escrita do Excel', linhas_entrada=len(df_final)) as etapa:
+        etapa.linhas_saida = len(df_final)
+        return _escrever_relatorio(df_final, colunas_para_formatar, colunas_data)
+
+def _escrever_relatorio(df_final, colunas_para_formatar, colunas_data):
+    if XLSXWRITER_DISPONIVEL:
+        output_stream = gerar_relatorio_excel(df_final, colunas_para_formatar, colunas_data)
+        print("\n--- SUCESSO! ---")
+        print("Relatório final gerado e formatado em memória.")
+        return output_stream, True
+
+    # Sem XlsxWriter: grava com o OpenPyXL e formata numa segunda passada
+    output_stream = io.BytesIO()
+    df_final.to_excel(output_stream, index=False, engine='openpyxl')
+    output_stream.seek(0) 
+    
     if OPENPYXL_DISPONIVEL:
         try:
             wb = load_workbook(output_stream)
-            wb_formatado = aplicar_formatacao_excel(wb, colunas_para_formatar)
+            formatos = dict(colunas_para_formatar, **{col: DATE_FORMAT for col in colunas_data})
+            wb_formatado = aplicar_formatacao_excel(wb, formatos)
             output_stream_formatado = io.BytesIO()
             wb_formatado.save(output_stream_formatado)
             output_stream_formatado.seek(0)
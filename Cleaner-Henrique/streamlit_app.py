@@ -1,7 +1,6 @@
 # streamlit_app.py
 import streamlit as st
 import pandas as pd
-import tempfile
 import os
 import io
 import sys
@@ -15,10 +14,14 @@ except NameError:
 if SCRIPT_DIR not in sys.path:
     sys.path.append(SCRIPT_DIR)
 
-from carregar_base_compras import ler_excel_para_df, carregar_base_firebase
+from carregar_base_compras import ler_excel_para_df, carregar_base_firebase, FORMATO_BASE_PADRAO
 from rodar_conciliacao import rodar_conciliacao_streamlit
+from perfil_execucao import PerfilExecucao
 # --- NOVA IMPORTAÇÃO ---
-from firebase_utils import get_db, query_base_compras
+from firebase_utils import (
+    get_db, query_base_compras, ler_metadados_base, formato_base, FORMATO_DOCUMENTOS, FORMATO_BLOCOS,
+    LIMITE_PAGINA_AUDITORIA, TTL_CACHE_AUDITORIA_S
+)
 
 # --- Caminhos dos Assets ---
 LOGO_PATH = os.path.join(SCRIPT_DIR, "assets", "logo.png") 
@@ -99,6 +102,12 @@ if 'download_filename' not in st.session_state:
     st.session_state.download_filename = None
 if 'df_audit_cache' not in st.session_state:
     st.session_state.df_audit_cache = pd.DataFrame() # Cache para os dados da auditoria
+if 'audit_cursor' not in st.session_state:
+    st.session_state.audit_cursor = None # Cursor da próxima página da auditoria
+if 'audit_filtros' not in st.session_state:
+    st.session_state.audit_filtros = {}
+if 'perfil_conciliacao' not in st.session_state:
+    st.session_state.perfil_conciliacao = None # Relatório de tempos da última conciliação
 
 # --- ABAS DA APLICAÇÃO ---
 tab_conciliador, tab_auditoria = st.tabs(["🚀 Conciliador", "🔍 Auditoria da Base"])
@@ -124,6 +133,16 @@ with tab_conciliador:
             help="Se marcado, APAGA toda a base antiga no Firebase antes de carregar a nova. Se desmarcado, apenas ADICIONA os novos dados.",
             key="checkbox_replace_mode"
         )
+
+        modo_compacto = st.checkbox(
+            "Armazenamento compacto (blocos)",
+            value=FORMATO_BASE_PADRAO == FORMATO_BLOCOS,
+            disabled=not modo_replace,
+            help="Grava ~5.000 linhas por documento (Parquet comprimido), em vez de um documento por linha. "
+                 "A base inteira é baixada em poucas dezenas de leituras. Só vale no Modo Replace; "
+                 "um append segue o formato da base atual.",
+            key="checkbox_formato_blocos"
+        )
         
         if st.button("1. CARREGAR PARA NUVEM", use_container_width=True):
             if uploader_b:
@@ -137,9 +156,15 @@ with tab_conciliador:
                         st.error(f"❌ Erro ao ler o Excel: {e}")
                         st.stop()
                 
-                with st.spinner(f"Carregando {len(df_novo)} registros para o Firebase (Modo: {modo})... Isso pode levar vários minutos!"):
+                with st.spinner(f"Carregando {len(df_novo)} registros para o Firebase (Modo: {modo})..."):
+                    barra_upload = st.progress(0.0, text="Enviando registros...")
+                    def atualizar_barra(n_enviados, total):
+                        barra_upload.progress(n_enviados / max(total, 1),
+                                              text=f"{n_enviados} / {total} documentos enviados")
+                    formato = FORMATO_BLOCOS if modo_compacto else FORMATO_DOCUMENTOS
                     try:
-                        carregar_base_firebase(df_novo, modo_execucao=modo)
+                        carregar_base_firebase(df_novo, modo_execucao=modo, progresso=atualizar_barra,
+                                               formato=formato)
                         st.success(f"🎉 Base de dados salva no Firebase com sucesso!")
                         # Limpa o cache da auditoria, pois os dados mudaram
                         st.session_state.df_audit_cache = pd.DataFrame()
@@ -162,12 +187,10 @@ with tab_conciliador:
         if st.button("2. RODAR CONCILIAÇÃO", use_container_width=True, type="primary"):
             if uploader_a:
                 with st.spinner("⚙️ Baixando base do Firebase e processando... (Isso pode levar um tempo)"):
+                    perfil = PerfilExecucao('conciliacao')
                     try:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".xml") as tmp_xml:
-                            tmp_xml.write(uploader_a.getvalue())
-                            xml_path = tmp_xml.name
-                        
-                        excel_bytes_io, formatado_ok = rodar_conciliacao_streamlit(xml_path)
+                        # O XML é lido direto do buffer do upload (sem arquivo temporário)
+                        excel_bytes_io, formatado_ok = rodar_conciliacao_streamlit(uploader_a, perfil=perfil)
                         
                         st.session_state.download_data = excel_bytes_io
                         st.session_state.download_filename = "Relatorio_Final_Desmembrado.xlsx"
@@ -179,12 +202,20 @@ with tab_conciliador:
                     except Exception as e:
                         st.error(f"❌ Erro inesperado durante a conciliação:")
                         st.exception(e) 
-                    finally:
-                        if 'xml_path' in locals() and os.path.exists(xml_path):
-                            os.remove(xml_path)
+                    st.session_state.perfil_conciliacao = {
+                        'relatorio': perfil.relatorio(),
+                        'tabela': perfil.tabela(),
+                    }
             else:
                 st.warning("⚠️ Por favor, selecione o arquivo XML do TOTVS antes de rodar a conciliação.")
 
+        # --- Tempos da última conciliação ---
+        if st.session_state.perfil_conciliacao:
+            relatorio = st.session_state.perfil_conciliacao['relatorio']
+            with st.expander(f"⏱️ Tempo por etapa da última conciliação ({relatorio['tempo_total_s'] or 0:.1f}s)"):
+                st.dataframe(st.session_state.perfil_conciliacao['tabela'],
+                             use_container_width=True, hide_index=True)
+
         # --- Botão de Download ---
         if st.session_state.download_data:
             st.markdown("---")
@@ -203,10 +234,19 @@ with tab_auditoria:
     st.header("🔍 Auditoria e Visualização da Base de Compras")
     st.markdown("Busque e filtre os dados que estão salvos no banco de dados Firebase.")
     
-    # --- Filtros do Firestore (Busca Rápida) ---
-    st.subheader("1. Filtros Rápidos (Busca no Banco de Dados)")
-    st.info("Estes filtros buscam no Firebase. São 'iguais a' e 'sensíveis a maiúsculas'. Deixe em branco para ignorar.")
-    
+    # --- Filtros do Firestore (aplicados no servidor, com paginação) ---
+    st.subheader("1. Filtros (aplicados no Banco de Dados)")
+    st.info("Todos os filtros são aplicados no Firebase e os dados chegam em páginas. "
+            "Os de texto são 'iguais a' e 'sensíveis a maiúsculas'. Deixe em branco para ignorar.")
+
+    try:
+        db_auditoria = get_db()
+        meta_base = ler_metadados_base(db_auditoria) if db_auditoria is not None else None
+    except Exception:
+        meta_base = None
+    colunas_base = (meta_base or {}).get('colunas') or []
+    colunas_data_opcoes = [col for col in colunas_base if 'data' in col.lower()]
+
     filt_col1, filt_col2, filt_col3 = st.columns(3)
     with filt_col1:
         f_fornecedor = st.text_input("Código Fornecedor (Ex: 000123)", key="f_forn")
@@ -214,104 +254,86 @@ with tab_auditoria:
         f_documento = st.text_input("Nº Documento (Ex: 12345)", key="f_doc")
     with filt_col3:
         f_filial = st.text_input("Filial (Ex: 101)", key="f_filial")
-        
-    if st.button("BUSCAR DADOS DO FIREBASE", use_container_width=True, type="primary"):
+
+    if meta_base is not None and formato_base(meta_base) == FORMATO_BLOCOS and not f_fornecedor:
+        # No formato 'blocos' só o fornecedor é filtrado no servidor (pela partição)
+        st.warning(f"⚠️ A base está no armazenamento compacto (blocos): sem o código do fornecedor, "
+                   f"a busca baixa a base inteira e filtra aqui. O resultado fica em cache por "
+                   f"{TTL_CACHE_AUDITORIA_S // 60} minutos, então as próximas páginas não baixam de novo. "
+                   f"Informe o fornecedor para baixar só a parte dele.")
+
+    filt_col_range1, filt_col_range2 = st.columns(2)
+    with filt_col_range1:
+        st.markdown("**Filtrar por Valor (Vlr.Total)**")
+        filt_valor1, filt_valor2 = st.columns(2)
+        f_valor_min = filt_valor1.number_input("Mínimo", value=None, step=100.0, key="f_valor_min")
+        f_valor_max = filt_valor2.number_input("Máximo", value=None, step=100.0, key="f_valor_max")
+    with filt_col_range2:
+        st.markdown("**Filtrar por Data**")
+        f_data_col, f_date_range = None, ()
+        if colunas_data_opcoes:
+            if st.checkbox("Filtrar por intervalo de datas", key="f_data_ativo"):
+                f_data_col = st.selectbox("Coluna de data:", colunas_data_opcoes, key="f_data_col_select")
+                f_date_range = st.date_input("Intervalo de datas:", value=(), key="f_date_range_picker")
+        else:
+            st.caption("Nenhuma coluna de data registrada na base atual.")
+
+    filt_col_campos, filt_col_limite = st.columns([3, 1])
+    with filt_col_campos:
+        f_campos = st.multiselect("Colunas a baixar (vazio = todas)", colunas_base, key="f_campos")
+    with filt_col_limite:
+        opcoes_limite = sorted({100, LIMITE_PAGINA_AUDITORIA, 2000, 5000})
+        f_limite = st.selectbox("Linhas por página", opcoes_limite,
+                                index=opcoes_limite.index(LIMITE_PAGINA_AUDITORIA), key="f_limite")
+
+    filtros = {
+        'fornecedor': f_fornecedor or None,
+        'documento': f_documento or None,
+        'filial': f_filial or None,
+        'valor_min': f_valor_min,
+        'valor_max': f_valor_max,
+        'coluna_data': f_data_col if len(f_date_range) == 2 else None,
+        'data_inicio': f_date_range[0] if len(f_date_range) == 2 else None,
+        'data_fim': f_date_range[1] if len(f_date_range) == 2 else None,
+        'campos': f_campos or None,
+        'limite': f_limite,
+    }
+
+    col_buscar, col_mais = st.columns(2)
+    if col_buscar.button("BUSCAR DADOS DO FIREBASE", use_container_width=True, type="primary"):
         with st.spinner("Buscando dados no Firebase..."):
             try:
-                # Chama a nova função de query
-                df_audit = query_base_compras(
-                    fornecedor=f_fornecedor if f_fornecedor else None,
-                    documento=f_documento if f_documento else None,
-                    filial=f_filial if f_filial else None
-                )
-                
-                if df_audit.empty:
-                    st.warning("Nenhum dado encontrado no Firebase com esses filtros.")
-                    st.session_state.df_audit_cache = pd.DataFrame() # Limpa o cache
-                else:
-                    st.success(f"{len(df_audit)} registros baixados! Agora você pode usar os filtros adicionais.")
-                    st.session_state.df_audit_cache = df_audit # Salva no cache
+                df_audit, cursor = query_base_compras(**filtros)
+                st.session_state.df_audit_cache = df_audit
+                st.session_state.audit_cursor = cursor
+                st.session_state.audit_filtros = filtros
+                if not df_audit.empty:
+                    st.success(f"{len(df_audit)} registros baixados!")
             except Exception as e:
                 st.error(f"Erro ao buscar dados: {e}")
                 st.session_state.df_audit_cache = pd.DataFrame()
+                st.session_state.audit_cursor = None
 
-    # --- Exibição e Filtros Locais (Pandas) ---
-    if not st.session_state.df_audit_cache.empty:
-        df = st.session_state.df_audit_cache.copy()
-        st.markdown("---")
-        st.subheader("2. Filtros Adicionais (sobre os dados baixados)")
-        
-        df_filtrado = df
-        
-        # --- Filtros de Range (Valor e Data) ---
-        filt_col_range1, filt_col_range2 = st.columns(2)
-        
-        with filt_col_range1:
-            st.markdown("**Filtrar por Valor (Vlr_Total)**")
-            # Tenta converter Vlr_Total para numérico, tratando erros
-            if 'Vlr_Total' in df.columns:
-                df_filtrado['Vlr_Total'] = pd.to_numeric(df_filtrado['Vlr_Total'], errors='coerce').fillna(0.0)
-                val_min = float(df_filtrado['Vlr_Total'].min())
-                val_max = float(df_filtrado['Vlr_Total'].max())
-                
-                # Evita erro se min e max forem iguais
-                if val_min == val_max:
-                    f_valor_range = (val_min, val_max) # Não mostra o slider
-                else:
-                    f_valor_range = st.slider(
-                        "Selecione o range de valor:",
-                        min_value=val_min,
-                        max_value=val_max,
-                        value=(val_min, val_max),
-                        key="f_valor_slider"
+    if st.session_state.audit_cursor is not None:
+        if col_mais.button("CARREGAR PRÓXIMA PÁGINA", use_container_width=True):
+            with st.spinner("Buscando a próxima página..."):
+                try:
+                    df_pagina, cursor = query_base_compras(**st.session_state.audit_filtros,
+                                                           cursor=st.session_state.audit_cursor)
+                    st.session_state.df_audit_cache = pd.concat(
+                        [st.session_state.df_audit_cache, df_pagina], ignore_index=True
                     )
-                
-                df_filtrado = df_filtrado[
-                    (df_filtrado['Vlr_Total'] >= f_valor_range[0]) &
-                    (df_filtrado['Vlr_Total'] <= f_valor_range[1])
-                ]
-            else:
-                st.warning("Coluna 'Vlr_Total' não encontrada para filtro de valor.")
-        
-        with filt_col_range2:
-            st.markdown("**Filtrar por Data**")
-            # Encontra colunas que parecem ser de data
-            colunas_data_opcoes = [col for col in df.columns if 'data' in col.lower() or 'emissao' in col.lower() or 'vencto' in col.lower()]
-            
-            if colunas_data_opcoes:
-                f_data_col = st.selectbox("Selecione a coluna de data para filtrar:", colunas_data_opcoes, key="f_data_col_select")
-                
-                # Converte a coluna de data (que é string) para datetime
-                df_filtrado[f_data_col] = pd.to_datetime(df_filtrado[f_data_col], errors='coerce')
-                
-                # Remove NaT (datas inválidas) para o filtro
-                df_sem_nat = df_filtrado.dropna(subset=[f_data_col])
-                
-                if not df_sem_nat.empty:
-                    date_min = df_sem_nat[f_data_col].min().date()
-                    date_max = df_sem_nat[f_data_col].max().date()
+                    st.session_state.audit_cursor = cursor
+                except Exception as e:
+                    st.error(f"Erro ao buscar dados: {e}")
 
-                    f_date_range = st.date_input(
-                        "Selecione o range de data:",
-                        value=(date_min, date_max),
-                        min_value=date_min,
-                        max_value=date_max,
-                        key="f_date_range_picker"
-                    )
-                    
-                    if len(f_date_range) == 2:
-                        df_filtrado = df_filtrado[
-                            (df_filtrado[f_data_col].dt.date >= f_date_range[0]) &
-                            (df_filtrado[f_data_col].dt.date <= f_date_range[1])
-                        ]
-                else:
-                    st.warning(f"Coluna '{f_data_col}' não contém datas válidas para filtro.")
-            else:
-                st.warning("Nenhuma coluna de data encontrada para filtro.")
-
-        # --- Exibir DataFrame ---
+    # --- Exibição ---
+    if not st.session_state.df_audit_cache.empty:
+        df_filtrado = st.session_state.df_audit_cache
         st.markdown("---")
         st.subheader(f"Dados Filtrados ({len(df_filtrado)} registros)")
+        if st.session_state.audit_cursor is not None:
+            st.caption("Há mais registros com estes filtros: use 'CARREGAR PRÓXIMA PÁGINA'.")
         
         # Mostra o DF e permite que o usuário filtre as colunas
         st.dataframe(df_filtrado, use_container_width=True)
@@ -325,7 +347,7 @@ with tab_auditoria:
             mime="text/csv",
             use_container_width=True
         )
-    elif 'df_audit_cache' in st.session_state and st.session_state.df_audit_cache.empty:
+    elif st.session_state.audit_filtros:
         # Se a busca foi feita mas não retornou nada
         st.info("A busca não retornou resultados. Tente filtros mais amplos (ou deixe em branco para buscar tudo).")
     else:
@@ -0,0 +1,8 @@
+# --- FIX: Adiciona o diretório do conciliador ao path (os módulos não são um pacote) ---
+import os
+import sys
+
+DIR_CONCILIADOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if DIR_CONCILIADOR not in sys.path:
+    sys.path.insert(0, DIR_CONCILIADOR)
+# --- FIM DO FIX ---
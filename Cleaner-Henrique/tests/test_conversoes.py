@@ -0,0 +1,53 @@
+"""
+Conversões vetorizadas: valores em formato brasileiro
+(`converter_valores_brl`, mesmas regras do antigo `to_number_brl`) e
+datas do XML (`converter_datas`).
+"""
+import pandas as pd
+
+import conversoes
+
+
+def test_formatos_brasileiros():
+    valores = pd.Series(['1.234,56', '1234,56', '1234.56', '1.234.567', ' 2 ', ''], dtype=object)
+
+    resultado = conversoes.converter_valores_brl(valores)
+
+    assert resultado.tolist() == [1234.56, 1234.56, 1234.56, 1234567.0, 2.0, 0.0]
+
+
+def test_nulos_viram_zero():
+    valores = pd.Series(['1,5', None, float('nan')], dtype=object)
+
+    assert conversoes.converter_valores_brl(valores).tolist() == [1.5, 0.0, 0.0]
+
+
+def test_textos_invalidos_viram_zero():
+    # '1e\t5' não passa no float(): a coluna toda cai no caminho texto a texto
+    valores = pd.Series(['1,5', '1e\t5', 'abc', '1,2,3', '1e3'], dtype=object, index=[10, 11, 12, 13, 14])
+
+    resultado = conversoes.converter_valores_brl(valores)
+
+    assert resultado.dtype == 'float64'
+    assert resultado.index.tolist() == [10, 11, 12, 13, 14]
+    assert resultado.tolist() == [1.5, 0.0, 0.0, 0.0, 1000.0]
+
+
+def test_datas_iso_com_e_sem_hora():
+    # Variantes ISO que outros exportadores mandam no lugar de '...T00:00:00.000'
+    valores = pd.Series(['2024-05-10T00:00:00.000', '2024-05-10T00:00:00',
+                         '2024-05-10 00:00:00', '2024-05-10', '10/05/2024', '', None], dtype=object)
+
+    resultado = conversoes.converter_datas(valores, 'ISO8601')
+
+    assert pd.api.types.is_datetime64_any_dtype(resultado)
+    assert (resultado.iloc[:5] == pd.Timestamp('2024-05-10')).all()
+    assert resultado.iloc[5:].isna().all()
+
+
+def test_datas_invalidas_ficam_como_texto():
+    valores = pd.Series(['2024-05-10', 'SEM DATA'], dtype=object)
+
+    resultado = conversoes.converter_datas(valores, 'ISO8601')
+
+    assert resultado.tolist() == [pd.Timestamp('2024-05-10'), 'SEM DATA']
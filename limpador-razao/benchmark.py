@@ -0,0 +1,359 @@
+"""
+Benchmarks do Limpador de Razão.
+
+Compara as implementações antigas (linha a linha) com as atuais do
+processamento.py, usando razões sintéticos gerados em memória.
+
+Uso:
+    python benchmark.py historico --linhas 100000 1000000 5000000
+    python benchmark.py cred_deb --linhas 2000000
+    python benchmark.py leitura --linhas 20000 100000
+    python benchmark.py doc --linhas 100000 1000000
+    python benchmark.py paralelo --linhas 2000000
+    python benchmark.py exportacao --linhas 100000
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+# --- FIX: Adiciona o diretório do script ao path ---
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    SCRIPT_DIR = os.getcwd()
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+# --- FIM DO FIX ---
+
+import processamento
+
+
+# --- GERADORES DE DADOS SINTÉTICOS ---
+
+def gerar_razao_df(n_linhas, frac_continuacao=0.25, seed=42):
+    """
+    Gera um DataFrame no formato lido de '3-Lançamentos Contábeis':
+    lançamentos com LOTE preenchido intercalados com linhas de continuação
+    do histórico (LOTE vazio).
+    """
+    rng = np.random.default_rng(seed)
+    eh_continuacao = rng.random(n_linhas) < frac_continuacao
+    eh_continuacao[0] = False
+
+    idx = np.arange(n_linhas)
+    lote = pd.Series([f"{i:06d}/001/{i:06d}/001" for i in idx], dtype=object)
+    lote[eh_continuacao] = None
+
+    numeros = rng.integers(0, 10**9, n_linhas)
+    historico = pd.Series([f"PAGTO NF.: {n:09d} FORNECEDOR" for n in numeros], dtype=object)
+    historico[eh_continuacao] = "CONTINUACAO DO HISTORICO"
+
+    valores = np.round(rng.uniform(0, 100_000, n_linhas), 2)
+    eh_debito = rng.random(n_linhas) < 0.5
+
+    return pd.DataFrame({
+        'DATA': pd.Timestamp('2024-01-31'),
+        'LOTE/SUB/DOC/LINHA': lote,
+        'HISTORICO': historico,
+        'DEBITO': np.where(eh_debito, valores, 0.0),
+        'CREDITO': np.where(eh_debito, 0.0, valores),
+    })
+
+
+def gerar_razao_xml(n_linhas, seed=42):
+    """
+    Gera o SpreadsheetML (bytes) de um razão com a planilha
+    '3-Lançamentos Contábeis' a partir de `gerar_razao_df`.
+    """
+    df = gerar_razao_df(n_linhas, seed=seed)
+    tipos = {'DATA': 'DateTime', 'DEBITO': 'Number', 'CREDITO': 'Number'}
+
+    def celula(col, valor):
+        if valor is None:
+            return '<Cell/>'
+        return f'<Cell><Data ss:Type="{tipos.get(col, "String")}">{escape(valor)}</Data></Cell>'
+
+    partes = [
+        '<?xml version="1.0"?>\n'
+        '<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+        'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n'
+        f'<Worksheet ss:Name="{processamento.NOME_PLANILHA_LANCAMENTOS}"><Table>\n'
+        '<Row><Cell><Data ss:Type="String">Razão Contábil</Data></Cell></Row>\n'
+        '<Row>' + ''.join(celula('', col) for col in df.columns) + '</Row>\n'
+    ]
+    for linha in df.itertuples(index=False):
+        lote, historico, debito, credito = linha[1], linha[2], linha[3], linha[4]
+        if lote is None:
+            celulas = [None, None, historico, None, None]
+        else:
+            celulas = [linha[0].strftime('%Y-%m-%dT%H:%M:%S.000'), lote, historico,
+                       repr(debito), repr(credito)]
+        partes.append('<Row>' + ''.join(celula(c, v) for c, v in zip(df.columns, celulas)) + '</Row>\n')
+    partes.append('</Table></Worksheet>\n</Workbook>\n')
+
+    return ''.join(partes).encode('utf-8')
+
+
+# --- IMPLEMENTAÇÕES ANTIGAS (REFERÊNCIA) ---
+
+def _legado_read_xml(uploaded_file):
+    # Leitor original: ET.parse do arquivo inteiro e pd.to_* por célula
+    uploaded_file.seek(0)
+    root = ET.parse(uploaded_file).getroot()
+    ns_map = {
+        'd': 'urn:schemas-microsoft-com:office:spreadsheet',
+        'ss': 'urn:schemas-microsoft-com:office:spreadsheet'
+    }
+    worksheet = None
+    for ws in root.findall('d:Worksheet', ns_map):
+        if ws.attrib.get(f'{{{ns_map["ss"]}}}Name') == processamento.NOME_PLANILHA_LANCAMENTOS:
+            worksheet = ws
+            break
+    rows = worksheet.find('d:Table', ns_map).findall('d:Row', ns_map)
+
+    headers = []
+    for cell in rows[1].findall('d:Cell', ns_map):
+        data = cell.find('d:Data', ns_map)
+        if data is not None and data.text is not None:
+            headers.append(data.text)
+        else:
+            headers.append(f"Coluna_Vazia_{len(headers)}")
+
+    data_list = []
+    for row_elem in rows[2:]:
+        cells = row_elem.findall('d:Cell', ns_map)
+        if not cells: continue
+        row_data = {}
+        for i, cell in enumerate(cells):
+            if i >= len(headers): break
+            data_elem = cell.find('d:Data', ns_map)
+            text = data_elem.text if data_elem is not None else None
+            data_type = 'String'
+            if data_elem is not None:
+                data_type = data_elem.attrib.get(f'{{{ns_map["ss"]}}}Type', 'String')
+            val = text
+            if text is not None:
+                if data_type == 'DateTime':
+                    val = pd.to_datetime(text)
+                elif data_type == 'Number':
+                    val = pd.to_numeric(text, errors='coerce')
+            row_data[headers[i]] = val
+        if row_data:
+            data_list.append(row_data)
+
+    return pd.DataFrame(data_list)
+
+
+def _legado_juntar_linhas_historico(df):
+    processed_rows = []
+    last_valid_row = None
+
+    for _, row in df.iterrows():
+        if pd.isna(row['LOTE/SUB/DOC/LINHA']) or row['LOTE/SUB/DOC/LINHA'] == '':
+            if last_valid_row is not None:
+                hist_atual = str(row['HISTORICO']).strip() if pd.notna(row['HISTORICO']) else ""
+                last_valid_row['HISTORICO'] += f" {hist_atual}"
+        else:
+            if last_valid_row is not None:
+                processed_rows.append(last_valid_row)
+            last_valid_row = row.to_dict()
+
+    if last_valid_row is not None:
+        processed_rows.append(last_valid_row)
+
+    return pd.DataFrame(processed_rows)
+
+
+def _legado_calcular_cred_deb(df_processed):
+    df_processed['DEBITO'] = pd.to_numeric(df_processed['DEBITO'], errors='coerce').fillna(0)
+    df_processed['CREDITO'] = pd.to_numeric(df_processed['CREDITO'], errors='coerce').fillna(0)
+
+    def calcular_cred_deb(row):
+        if row['DEBITO'] != 0:
+            return row['DEBITO'] * -1
+        elif row['CREDITO'] != 0:
+            return row['CREDITO']
+        else:
+            return 0
+
+    df_processed['CRED/DEB'] = df_processed.apply(calcular_cred_deb, axis=1)
+
+    df_processed['DEBITO'] = df_processed['DEBITO'].round(2)
+    df_processed['CREDITO'] = df_processed['CREDITO'].round(2)
+    df_processed['CRED/DEB'] = df_processed['CRED/DEB'].round(2)
+    return df_processed
+
+
+def _legado_extrair_doc(historico):
+    prefixes = ['NF.:', 'DOC.:', 'NF:', 'DOC:', 'TIT:', 'TIT.:', 'DUPL.:']
+    regex_pattern = rf"(?:{'|'.join(prefixes)})\s*([0-9]{{6,9}})"
+
+    return historico.astype(str).str.extract(
+        regex_pattern,
+        flags=re.IGNORECASE
+    ).fillna('')[0]
+
+
+# --- UTILITÁRIOS ---
+
+def _cronometrar(func, *args):
+    inicio = time.perf_counter()
+    resultado = func(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def _imprimir_linha(n_linhas, t_antigo, t_novo):
+    antigo = f"{t_antigo:10.2f}s" if t_antigo is not None else f"{'(pulado)':>11}"
+    ganho = f"{t_antigo / t_novo:8.1f}x" if t_antigo is not None else f"{'-':>9}"
+    print(f"{n_linhas:>10,} | {antigo} | {t_novo:10.3f}s | {ganho}")
+
+
+# --- BENCHMARKS ---
+
+def bench_historico(tamanhos, max_linhas_antigo):
+    print("Junção de linhas de histórico (iterrows x vetorizado)")
+    print(f"{'linhas':>10} | {'antigo':>11} | {'novo':>11} | {'ganho':>9}")
+    for n_linhas in tamanhos:
+        df = gerar_razao_df(n_linhas)
+        novo, t_novo = _cronometrar(processamento._juntar_linhas_historico, df)
+
+        t_antigo = None
+        if n_linhas <= max_linhas_antigo:
+            antigo, t_antigo = _cronometrar(_legado_juntar_linhas_historico, df)
+            pd.testing.assert_frame_equal(antigo, novo)
+
+        _imprimir_linha(n_linhas, t_antigo, t_novo)
+
+
+def bench_cred_deb(tamanhos, max_linhas_antigo):
+    print("Coluna CRED/DEB (apply por linha x centavos int64)")
+    print(f"{'linhas':>10} | {'antigo':>11} | {'novo':>11} | {'ganho':>9}")
+    for n_linhas in tamanhos:
+        df = gerar_razao_df(n_linhas)
+        novo, t_novo = _cronometrar(processamento._calcular_cred_deb, df.copy())
+
+        # Regressão: a soma de CRED/DEB fecha com CREDITO - DEBITO, ao centavo
+        soma_cred_deb = processamento._para_centavos(novo['CRED/DEB']).sum()
+        soma_esperada = (processamento._para_centavos(novo['CREDITO']).sum()
+                         - processamento._para_centavos(novo['DEBITO']).sum())
+        assert soma_cred_deb == soma_esperada, (soma_cred_deb, soma_esperada)
+
+        t_antigo = None
+        if n_linhas <= max_linhas_antigo:
+            antigo, t_antigo = _cronometrar(_legado_calcular_cred_deb, df.copy())
+            pd.testing.assert_frame_equal(antigo, novo)
+
+        _imprimir_linha(n_linhas, t_antigo, t_novo)
+    print(f"Soma de CRED/DEB confere com CREDITO - DEBITO (R$ {soma_cred_deb / 100:,.2f}).")
+
+
+def bench_leitura(tamanhos, max_linhas_antigo):
+    print("Leitura do XML (ET.parse + pd.to_* por célula x iterparse + conversão por coluna)")
+    print(f"{'linhas':>10} | {'antigo':>11} | {'novo':>11} | {'ganho':>9} | {'µs/linha antes':>14} | {'µs/linha depois':>15}")
+    for n_linhas in tamanhos:
+        conteudo = gerar_razao_xml(n_linhas)
+        novo, t_novo = _cronometrar(processamento._read_xml_with_elementtree, io.BytesIO(conteudo))
+
+        t_antigo = None
+        if n_linhas <= max_linhas_antigo:
+            antigo, t_antigo = _cronometrar(_legado_read_xml, io.BytesIO(conteudo))
+            pd.testing.assert_frame_equal(antigo, novo)
+
+        por_linha_antes = f"{t_antigo / n_linhas * 1e6:14.1f}" if t_antigo is not None else f"{'-':>14}"
+        antigo = f"{t_antigo:10.2f}s" if t_antigo is not None else f"{'(pulado)':>11}"
+        ganho = f"{t_antigo / t_novo:8.1f}x" if t_antigo is not None else f"{'-':>9}"
+        print(f"{n_linhas:>10,} | {antigo} | {t_novo:10.3f}s | {ganho} | "
+              f"{por_linha_antes} | {t_novo / n_linhas * 1e6:15.1f}")
+
+
+def bench_doc(tamanhos, max_linhas_antigo):
+    print("Coluna DOC (str.extract com regex recriado x ExtratorDoc pré-compilado)")
+    print(f"{'linhas':>10} | {'antigo':>11} | {'novo':>11} | {'ganho':>9}")
+    for n_linhas in tamanhos:
+        # Históricos já juntados, metade deles sem nenhum prefixo de documento
+        historico = processamento._juntar_linhas_historico(gerar_razao_df(n_linhas))['HISTORICO']
+        historico[::2] = historico[::2].str.replace('NF.:', 'PGTO', regex=False)
+
+        novo, t_novo = _cronometrar(processamento.EXTRATOR_DOC.primeiro, historico)
+
+        t_antigo = None
+        if n_linhas <= max_linhas_antigo:
+            antigo, t_antigo = _cronometrar(_legado_extrair_doc, historico)
+            pd.testing.assert_series_equal(antigo, novo, check_names=False)
+
+        _imprimir_linha(n_linhas, t_antigo, t_novo)
+
+    _, t_todos = _cronometrar(processamento.EXTRATOR_DOC.todos, historico)
+    print(f"Todos os documentos por linha (coluna 'DOCS'), {len(historico):,} linhas: {t_todos:.3f}s")
+
+
+def bench_paralelo(tamanhos, max_linhas_antigo):
+    print(f"Limpeza em paralelo (histórico + DOC + CRED/DEB), {os.cpu_count()} CPUs disponíveis")
+    print(f"{'linhas':>10} | {'workers':>7} | {'tempo':>9} | {'speedup':>8}")
+    for n_linhas in tamanhos:
+        df = gerar_razao_df(n_linhas)
+        referencia, t_serial = _cronometrar(processamento._limpar_lancamentos, df.copy())
+        print(f"{n_linhas:>10,} | {1:>7} | {t_serial:8.2f}s | {1:7.2f}x")
+
+        for n_workers in [2, 4, 8]:
+            resultado, t = _cronometrar(processamento._limpar_em_paralelo, df.copy(), n_workers)
+            pd.testing.assert_frame_equal(referencia, resultado)
+            print(f"{n_linhas:>10,} | {n_workers:>7} | {t:8.2f}s | {t_serial / t:7.2f}x")
+
+
+def bench_exportacao(tamanhos, max_linhas_antigo):
+    print("Exportação e releitura do razão limpo (xlsx x Parquet x Feather)")
+    print(f"{'linhas':>10} | {'formato':>8} | {'gravar':>9} | {'reler':>9} | {'tamanho':>10}")
+    for n_linhas in tamanhos:
+        df = processamento._limpar_lancamentos(gerar_razao_df(n_linhas))
+
+        formatos = [
+            ('parquet', processamento.exportar_parquet,
+             lambda b: processamento.ler_razao_limpo(b, 'parquet')),
+            ('feather', processamento.exportar_feather,
+             lambda b: processamento.ler_razao_limpo(b, 'feather')),
+        ]
+        if n_linhas <= max_linhas_antigo:
+            formatos.insert(0, ('xlsx', processamento.criar_excel_estilizado, pd.read_excel))
+
+        for nome, exportar, reler in formatos:
+            dados, t_gravar = _cronometrar(exportar, df)
+            relido, t_reler = _cronometrar(reler, dados)
+            assert len(relido) == len(df)
+            print(f"{n_linhas:>10,} | {nome:>8} | {t_gravar:8.3f}s | {t_reler:8.3f}s | "
+                  f"{len(dados.getvalue()) / 1024 / 1024:7.1f} MB")
+
+
+CASOS = {
+    'historico': (bench_historico, [100_000, 1_000_000, 5_000_000]),
+    'cred_deb': (bench_cred_deb, [2_000_000]),
+    'leitura': (bench_leitura, [20_000, 100_000]),
+    'doc': (bench_doc, [100_000, 1_000_000]),
+    'paralelo': (bench_paralelo, [2_000_000]),
+    'exportacao': (bench_exportacao, [100_000]),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Limpador de Razão.")
+    parser.add_argument('caso', choices=list(CASOS))
+    parser.add_argument('--linhas', type=int, nargs='+',
+                        help="Tamanhos a testar (padrão depende do caso).")
+    parser.add_argument('--max-linhas-antigo', type=int, default=5_000_000,
+                        help="Acima deste tamanho a implementação antiga não é executada.")
+    args = parser.parse_args()
+
+    func, tamanhos_padrao = CASOS[args.caso]
+    func(args.linhas or tamanhos_padrao, args.max_linhas_antigo)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Cache em disco dos resultados do Limpador de Razão.
+
+A chave é o SHA-256 do arquivo enviado mais a versão do processamento;
+cada entrada guarda o DataFrame limpo (Parquet), o .xlsx gerado e o
+Parquet oferecido para download. Quando o
+total passa de LIMITE_CACHE_BYTES, as entradas usadas há mais tempo são
+apagadas (LRU).
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from processamento import _textos_se_misto
+
+# --- Configurações ---
+CACHE_DIR = os.environ.get(
+    'LIMPADOR_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'limpador_razao_cache')
+)
+LIMITE_CACHE_BYTES = int(os.environ.get('LIMPADOR_CACHE_LIMITE_MB', '1024')) * 1024 * 1024
+
+ARQUIVO_DADOS = 'dados.parquet'
+ARQUIVO_EXCEL = 'limpo.xlsx'
+ARQUIVO_PARQUET = 'limpo.parquet'
+
+
+def chave_cache(conteudo, versao_processamento):
+    """
+    Gera a chave do cache: SHA-256 da versão do processamento + bytes do arquivo.
+    """
+    h = hashlib.sha256()
+    h.update(f"{versao_processamento}\0".encode('utf-8'))
+    h.update(conteudo)
+    return h.hexdigest()
+
+
+def ler_cache(chave):
+    """
+    Devolve (df_final, excel_bytes, parquet_bytes) da entrada `chave`, ou
+    None se ela não existir (ou estiver corrompida). `parquet_bytes` é None
+    se a entrada foi gravada sem o Parquet de download.
+    """
+    pasta = os.path.join(CACHE_DIR, chave)
+    if not os.path.isdir(pasta):
+        return None
+
+    try:
+        df = pd.read_parquet(os.path.join(pasta, ARQUIVO_DADOS))
+        with open(os.path.join(pasta, ARQUIVO_EXCEL), 'rb') as f:
+            excel_bytes = f.read()
+        caminho_parquet = os.path.join(pasta, ARQUIVO_PARQUET)
+        parquet_bytes = None
+        if os.path.exists(caminho_parquet):
+            with open(caminho_parquet, 'rb') as f:
+                parquet_bytes = f.read()
+    except Exception as e:
+        print(f"Aviso: entrada de cache '{chave}' ilegível, descartando. Erro: {e}")
+        shutil.rmtree(pasta, ignore_errors=True)
+        return None
+
+    # Marca o uso (o LRU ordena pela data de modificação da pasta)
+    agora = time.time()
+    os.utime(pasta, (agora, agora))
+    return df, excel_bytes, parquet_bytes
+
+
+def gravar_cache(chave, df, excel_data, parquet_data=None):
+    """
+    Salva o DataFrame (Parquet), o .xlsx e, se houver, o Parquet de download
+    na entrada `chave` e aplica o limite de tamanho. Falhas são apenas
+    avisadas: o cache é opcional.
+    """
+    if isinstance(excel_data, io.BytesIO):
+        excel_data = excel_data.getvalue()
+    if isinstance(parquet_data, io.BytesIO):
+        parquet_data = parquet_data.getvalue()
+
+    # Colunas com tipos misturados (ex.: HISTORICO com algum número) não
+    # vão para o Parquet; como em `tabela_arrow`, viram texto
+    df = df.copy(deep=False)
+    for col in df.columns:
+        df[col] = _textos_se_misto(df[col])
+
+    pasta = os.path.join(CACHE_DIR, chave)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        pasta_tmp = tempfile.mkdtemp(prefix=f'.{chave[:12]}_', dir=CACHE_DIR)
+        df.to_parquet(os.path.join(pasta_tmp, ARQUIVO_DADOS), index=False)
+        with open(os.path.join(pasta_tmp, ARQUIVO_EXCEL), 'wb') as f:
+            f.write(excel_data)
+        if parquet_data is not None:
+            with open(os.path.join(pasta_tmp, ARQUIVO_PARQUET), 'wb') as f:
+                f.write(parquet_data)
+
+        # Publica a entrada de uma vez (outra sessão pode ter gravado antes)
+        if os.path.isdir(pasta):
+            shutil.rmtree(pasta_tmp, ignore_errors=True)
+        else:
+            os.rename(pasta_tmp, pasta)
+    except Exception as e:
+        print(f"Aviso: não foi possível gravar o cache '{chave}'. Erro: {e}")
+        if 'pasta_tmp' in locals():
+            shutil.rmtree(pasta_tmp, ignore_errors=True)
+        return False
+
+    _aplicar_limite(LIMITE_CACHE_BYTES)
+    return True
+
+
+def _tamanho_pasta(pasta):
+    total = 0
+    for nome in os.listdir(pasta):
+        try:
+            total += os.path.getsize(os.path.join(pasta, nome))
+        except OSError:
+            pass
+    return total
+
+
+def _aplicar_limite(limite_bytes):
+    """
+    Apaga as entradas menos usadas até o cache caber em `limite_bytes`.
+    """
+    entradas = []
+    for nome in os.listdir(CACHE_DIR):
+        pasta = os.path.join(CACHE_DIR, nome)
+        if nome.startswith('.') or not os.path.isdir(pasta):
+            continue
+        entradas.append((os.path.getmtime(pasta), _tamanho_pasta(pasta), pasta))
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, pasta in sorted(entradas):
+        if total <= limite_bytes:
+            break
+        shutil.rmtree(pasta, ignore_errors=True)
+        total -= tamanho
+        print(f"Cache: entrada '{os.path.basename(pasta)}' removida (LRU).")
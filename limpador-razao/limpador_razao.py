@@ -0,0 +1,170 @@
+"""
+Limpador de Razão em linha de comando (sem Streamlit).
+
+Limpa em lote os XMLs do Razão exportados do Protheus, gerando o mesmo
+.xlsx da interface, e grava um resumo com tempo e linhas de cada arquivo.
+
+Uso (dentro da pasta limpador-razao):
+    python -m limpador_razao clean <pasta_xml> --out <pasta_saida> --workers 4
+    python -m limpador_razao clean <pasta_xml> --out <pasta_saida> --workers 1 --workers-por-arquivo 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# --- FIX: Adiciona o diretório do script ao path ---
+try:
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    SCRIPT_DIR = os.getcwd()
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+# --- FIM DO FIX ---
+
+from processamento import (
+    VERSAO_PROCESSAMENTO, LIMITE_LINHAS_EXCEL_TABELA,
+    processar_arquivo_xml, criar_excel_estilizado, exportar_parquet
+)
+
+NOME_RESUMO = 'resumo_limpeza.json'
+
+
+def listar_xmls(pasta):
+    """
+    Lista (em ordem) os arquivos .xml da pasta, sem entrar em subpastas.
+    """
+    return sorted(
+        os.path.join(pasta, nome) for nome in os.listdir(pasta)
+        if nome.lower().endswith('.xml') and os.path.isfile(os.path.join(pasta, nome))
+    )
+
+
+def limpar_arquivo(caminho_xml, pasta_saida, parquet=False, workers_por_arquivo=1):
+    """
+    Processa um XML e grava 'LIMPADO_<nome>.xlsx' em `pasta_saida` (e
+    também 'LIMPADO_<nome>.parquet', se `parquet`). Com
+    `workers_por_arquivo > 1`, a limpeza do arquivo roda em paralelo
+    (`processar_arquivo_xml(n_workers=...)`).
+    Devolve o resumo do arquivo (nunca levanta exceção).
+    """
+    nome = os.path.basename(caminho_xml)
+    resumo = {'arquivo': nome, 'status': 'ok'}
+    inicio = time.perf_counter()
+
+    try:
+        with open(caminho_xml, 'rb') as f:
+            df_final = processar_arquivo_xml(f, n_workers=workers_por_arquivo)
+        fim_processamento = time.perf_counter()
+
+        excel_data = criar_excel_estilizado(
+            df_final,
+            constant_memory=len(df_final) > LIMITE_LINHAS_EXCEL_TABELA
+        )
+        saida = os.path.join(pasta_saida, f"LIMPADO_{os.path.splitext(nome)[0]}.xlsx")
+        with open(saida, 'wb') as f:
+            f.write(excel_data.getvalue())
+        if parquet:
+            # Falha no Parquet não invalida o .xlsx já gravado
+            try:
+                parquet_data = exportar_parquet(df_final).getvalue()
+                with open(os.path.splitext(saida)[0] + '.parquet', 'wb') as f:
+                    f.write(parquet_data)
+            except Exception as e:
+                resumo['erro_parquet'] = f"{type(e).__name__}: {e}"
+        fim = time.perf_counter()
+
+        resumo.update({
+            'saida': os.path.basename(saida),
+            'linhas': len(df_final),
+            'segundos_processamento': round(fim_processamento - inicio, 3),
+            'segundos_exportacao': round(fim - fim_processamento, 3),
+        })
+    except (ET.ParseError, ValueError) as e:
+        resumo.update({'status': 'erro', 'erro': str(e)})
+    except Exception as e:
+        resumo.update({'status': 'erro', 'erro': f"{type(e).__name__}: {e}"})
+
+    resumo['segundos_total'] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+
+def _inteiro_positivo(texto):
+    """Tipo do argparse para --workers e --workers-por-arquivo: inteiro >= 1."""
+    try:
+        valor = int(texto)
+    except ValueError:
+        valor = 0
+    if valor < 1:
+        raise argparse.ArgumentTypeError(f"deve ser um inteiro >= 1 (recebido: {texto})")
+    return valor
+
+
+def comando_clean(args):
+    arquivos = listar_xmls(args.pasta)
+    if not arquivos:
+        print(f"Nenhum arquivo .xml encontrado em '{args.pasta}'.")
+        return 1
+
+    os.makedirs(args.out, exist_ok=True)
+    print(f"Limpando {len(arquivos)} arquivo(s) com {args.workers} processo(s) "
+          f"e {args.workers_por_arquivo} por arquivo...")
+
+    inicio = time.perf_counter()
+    resumos = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futuros = [executor.submit(limpar_arquivo, arq, args.out, args.parquet,
+                                   args.workers_por_arquivo) for arq in arquivos]
+        for futuro in futuros:
+            resumo = futuro.result()
+            resumos.append(resumo)
+            if resumo['status'] == 'ok':
+                print(f"  OK   {resumo['arquivo']}: {resumo['linhas']} linhas em {resumo['segundos_total']}s")
+            else:
+                print(f"  ERRO {resumo['arquivo']}: {resumo['erro']}")
+
+    n_erros = sum(1 for r in resumos if r['status'] != 'ok')
+    relatorio = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'versao_processamento': VERSAO_PROCESSAMENTO,
+        'workers': args.workers,
+        'workers_por_arquivo': args.workers_por_arquivo,
+        'segundos_total': round(time.perf_counter() - inicio, 3),
+        'arquivos_ok': len(resumos) - n_erros,
+        'arquivos_com_erro': n_erros,
+        'arquivos': resumos,
+    }
+    caminho_resumo = os.path.join(args.out, NOME_RESUMO)
+    with open(caminho_resumo, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    print(f"Concluído em {relatorio['segundos_total']}s. Resumo salvo em '{caminho_resumo}'.")
+    return 1 if n_erros else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='limpador_razao', description="Limpador de Razão (linha de comando).")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    parser_clean = subparsers.add_parser('clean', help="Limpa todos os XMLs de uma pasta.")
+    parser_clean.add_argument('pasta', help="Pasta com os XMLs exportados do Protheus.")
+    parser_clean.add_argument('--out', required=True, help="Pasta onde gravar os .xlsx e o resumo.")
+    parser_clean.add_argument('--workers', type=_inteiro_positivo, default=os.cpu_count() or 1,
+                              help="Arquivos processados ao mesmo tempo (padrão: nº de CPUs).")
+    parser_clean.add_argument('--workers-por-arquivo', type=_inteiro_positivo, default=1,
+                              help="Processos na limpeza de cada arquivo (padrão: 1). "
+                                   "Útil para poucos arquivos grandes; combine com --workers 1.")
+    parser_clean.add_argument('--parquet', action='store_true',
+                              help="Grava também o resultado em Parquet.")
+    parser_clean.set_defaults(func=comando_clean)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
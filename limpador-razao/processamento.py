@@ -0,0 +1,700 @@
+"""
+Lógica de limpeza do Razão Contábil (XML SpreadsheetML exportado do Protheus).
+
+Este módulo não depende do Streamlit: é usado pela interface (limpador.py),
+pela linha de comando (limpador_razao.py) e pelos benchmarks.
+"""
+import pandas as pd
+import numpy as np
+import re
+import io
+import os
+import xlsxwriter 
+import xml.etree.ElementTree as ET 
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+
+# Versão da lógica de limpeza: mude sempre que o resultado do processamento
+# mudar, para invalidar o cache de resultados
+VERSAO_PROCESSAMENTO = '3'
+
+# --- CONFIGURAÇÕES DO LEITOR XML ---
+NS_SPREADSHEET = 'urn:schemas-microsoft-com:office:spreadsheet'
+NOME_PLANILHA_LANCAMENTOS = '3-Lançamentos Contábeis'
+TAMANHO_CHUNK_LINHAS = 50_000  # Linhas acumuladas por coluna antes de virar array
+
+
+def _iterar_linhas_planilha(arquivo, ws_name):
+    """
+    Percorre o XML SpreadsheetML com iterparse e devolve, linha a linha,
+    a lista de células (texto, ss:Type) da planilha `ws_name`.
+
+    Os elementos já processados são removidos da árvore, então a memória
+    usada não cresce com o tamanho do arquivo. A leitura termina assim que
+    a planilha pedida é fechada.
+
+    Antes da primeira linha é emitido um `None`, sinalizando que a planilha
+    foi encontrada (se ela não existir, o gerador termina sem emitir nada).
+    """
+    tag_worksheet = f'{{{NS_SPREADSHEET}}}Worksheet'
+    tag_table = f'{{{NS_SPREADSHEET}}}Table'
+    tag_row = f'{{{NS_SPREADSHEET}}}Row'
+    tag_cell = f'{{{NS_SPREADSHEET}}}Cell'
+    tag_data = f'{{{NS_SPREADSHEET}}}Data'
+    attr_name = f'{{{NS_SPREADSHEET}}}Name'
+    attr_type = f'{{{NS_SPREADSHEET}}}Type'
+
+    root = None
+    table = None
+    dentro_da_planilha = False
+
+    for event, elem in ET.iterparse(arquivo, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            elif elem.tag == tag_worksheet:
+                dentro_da_planilha = elem.attrib.get(attr_name) == ws_name
+                if dentro_da_planilha:
+                    yield None
+            elif elem.tag == tag_table:
+                table = elem
+            continue
+
+        if elem.tag == tag_row:
+            if dentro_da_planilha:
+                cells = []
+                for cell in elem.iterfind(tag_cell):
+                    data_elem = cell.find(tag_data)
+                    if data_elem is None:
+                        cells.append((None, 'String'))
+                    else:
+                        cells.append((data_elem.text, data_elem.attrib.get(attr_type, 'String')))
+                yield cells
+            # Libera a linha já lida (mantém a árvore sempre pequena)
+            if table is not None:
+                table.remove(elem)
+            else:
+                elem.clear()
+        elif elem.tag == tag_worksheet:
+            if dentro_da_planilha:
+                return
+            root.remove(elem)
+            table = None
+
+
+def _converter_textos(textos, data_type):
+    """
+    Converte, numa única chamada vetorizada, textos de um mesmo ss:Type.
+    """
+    if data_type == 'DateTime':
+        # SpreadsheetML grava datas como '2024-01-31T00:00:00.000'
+        return pd.to_datetime(textos, format='ISO8601').to_numpy()
+    if data_type == 'Number':
+        return pd.to_numeric(textos, errors='coerce')
+    if data_type is None:
+        # Célula ausente (linha mais curta que o cabeçalho)
+        return np.full(len(textos), np.nan)
+    return textos
+
+
+def _converter_coluna(textos, tipos):
+    """
+    Converte o texto bruto de um bloco de uma coluna conforme o ss:Type de
+    cada célula. Colunas de um tipo só (o caso comum) viram arrays nativos
+    (float64, int64, datetime64); colunas mistas viram object.
+    """
+    textos = np.array(textos, dtype=object)
+
+    if tipos.count(tipos[0]) == len(tipos):
+        return _converter_textos(textos, tipos[0])
+
+    tipos = np.array(tipos, dtype=object)
+    valores = np.empty(len(textos), dtype=object)
+    for data_type in set(tipos.tolist()):
+        mask = tipos == data_type
+        convertidos = _converter_textos(textos[mask], data_type)
+        valores[mask] = pd.Series(convertidos).astype(object).to_numpy()
+    return valores
+
+
+def _juntar_blocos(blocos):
+    """
+    Junta os blocos convertidos de uma coluna. Blocos do mesmo dtype são
+    concatenados direto; com dtypes diferentes (ex.: um bloco de datas e
+    outro só de vazios, que vira float, ou de texto) o pandas escolhe o tipo
+    comum, sem que o numpy transforme datas em inteiros.
+    """
+    if len(blocos) == 1:
+        return blocos[0]
+    if all(b.dtype == blocos[0].dtype for b in blocos[1:]):
+        return np.concatenate(blocos)
+    return pd.concat([pd.Series(b) for b in blocos], ignore_index=True).infer_objects()
+
+
+def _read_xml_with_elementtree(uploaded_file):
+    """
+    Lê o arquivo XML SpreadsheetML em streaming (ElementTree.iterparse) e
+    converte a planilha '3-Lançamentos Contábeis' em um DataFrame.
+
+    Problemas de conteúdo levantam ValueError; XML malformado levanta
+    ET.ParseError.
+
+    As linhas são gravadas direto em buffers por coluna, com o texto bruto e
+    o ss:Type de cada célula; a cada TAMANHO_CHUNK_LINHAS linhas cada coluna
+    é convertida de uma vez (`_converter_coluna`). A árvore XML nunca é
+    montada inteira.
+    """
+    # Resetar o ponteiro do arquivo, caso tenha sido lido antes
+    uploaded_file.seek(0)
+
+    ws_name = NOME_PLANILHA_LANCAMENTOS
+    headers = None
+    col_seen = []       # Colunas que apareceram em pelo menos uma linha
+    buffers = []        # Textos ainda não convertidos, por coluna
+    tipos = []          # ss:Type de cada texto em `buffers`
+    chunks = []         # Arrays já consolidados, por coluna
+    planilha_encontrada = False
+    n_linhas_xml = 0
+    n_dados = 0
+
+    def consolidar_buffers():
+        for i, buf in enumerate(buffers):
+            if buf:
+                chunks[i].append(_converter_coluna(buf, tipos[i]))
+                buffers[i] = []
+                tipos[i] = []
+
+    for cells in _iterar_linhas_planilha(uploaded_file, ws_name):
+        if cells is None:
+            planilha_encontrada = True
+            continue
+
+        n_linhas_xml += 1
+        if n_linhas_xml == 1:
+            continue  # Linha de título
+
+        if headers is None:
+            headers = []
+            for text, _ in cells:
+                headers.append(text if text is not None else f"Coluna_Vazia_{len(headers)}")
+            col_seen = [False] * len(headers)
+            buffers = [[] for _ in headers]
+            tipos = [[] for _ in headers]
+            chunks = [[] for _ in headers]
+            continue
+
+        if not cells:
+            continue
+
+        n_cells = min(len(cells), len(headers))
+        for i in range(n_cells):
+            text, data_type = cells[i]
+            buffers[i].append(text)
+            tipos[i].append(data_type)
+            col_seen[i] = True
+        for i in range(n_cells, len(headers)):
+            buffers[i].append(None)
+            tipos[i].append(None)
+
+        n_dados += 1
+        if n_dados % TAMANHO_CHUNK_LINHAS == 0:
+            consolidar_buffers()
+
+    if not planilha_encontrada:
+        raise ValueError(f"Erro Crítico: Não foi possível encontrar a planilha '{ws_name}' no XML.")
+
+    if headers is None:
+        raise ValueError("Erro Crítico: Planilha não contém linhas de cabeçalho ou dados.")
+
+    if n_dados == 0:
+        raise ValueError("Nenhum dado encontrado nas linhas da planilha.")
+
+    consolidar_buffers()
+
+    colunas = {}
+    for i, nome in enumerate(headers):
+        if not col_seen[i]:
+            continue
+        valores = _juntar_blocos(chunks[i])
+        chunks[i] = None
+        colunas[nome] = valores
+
+    df = pd.DataFrame(colunas).infer_objects()
+    return df
+
+
+def _juntar_linhas_historico(df):
+    """
+    Junta as linhas de continuação (sem 'LOTE/SUB/DOC/LINHA') ao
+    'HISTORICO' do lançamento anterior, de forma vetorizada.
+
+    Cada linha com LOTE abre um grupo (soma cumulativa); o texto das
+    continuações é concatenado por grupo e anexado ao histórico da
+    primeira linha, que mantém os demais campos. Continuações antes do
+    primeiro lançamento são descartadas.
+    """
+    lote = df['LOTE/SUB/DOC/LINHA']
+    eh_continuacao = (lote.isna() | (lote == '')).to_numpy()
+    grupo = np.cumsum(~eh_continuacao)
+
+    df_processed = df.loc[~eh_continuacao].reset_index(drop=True)
+
+    mask_cont = eh_continuacao & (grupo > 0)
+    if mask_cont.any():
+        hist_cont = pd.Series(df['HISTORICO'].to_numpy()[mask_cont], dtype=object)
+        textos = (' ' + hist_cont.where(hist_cont.notna(), '').astype(str).str.strip()).tolist()
+
+        # As continuações de um grupo são contíguas: basta fatiar entre os inícios
+        grupos, inicios = np.unique(grupo[mask_cont] - 1, return_index=True)
+        fins = np.append(inicios[1:], len(textos))
+        sufixos = [''.join(textos[a:b]) for a, b in zip(inicios, fins)]
+
+        historico = df_processed['HISTORICO'].astype(object)
+        historico.iloc[grupos] = historico.iloc[grupos].astype(str).to_numpy() + np.array(sufixos, dtype=object)
+        df_processed['HISTORICO'] = historico
+
+    return df_processed.infer_objects()
+
+
+def _para_centavos(valores):
+    """
+    Converte valores em reais (float) para centavos inteiros (int64),
+    com o mesmo arredondamento de `round(2)`.
+    """
+    return np.rint(np.asarray(valores, dtype=np.float64) * 100).astype(np.int64)
+
+
+def _calcular_cred_deb(df_processed):
+    """
+    Cria a coluna 'CRED/DEB' (débito negativo, crédito positivo) por
+    colunas inteiras, em centavos int64, e arredonda DEBITO/CREDITO.
+
+    Regra por linha: se há DEBITO, vale -DEBITO; senão, CREDITO; senão, 0.
+    """
+    debito = pd.to_numeric(df_processed['DEBITO'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    credito = pd.to_numeric(df_processed['CREDITO'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    debito_cent = _para_centavos(debito)
+    credito_cent = _para_centavos(credito)
+    cred_deb_cent = np.where(debito != 0, -debito_cent, np.where(credito != 0, credito_cent, 0))
+
+    df_processed['DEBITO'] = debito_cent / 100
+    df_processed['CREDITO'] = credito_cent / 100
+    df_processed['CRED/DEB'] = cred_deb_cent / 100
+
+    return df_processed
+
+
+# --- EXTRAÇÃO DO NÚMERO DO DOCUMENTO (COLUNA "DOC") ---
+# Os prefixos são trechos de regex (o '.' de 'NF.:' casa qualquer caractere)
+PREFIXOS_DOC = ['NF.:', 'DOC.:', 'NF:', 'DOC:', 'TIT:', 'TIT.:', 'DUPL.:']
+MIN_DIGITOS_DOC = 6
+MAX_DIGITOS_DOC = 9
+
+
+class ExtratorDoc:
+    """
+    Extrai números de documento do 'HISTORICO' (ex.: 'NF.: 001234567').
+
+    O regex é compilado uma única vez. Quando todos os prefixos têm um
+    caractere literal em comum (o ':' nos prefixos padrão), as linhas que
+    não o contêm são descartadas com uma busca de substring vetorizada,
+    antes de rodar o regex.
+    """
+
+    def __init__(self, prefixos=PREFIXOS_DOC, min_digitos=MIN_DIGITOS_DOC, max_digitos=MAX_DIGITOS_DOC):
+        self.prefixos = list(prefixos)
+        self.regex = re.compile(
+            rf"(?:{'|'.join(self.prefixos)})\s*([0-9]{{{min_digitos},{max_digitos}}})",
+            re.IGNORECASE
+        )
+        self.marcador = self._marcador_comum(self.prefixos)
+
+    @staticmethod
+    def _marcador_comum(prefixos):
+        # Caractere literal presente em todos os prefixos (sem letras, que
+        # mudam com IGNORECASE, nem metacaracteres de regex)
+        comuns = set.intersection(*(set(p) for p in prefixos)) if prefixos else set()
+        literais = sorted(c for c in comuns if not c.isalnum() and c not in '.^$*+?{}[]\\|()')
+        return literais[0] if literais else None
+
+    def _candidatos(self, historico):
+        textos = historico.astype(str)
+        if self.marcador is None:
+            mask = np.ones(len(textos), dtype=bool)
+        else:
+            mask = textos.str.contains(self.marcador, regex=False).to_numpy(dtype=bool)
+        return textos.to_numpy(dtype=object)[mask], mask
+
+    def primeiro(self, historico):
+        """
+        Devolve o primeiro documento de cada linha ('' quando não há).
+        """
+        candidatos, mask = self._candidatos(historico)
+        docs = np.full(len(historico), '', dtype=object)
+        search = self.regex.search
+        docs[mask] = [m.group(1) if (m := search(t)) else '' for t in candidatos]
+        return pd.Series(docs, index=historico.index).astype(str)
+
+    def todos(self, historico):
+        """
+        Devolve, por linha, a lista de todos os documentos encontrados
+        (útil para montar uma coluna 'DOCS').
+        """
+        candidatos, mask = self._candidatos(historico)
+        docs = [[] for _ in range(len(historico))]
+        findall = self.regex.findall
+        for i, t in zip(np.flatnonzero(mask), candidatos):
+            docs[i] = findall(t)
+        return pd.Series(docs, index=historico.index, dtype=object)
+
+
+EXTRATOR_DOC = ExtratorDoc()
+
+
+def _limpar_lancamentos(df):
+    """
+    Etapas 2 a 4 do processamento (histórico, DOC e CRED/DEB) sobre um
+    DataFrame lido do XML, ou sobre um bloco dele.
+    """
+    # --- 2. LIMPEZA: JUNÇÃO DE LINHAS DE HISTÓRICO ---
+    df_processed = _juntar_linhas_historico(df)
+
+    if df_processed.empty:
+        return df_processed
+
+    # --- 3. CRIAÇÃO DA COLUNA "DOC" ---
+    df_processed['DOC'] = EXTRATOR_DOC.primeiro(df_processed['HISTORICO'])
+
+    # --- 4. CRIAÇÃO DA COLUNA "CRED/DEB" ---
+    df_processed = _calcular_cred_deb(df_processed)
+
+    return df_processed
+
+
+def _dividir_em_blocos(df, n_blocos):
+    """
+    Divide o DataFrame em até `n_blocos` fatias de tamanho parecido, sempre
+    cortando numa linha com 'LOTE/SUB/DOC/LINHA' preenchido, para que as
+    continuações de histórico nunca fiquem separadas do seu lançamento.
+    """
+    lote = df['LOTE/SUB/DOC/LINHA']
+    inicios_validos = np.flatnonzero((lote.notna() & (lote != '')).to_numpy())
+
+    alvos = np.linspace(0, len(df), n_blocos + 1)[1:-1]
+    pos = np.searchsorted(inicios_validos, alvos)
+    cortes = np.unique(inicios_validos[pos[pos < len(inicios_validos)]])
+    cortes = cortes[cortes > 0].tolist()
+
+    limites = [0] + cortes + [len(df)]
+    return [df.iloc[a:b] for a, b in zip(limites[:-1], limites[1:])]
+
+
+def _limpar_em_paralelo(df, n_workers):
+    """
+    Roda `_limpar_lancamentos` em blocos, num pool de processos, e junta os
+    resultados na ordem original.
+    """
+    blocos = _dividir_em_blocos(df, n_workers)
+    if len(blocos) == 1:
+        return _limpar_lancamentos(df)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        resultados = list(executor.map(_limpar_lancamentos, blocos))
+
+    return pd.concat(resultados, ignore_index=True).infer_objects()
+
+
+def processar_arquivo_xml(uploaded_file, n_workers=1):
+    """
+    Função principal para ler, processar e estilizar o arquivo XML/Excel.
+
+    Com `n_workers > 1`, a limpeza (histórico, DOC e CRED/DEB) roda em
+    paralelo num pool de processos; a leitura do XML continua única.
+    Erros de conteúdo levantam ValueError (ver `_read_xml_with_elementtree`).
+    """
+    
+    df = _read_xml_with_elementtree(uploaded_file)
+
+    if n_workers > 1:
+        df_processed = _limpar_em_paralelo(df, n_workers)
+    else:
+        df_processed = _limpar_lancamentos(df)
+    
+    if df_processed.empty:
+        raise ValueError("O processamento não gerou dados. Verifique o conteúdo da planilha.")
+
+    # --- 5. REORDENAÇÃO DAS COLUNAS ---
+    cols = list(df_processed.columns)
+    
+    if 'DOC' in cols: cols.remove('DOC')
+    if 'CRED/DEB' in cols: cols.remove('CRED/DEB')
+    
+    if 'HISTORICO' in cols:
+        cols.insert(cols.index('HISTORICO') + 1, 'DOC')
+    else:
+        cols.append('DOC')
+
+    if 'CREDITO' in cols:
+        cols.insert(cols.index('CREDITO') + 1, 'CRED/DEB')
+    else:
+        cols.append('CRED/DEB')
+
+    df_final = df_processed[cols]
+
+    return df_final
+
+# --- CONFIGURAÇÕES DO EXCEL DE SAÍDA ---
+LIMITE_LINHAS_EXCEL_TABELA = 200_000  # Acima disso, usa-se o modo streaming
+TAMANHO_CHUNK_EXCEL = 20_000  # Linhas convertidas por vez no modo streaming
+
+
+def _formatos_colunas(workbook, colunas):
+    """
+    Cria os formatos do Excel de saída e devolve o formato de cada coluna.
+    """
+    font_base = {'font_name': 'Courier New', 'font_size': 10}
+    note_bg = '#FFFFE0' 
+    acc_fmt_str = '#.##0,00;-#.##0,00;0,00' 
+    
+    text_format = workbook.add_format({**font_base, 'num_format': '@'})
+    date_format = workbook.add_format({**font_base, 'num_format': 'dd/mm/yyyy'})
+    acc_format = workbook.add_format({**font_base, 'num_format': acc_fmt_str})
+    
+    note_text_format = workbook.add_format({**font_base, 'num_format': '@', 'bg_color': note_bg})
+    note_acc_format = workbook.add_format({**font_base, 'num_format': acc_fmt_str, 'bg_color': note_bg})
+    
+    formatos = []
+    for col_name in colunas:
+        if col_name == 'DATA':
+            fmt = date_format
+        elif col_name in ['DEBITO', 'CREDITO']:
+            fmt = acc_format
+        elif col_name == 'DOC':
+            fmt = note_text_format
+        elif col_name == 'CRED/DEB':
+            fmt = note_acc_format
+        else:
+            fmt = text_format 
+        formatos.append(fmt)
+
+    return formatos
+
+
+def criar_excel_estilizado(df, constant_memory=False):
+    """
+    Cria um arquivo Excel .xlsx em memória com toda a formatação solicitada.
+
+    Com `constant_memory=True`, usa o modo streaming (ver
+    `_criar_excel_streaming`), indicado para razões muito grandes.
+    """
+    if constant_memory:
+        return _criar_excel_streaming(df)
+
+    output = io.BytesIO()
+    
+    writer = pd.ExcelWriter(output, engine='xlsxwriter')
+    
+    sheet_name = 'Lançamentos_Processados'
+    
+    df_table = df.copy()
+    
+    if 'DATA' in df_table.columns:
+        df_table['DATA'] = pd.to_datetime(
+            df_table['DATA'], errors='coerce'
+        ).dt.date
+    
+    workbook = writer.book
+    
+    formatos = _formatos_colunas(workbook, df_table.columns)
+    column_settings = [
+        {'header': col_name, 'format': fmt}
+        for col_name, fmt in zip(df_table.columns, formatos)
+    ]
+
+    worksheet = workbook.add_worksheet(sheet_name)
+    (max_row, max_col) = df_table.shape
+    data_list = df_table.astype(object).where(pd.notna(df_table), None).values.tolist()
+
+    worksheet.add_table(0, 0, max_row, max_col - 1, {
+        'data': data_list,
+        'columns': column_settings,
+        'style': 'Table Style Medium 9' 
+    })
+    
+    for i, col in enumerate(df_table.columns):
+        header_len = len(str(col))
+        data_len = df_table[col].astype(str).str.len().max()
+        max_len = max(header_len, data_len) + 2
+        worksheet.set_column(i, i, max_len)
+
+    writer.close()
+    output.seek(0)
+    
+    return output
+
+
+def _criar_excel_streaming(df):
+    """
+    Gera o mesmo Excel de `criar_excel_estilizado` com o `constant_memory`
+    do XlsxWriter: as linhas são gravadas em ordem, em blocos de
+    TAMANHO_CHUNK_EXCEL, direto das colunas do DataFrame (sem cópia do DF
+    nem lista de listas).
+
+    O XlsxWriter não permite tabelas nesse modo, então o cabeçalho recebe
+    o estilo azul da tabela, autofiltro e painel congelado. A largura das
+    colunas é acompanhada bloco a bloco durante a escrita.
+    """
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Lançamentos_Processados')
+
+    colunas = list(df.columns)
+    formatos = _formatos_colunas(workbook, colunas)
+    header_format = workbook.add_format({
+        'font_name': 'Courier New', 'font_size': 10,
+        'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#4472C4',
+    })
+
+    # Formato por coluna: as células gravadas sem formato herdam o da coluna
+    larguras = [len(str(col)) for col in colunas]
+    for i, fmt in enumerate(formatos):
+        worksheet.set_column(i, i, larguras[i] + 2, fmt)
+
+    worksheet.write_row(0, 0, colunas, header_format)
+
+    n_linhas = len(df)
+    for inicio in range(0, n_linhas, TAMANHO_CHUNK_EXCEL):
+        bloco = df.iloc[inicio:inicio + TAMANHO_CHUNK_EXCEL]
+
+        valores_colunas = []
+        for i, col in enumerate(colunas):
+            serie = bloco[col]
+            if col == 'DATA':
+                serie = pd.to_datetime(serie, errors='coerce').dt.date
+            larguras[i] = max(larguras[i], serie.astype(str).str.len().max())
+            valores = serie.to_numpy(dtype=object, copy=True)
+            valores[pd.isna(valores)] = None
+            valores_colunas.append(valores.tolist())
+
+        for j, linha in enumerate(zip(*valores_colunas)):
+            worksheet.write_row(inicio + j + 1, 0, linha)
+
+    for i, fmt in enumerate(formatos):
+        worksheet.set_column(i, i, larguras[i] + 2, fmt)
+
+    worksheet.autofilter(0, 0, n_linhas, len(colunas) - 1)
+    worksheet.freeze_panes(1, 0)
+
+    workbook.close()
+    output.seek(0)
+
+    return output
+
+
+# --- EXPORTAÇÃO COLUNAR (PARQUET / ARROW) ---
+COLUNAS_VALOR = ['DEBITO', 'CREDITO', 'CRED/DEB']
+TIPO_VALOR_ARROW = pa.decimal128(18, 2)
+
+
+def _centavos_para_decimal(centavos):
+    """
+    Monta um array decimal128(18, 2) direto dos centavos int64, sem passar
+    por objetos Decimal: o valor sem escala do decimal é o próprio centavo,
+    estendido para 128 bits com o sinal.
+    """
+    buffer = np.empty((len(centavos), 2), dtype=np.int64)
+    buffer[:, 0] = centavos
+    buffer[:, 1] = np.where(centavos < 0, -1, 0)
+    return pa.Array.from_buffers(TIPO_VALOR_ARROW, len(centavos), [None, pa.py_buffer(buffer)])
+
+
+def _textos_se_misto(serie):
+    """
+    Colunas object com tipos misturados (ex.: HISTORICO com algum número,
+    vindo de células com ss:Type diferentes no XML) não viram coluna Arrow;
+    nesses casos os valores preenchidos viram texto.
+    """
+    if serie.dtype != object:
+        return serie
+    tipo = pd.api.types.infer_dtype(serie, skipna=True)
+    if not tipo.startswith('mixed') or tipo == 'mixed-integer-float':
+        return serie
+    return serie.where(serie.isna(), serie.astype(str))
+
+
+def tabela_arrow(df):
+    """
+    Converte o resultado de `processar_arquivo_xml` numa tabela Arrow com
+    tipos próprios: DATA como date32, valores como decimal(18, 2) exato e
+    DOC como string com dicionário. As demais colunas com tipos misturados
+    vão como texto.
+    """
+    # DATA, valores e DOC são trocados abaixo; o texto só evita o erro do Arrow
+    df_arrow = df.copy(deep=False)
+    for col in df_arrow.columns:
+        df_arrow[col] = _textos_se_misto(df_arrow[col])
+
+    # Sem os metadados do pandas, que descreveriam os dtypes antigos
+    tabela = pa.Table.from_pandas(df_arrow, preserve_index=False).replace_schema_metadata(None)
+
+    def trocar(nome, array):
+        i = tabela.schema.get_field_index(nome)
+        return tabela.set_column(i, nome, array)
+
+    if 'DATA' in df.columns:
+        datas = pd.to_datetime(df['DATA'], errors='coerce').to_numpy().astype('datetime64[D]')
+        tabela = trocar('DATA', pa.array(datas, type=pa.date32(), from_pandas=True))
+
+    for col in COLUNAS_VALOR:
+        if col in df.columns:
+            centavos = _para_centavos(pd.to_numeric(df[col], errors='coerce').fillna(0))
+            tabela = trocar(col, _centavos_para_decimal(centavos))
+
+    if 'DOC' in df.columns:
+        docs = pa.array(df['DOC'].astype(str).to_numpy(dtype=object), type=pa.string())
+        tabela = trocar('DOC', docs.dictionary_encode())
+
+    return tabela
+
+
+def exportar_parquet(df):
+    """
+    Gera o razão limpo em Parquet (zstd), em memória.
+    """
+    output = io.BytesIO()
+    pq.write_table(tabela_arrow(df), output, compression='zstd')
+    output.seek(0)
+    return output
+
+
+def exportar_feather(df):
+    """
+    Gera o razão limpo em Arrow IPC / Feather v2 (zstd), em memória.
+    """
+    output = io.BytesIO()
+    feather.write_feather(tabela_arrow(df), output, compression='zstd')
+    output.seek(0)
+    return output
+
+
+def ler_razao_limpo(origem, formato=None):
+    """
+    Lê de volta um razão exportado em Parquet ou Feather. `formato`
+    ('parquet' ou 'feather') é deduzido da extensão quando não informado.
+
+    As colunas ficam com tipos Arrow (pd.ArrowDtype), sem conversão para
+    objetos Python, por isso a leitura leva milissegundos.
+    """
+    if formato is None:
+        extensao = os.path.splitext(str(origem))[1].lower()
+        formato = 'feather' if extensao in ('.feather', '.arrow', '.ipc') else 'parquet'
+
+    if formato == 'feather':
+        tabela = feather.read_table(origem)
+    else:
+        tabela = pq.read_table(origem)
+
+    return tabela.to_pandas(types_mapper=pd.ArrowDtype)
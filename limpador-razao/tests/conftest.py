@@ -0,0 +1,8 @@
+# --- FIX: Adiciona o diretório do limpador ao path (os módulos não são um pacote) ---
+import os
+import sys
+
+DIR_LIMPADOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if DIR_LIMPADOR not in sys.path:
+    sys.path.insert(0, DIR_LIMPADOR)
+# --- FIM DO FIX ---
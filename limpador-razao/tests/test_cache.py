@@ -0,0 +1,35 @@
+"""
+Cache em disco (`gravar_cache` / `ler_cache`).
+"""
+import pandas as pd
+
+import cache_resultados
+import processamento
+
+
+def test_grava_coluna_mista_e_parquet_de_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_resultados, 'CACHE_DIR', str(tmp_path))
+    # HISTORICO com um número no meio dos textos, como vem de células ss:Type="Number"
+    df = pd.DataFrame({
+        'HISTORICO': pd.Series(['PAGTO NF.: 123', 456, None], dtype=object),
+        'DEBITO': [1.5, 0.0, 2.25],
+    })
+    parquet_data = processamento.exportar_parquet(df).getvalue()
+
+    assert cache_resultados.gravar_cache('chave', df, b'xlsx', parquet_data)
+
+    df_lido, excel_bytes, parquet_bytes = cache_resultados.ler_cache('chave')
+    assert df_lido['HISTORICO'].tolist()[:2] == ['PAGTO NF.: 123', '456']
+    assert pd.isna(df_lido['HISTORICO'].iloc[2])
+    assert df_lido['DEBITO'].tolist() == [1.5, 0.0, 2.25]
+    assert excel_bytes == b'xlsx'
+    assert parquet_bytes == parquet_data
+
+
+def test_entrada_sem_parquet_de_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_resultados, 'CACHE_DIR', str(tmp_path))
+    df = pd.DataFrame({'DEBITO': [1.0]})
+
+    assert cache_resultados.gravar_cache('chave', df, b'xlsx')
+
+    assert cache_resultados.ler_cache('chave')[2] is None
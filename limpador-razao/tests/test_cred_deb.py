@@ -0,0 +1,90 @@
+"""
+Regressão da coluna CRED/DEB (`_calcular_cred_deb`): valores em centavos
+int64, com o mesmo arredondamento do antigo `Series.round(2)` (o do numpy:
+multiplica por 100 e arredonda meio para o par).
+"""
+import numpy as np
+import pandas as pd
+
+import processamento
+
+
+# (DEBITO, CREDITO) -> centavos esperados de DEBITO, CREDITO e CRED/DEB
+CASOS = [
+    (100.00, np.nan, 10000, 0, -10000),                    # só débito
+    (np.nan, 250.50, 0, 25050, 25050),                     # só crédito
+    (10.00, 5.00, 1000, 500, -1000),                       # débito e crédito na mesma linha: vale o débito
+    ('', '', 0, 0, 0),                                     # células em branco
+    (None, None, 0, 0, 0),                                 # células ausentes
+    (None, 1.005, 0, 100, 100),                            # meio centavo (1.005 é 1.00499... em float)
+    (2.675, None, 268, 0, -268),                           # 2.675 * 100 dá 267.5 exatos em float
+    (0.125, np.nan, 12, 0, -12),                           # meio centavo exato: arredonda para o par
+    (np.nan, 0.375, 0, 38, 38),                            # idem, para cima
+    ('1500.10', '', 150010, 0, -150010),                   # número como texto
+    (12_345_678_901.23, np.nan, 1_234_567_890_123, 0, -1_234_567_890_123),
+    (np.nan, 98_765_432_109.87, 0, 9_876_543_210_987, 9_876_543_210_987),
+]
+
+
+def _df_casos():
+    return pd.DataFrame({
+        'DEBITO': pd.Series([c[0] for c in CASOS], dtype=object),
+        'CREDITO': pd.Series([c[1] for c in CASOS], dtype=object),
+    })
+
+
+def test_centavos_por_linha():
+    df = processamento._calcular_cred_deb(_df_casos())
+
+    assert processamento._para_centavos(df['DEBITO']).tolist() == [c[2] for c in CASOS]
+    assert processamento._para_centavos(df['CREDITO']).tolist() == [c[3] for c in CASOS]
+    assert processamento._para_centavos(df['CRED/DEB']).tolist() == [c[4] for c in CASOS]
+
+
+def test_coluna_float_devolvida():
+    df = processamento._calcular_cred_deb(_df_casos())
+
+    assert df['CRED/DEB'].dtype == np.float64
+    assert df['CRED/DEB'].tolist() == [c[4] / 100 for c in CASOS]
+    assert df['DEBITO'].tolist() == [c[2] / 100 for c in CASOS]
+    assert df['CREDITO'].tolist() == [c[3] / 100 for c in CASOS]
+
+
+def test_soma_exata_em_centavos():
+    df = processamento._calcular_cred_deb(_df_casos())
+
+    soma = processamento._para_centavos(df['CRED/DEB']).sum()
+    assert soma == sum(c[4] for c in CASOS)
+    assert soma == 9_876_543_210_987 - 1_234_567_890_123 + 25050 + 100 + 38 - 10000 - 1000 - 268 - 12 - 150010
+
+
+def test_mesmo_arredondamento_do_round_do_pandas():
+    df = processamento._calcular_cred_deb(_df_casos())
+    for col in ['DEBITO', 'CREDITO']:
+        esperado = pd.to_numeric(_df_casos()[col], errors='coerce').fillna(0).round(2)
+        assert df[col].tolist() == esperado.tolist()
+
+
+def test_razao_misto_soma_exata_em_centavos():
+    # 2 milhões de linhas, cada uma só com débito ou só com crédito
+    n = 2_000_000
+    rng = np.random.default_rng(42)
+    centavos = rng.integers(1, 10_000_000_000, n)  # 0,01 a 100 milhões
+    eh_debito = rng.random(n) < 0.5
+    df = pd.DataFrame({
+        'DEBITO': np.where(eh_debito, centavos / 100, np.nan),
+        'CREDITO': np.where(eh_debito, np.nan, centavos / 100),
+    })
+
+    df = processamento._calcular_cred_deb(df)
+
+    debito = processamento._para_centavos(df['DEBITO'])
+    credito = processamento._para_centavos(df['CREDITO'])
+    cred_deb = processamento._para_centavos(df['CRED/DEB'])
+
+    # Exatamente um lado preenchido por linha, com os centavos de entrada
+    assert ((debito != 0) != (credito != 0)).all()
+    assert (debito + credito == centavos).all()
+    # Soma de CRED/DEB = CREDITO - DEBITO, ao centavo
+    assert cred_deb.sum() == credito.sum() - debito.sum()
+    assert cred_deb.sum() == centavos[~eh_debito].sum() - centavos[eh_debito].sum()
@@ -0,0 +1,43 @@
+"""
+Exportação do razão limpo em Parquet (`tabela_arrow`/`exportar_parquet`).
+"""
+import decimal
+
+import numpy as np
+import pandas as pd
+
+import processamento
+
+
+def _razao_limpo(historico, datas=None):
+    n = len(historico)
+    return pd.DataFrame({
+        'DATA': datas if datas is not None else pd.to_datetime(['2024-01-31'] * n),
+        'LOTE/SUB/DOC/LINHA': pd.Series([f'{i:06d}' for i in range(n)], dtype=object),
+        'HISTORICO': pd.Series(historico, dtype=object),
+        'DOC': ['123456'] * n,
+        'DEBITO': np.full(n, 10.0),
+        'CREDITO': np.zeros(n),
+        'CRED/DEB': np.full(n, -10.0),
+    })
+
+
+def test_coluna_de_texto_com_numero_vira_texto():
+    # Célula com ss:Type="Number" no meio do histórico
+    df = _razao_limpo(['PAGAMENTO NF 123456', 1234.5, None])
+
+    relido = processamento.ler_razao_limpo(processamento.exportar_parquet(df), 'parquet')
+
+    assert relido['HISTORICO'].tolist()[:2] == ['PAGAMENTO NF 123456', '1234.5']
+    assert pd.isna(relido['HISTORICO'].iloc[2])
+    assert relido['DEBITO'].tolist() == [decimal.Decimal('10.00')] * 3
+
+
+def test_data_mista_nao_impede_a_exportacao():
+    datas = pd.Series([pd.Timestamp('2024-01-31'), '31/01/2024', None], dtype=object)
+    df = _razao_limpo(['A', 'B', 'C'], datas=datas)
+
+    tabela = processamento.tabela_arrow(df)
+
+    assert tabela.column('DATA').to_pylist()[0].isoformat() == '2024-01-31'
+    assert tabela.column('HISTORICO').to_pylist() == ['A', 'B', 'C']
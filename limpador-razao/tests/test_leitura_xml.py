@@ -0,0 +1,77 @@
+"""
+Leitura do XML (`_read_xml_with_elementtree`): as colunas são convertidas
+em blocos de TAMANHO_CHUNK_LINHAS linhas, e blocos de uma mesma coluna
+podem sair com tipos diferentes.
+"""
+import io
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+import processamento
+
+
+def _xml_razao(linhas):
+    """SpreadsheetML com a planilha de lançamentos; cada linha é uma lista de (texto, ss:Type)."""
+    def celula(texto, tipo):
+        return f'<Cell><Data ss:Type="{tipo}">{escape(texto)}</Data></Cell>'
+
+    partes = [
+        '<?xml version="1.0"?>\n'
+        '<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+        'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n'
+        f'<Worksheet ss:Name="{processamento.NOME_PLANILHA_LANCAMENTOS}"><Table>\n'
+        '<Row><Cell><Data ss:Type="String">Razão Contábil</Data></Cell></Row>\n'
+        '<Row>' + ''.join(celula(c, 'String') for c in ['LOTE/SUB/DOC/LINHA', 'HISTORICO', 'DATA']) + '</Row>\n'
+    ]
+    for celulas in linhas:
+        partes.append('<Row>' + ''.join(celula(t, tipo) for t, tipo in celulas) + '</Row>\n')
+    partes.append('</Table></Worksheet>\n</Workbook>\n')
+    return io.BytesIO(''.join(partes).encode('utf-8'))
+
+
+def _linhas_com_data(n):
+    return [[(f'{i:06d}', 'String'), ('COMPRA', 'String'), ('2024-01-31T00:00:00.000', 'DateTime')]
+            for i in range(n)]
+
+
+N_PRIMEIRO_BLOCO = processamento.TAMANHO_CHUNK_LINHAS
+
+
+def test_bloco_de_datas_seguido_de_bloco_sem_data():
+    # Linhas do 2º bloco sem a célula DATA: o bloco vira float (NaN)
+    linhas = _linhas_com_data(N_PRIMEIRO_BLOCO)
+    linhas += [[(f'{i:06d}', 'String'), ('COMPRA', 'String')] for i in range(10)]
+
+    df = processamento._read_xml_with_elementtree(_xml_razao(linhas))
+
+    assert len(df) == N_PRIMEIRO_BLOCO + 10
+    assert pd.api.types.is_datetime64_any_dtype(df['DATA'])
+    assert (df['DATA'].iloc[:N_PRIMEIRO_BLOCO] == pd.Timestamp('2024-01-31')).all()
+    assert df['DATA'].iloc[N_PRIMEIRO_BLOCO:].isna().all()
+
+
+def test_bloco_de_datas_seguido_de_bloco_de_texto():
+    # Datas digitadas como texto no 2º bloco: a coluna fica mista, sem perder as datas
+    linhas = _linhas_com_data(N_PRIMEIRO_BLOCO)
+    linhas += [[(f'{i:06d}', 'String'), ('COMPRA', 'String'), ('31/01/2024', 'String')] for i in range(10)]
+
+    df = processamento._read_xml_with_elementtree(_xml_razao(linhas))
+
+    assert len(df) == N_PRIMEIRO_BLOCO + 10
+    datas = df['DATA'].iloc[:N_PRIMEIRO_BLOCO]
+    assert all(isinstance(v, pd.Timestamp) for v in datas)
+    assert (datas == pd.Timestamp('2024-01-31')).all()
+    assert df['DATA'].iloc[N_PRIMEIRO_BLOCO:].tolist() == ['31/01/2024'] * 10
+
+
+def test_blocos_do_mesmo_tipo_continuam_nativos():
+    linhas = _linhas_com_data(N_PRIMEIRO_BLOCO + 10)
+
+    df = processamento._read_xml_with_elementtree(_xml_razao(linhas))
+
+    assert pd.api.types.is_datetime64_any_dtype(df['DATA'])
+    assert df['LOTE/SUB/DOC/LINHA'].iloc[-1] == f'{N_PRIMEIRO_BLOCO + 9:06d}'
+    assert not df['DATA'].isna().any()
+    assert np.issubdtype(df['DATA'].to_numpy().dtype, np.datetime64)
@@ -0,0 +1,39 @@
+"""
+Limpeza em paralelo (`_limpar_em_paralelo`): os blocos só podem ser
+cortados em linhas de lançamento, e o resultado tem de ser o mesmo da
+limpeza serial.
+"""
+import pandas as pd
+
+import processamento
+
+
+def _df_razao():
+    # Lançamentos com 0, 1 ou 2 linhas de continuação do histórico
+    linhas = []
+    for i in range(30):
+        linhas.append({'LOTE/SUB/DOC/LINHA': f'{i:06d}/001/{i:06d}/001',
+                       'HISTORICO': f'PAGTO NF.: {i:09d}',
+                       'DEBITO': float(i), 'CREDITO': 0.0})
+        for _ in range(i % 3):
+            linhas.append({'LOTE/SUB/DOC/LINHA': None, 'HISTORICO': 'CONTINUACAO',
+                           'DEBITO': 0.0, 'CREDITO': 0.0})
+    return pd.DataFrame(linhas)
+
+
+def test_blocos_comecam_em_lancamento():
+    df = _df_razao()
+    blocos = processamento._dividir_em_blocos(df, 4)
+
+    assert len(blocos) > 1
+    assert sum(len(b) for b in blocos) == len(df)
+    assert all(b['LOTE/SUB/DOC/LINHA'].iloc[0] is not None for b in blocos)
+
+
+def test_paralelo_igual_ao_serial():
+    df = _df_razao()
+
+    serial = processamento._limpar_lancamentos(df.copy())
+    paralelo = processamento._limpar_em_paralelo(df.copy(), 3)
+
+    pd.testing.assert_frame_equal(serial, paralelo)